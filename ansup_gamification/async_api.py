@@ -0,0 +1,48 @@
+"""
+ابزار مشترک ویوهای async (برای اجرا زیر ASGI بدون اشغال یک نخ به ازای هر درخواست)
+
+احراز هویت JWT همان JWTAuthentication پروژه است. پاسخ‌ها JSON ساده هستند و ساختار آن‌ها
+با نسخه DRF همان اندپوینت یکی است.
+نکته: در Django 5.2 کوئری‌های ORM async هنوز با sync_to_async (thread_sensitive) اجرا می‌شوند؛
+asyncio.gather آن‌ها را پشت سر هم روی نخ همان درخواست اجرا می‌کند ولی حلقه رویداد آزاد می‌ماند.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+_authenticator = JWTAuthentication()
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, safe=False, json_dumps_params={'ensure_ascii': False})
+
+
+async def authenticate(request):
+    """
+    کاربر درخواست از روی هدر Authorization؛ در صورت نبود یا نامعتبر بودن توکن None
+    """
+    try:
+        result = await sync_to_async(_authenticator.authenticate)(request)
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+    return result[0] if result else None
+
+
+def async_api_view(view):
+    """
+    دکوراتور ویوهای async فقط-خواندنی: فقط GET و فقط کاربر وارد شده
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+        user = await authenticate(request)
+        if user is None:
+            return json_response({'detail': 'Authentication credentials were not provided.'}, status=401)
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,57 @@
+"""
+ETag و GET شرطی (If-None-Match) برای لیست‌ها و پروفایل
+
+ETag قبل از اجرای کوئری اصلی و سریالایز کردن، از روی یک نشانگر ارزان نسخه داده ساخته می‌شود:
+برای لیست‌ها تعداد ردیف‌ها و بیشترین updated_at (یک کوئری تجمیعی) و برای پروفایل
+updated_at همان کاربری که احراز هویت شده است. اگر ETag با هدر If-None-Match
+یکی باشد پاسخ 304 بدون بدنه برگردانده می‌شود.
+"""
+import functools
+import hashlib
+
+from django.db.models import Count, Max
+from rest_framework.response import Response
+
+
+def make_etag(*parts):
+    return '"' + hashlib.md5('|'.join(str(p) for p in parts).encode()).hexdigest() + '"'
+
+
+def queryset_version(queryset):
+    # حذف ردیف تعداد را و افزودن/ویرایش بیشترین updated_at را تغییر می‌دهد
+    stats = queryset.order_by().aggregate(count=Count('pk'), last=Max('updated_at'))
+    return stats['count'], stats['last']
+
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # مقایسه ضعیف طبق RFC 9110 برای If-None-Match
+    candidates = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return etag in candidates
+
+
+def conditional(etag_func):
+    """
+    دکوراتور اکشن‌های GET ویوست‌ها
+    etag_func(view, request) رشته ETag را برمی‌گرداند
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            etag = etag_func(self, request)
+            if etag_matches(request, etag):
+                response = Response(status=304)
+            else:
+                response = method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response['ETag'] = etag
+            # پاسخ وابسته به کاربر است؛ کش‌های مشترک نباید آن را برای دیگران برگردانند
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,44 @@
+"""
+ابزار تست برای بررسی طرح اجرای کوئری‌های پرتکرار (EXPLAIN)
+
+اگر طرح اجرای یک کوئری به پیمایش کامل جدول (بدون ایندکس) برسد تست شکست می‌خورد.
+"""
+import re
+
+from django.db import connection
+
+# SQLite: «SCAN table» بدون USING INDEX ؛ PostgreSQL: «Seq Scan on table»
+FULL_SCAN_PATTERNS = [
+    re.compile(r'\bSCAN (?:TABLE )?(?P<table>\w+)\b(?! USING)'),
+    re.compile(r'Seq Scan on (?P<table>\w+)'),
+]
+
+
+def query_plan(queryset):
+    return queryset.explain()
+
+
+def full_scans(plan):
+    tables = []
+    for line in plan.splitlines():
+        for pattern in FULL_SCAN_PATTERNS:
+            match = pattern.search(line)
+            # در SQLite «SCAN CONSTANT ROW» و جدول‌های موقت پیمایش جدول نیستند
+            if match and not match.group('table').isupper():
+                tables.append(match.group('table'))
+    return tables
+
+
+class QueryPlanAssertionsMixin:
+    def assertNoFullScan(self, queryset, tables=None):
+        plan = query_plan(queryset)
+        scanned = [t for t in full_scans(plan) if tables is None or t in tables]
+        if scanned:
+            self.fail(f"پیمایش کامل جدول {', '.join(scanned)} ({connection.vendor}):\n{plan}")
+        return plan
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = self.assertNoFullScan(queryset)
+        if index_name not in plan:
+            self.fail(f"ایندکس {index_name} استفاده نشد:\n{plan}")
+        return plan
@@ -0,0 +1,45 @@
+"""
+ذخیره فایل‌ها بر اساس هش محتوا (SHA-256)
+
+مسیر هر فایل از هش محتوای آن ساخته می‌شود ({prefix}/{دو حرف اول}/{هش}{پسوند})،
+پس آپلودهای تکراری فقط یک بار روی دیسک ذخیره می‌شوند و نام فایل هرگز با محتوای دیگری عوض نمی‌شود.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+
+CHUNK_SIZE = 64 * 1024
+
+
+def hash_file(f):
+    digest = hashlib.sha256()
+    if hasattr(f, 'seek'):
+        f.seek(0)
+    for chunk in (f.chunks(CHUNK_SIZE) if hasattr(f, 'chunks') else iter(lambda: f.read(CHUNK_SIZE), b'')):
+        digest.update(chunk)
+    if hasattr(f, 'seek'):
+        f.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(prefix, digest, ext=''):
+    return f"{prefix}/{digest[:2]}/{digest}{ext.lower()}"
+
+
+def extension_of(name, default=''):
+    return os.path.splitext(name or '')[1].lower() or default
+
+
+def store_hashed(f, prefix, digest=None, ext=None):
+    """
+    ذخیره فایل (در صورت نبودن) و برگرداندن (نام ذخیره‌شده، هش)
+    """
+    digest = digest or hash_file(f)
+    name = hashed_name(prefix, digest, ext if ext is not None else extension_of(getattr(f, 'name', '')))
+    if not default_storage.exists(name):
+        if hasattr(f, 'seek'):
+            f.seek(0)
+        # در ذخیره همزمان یک محتوا ممکن است storage نام دیگری برگرداند؛ محتوا در هر حال یکی است
+        name = default_storage.save(name, f)
+    return name, digest
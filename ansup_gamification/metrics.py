@@ -0,0 +1,244 @@
+"""
+اندازه‌گیری هزینه هر اندپوینت (تعداد و زمان کوئری‌های SQL، زمان کل و حجم پاسخ)
+
+نتایج در هیستوگرام‌هایی با بازه‌های ثابت در حافظه همان پروسه نگه داشته می‌شوند،
+پس حافظه مصرفی به تعداد درخواست‌ها بستگی ندارد. خروجی از مسیر /api/metrics
+به صورت JSON یا متن Prometheus (با ?format=prometheus) فقط برای مدیر در دسترس است.
+"""
+import bisect
+import json
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connection
+from rest_framework import permissions, renderers
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import response_cache
+
+DURATION_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# مسیرهای بیشتر از این تعداد در یک ردیف مشترک جمع می‌شوند
+MAX_ROUTES = 200
+OTHER_ROUTE = '__other__'
+UNMATCHED_ROUTE = '__unmatched__'
+
+
+def escape_label(value):
+    """
+    مقدار برچسب در قالب متنی Prometheus: \\ و " و خط جدید باید escape شوند
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # آخرین خانه: بیشتر از بزرگ‌ترین مرز
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        # مرز بالای بازه‌ای که صدک در آن قرار دارد (تخمینی)؛ None یعنی بیشتر از بزرگ‌ترین مرز
+        if not self.count:
+            return 0
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else None
+        return None
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.total, 3),
+            'avg': round(self.total / self.count, 3) if self.count else 0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([str(b) for b in self.bounds] + ['+Inf'], self.counts)),
+        }
+
+
+class RouteStats:
+    __slots__ = ('statuses', 'duration_ms', 'sql_ms', 'sql_queries', 'response_bytes')
+
+    def __init__(self):
+        self.statuses = {}
+        self.duration_ms = Histogram(DURATION_BUCKETS_MS)
+        self.sql_ms = Histogram(DURATION_BUCKETS_MS)
+        self.sql_queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.response_bytes = Histogram(SIZE_BUCKETS_BYTES)
+
+
+HISTOGRAMS = [
+    ('duration_ms', 'http_request_duration_ms', 'Total request time in milliseconds'),
+    ('sql_ms', 'http_request_sql_duration_ms', 'Time spent in SQL per request in milliseconds'),
+    ('sql_queries', 'http_request_sql_queries', 'Number of SQL queries per request'),
+    ('response_bytes', 'http_response_size_bytes', 'Response body size in bytes'),
+]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self.started_at = time.time()
+
+    def record(self, method, route, status, duration_ms, sql_queries, sql_ms, size):
+        key = (method, route)
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                if len(self._routes) >= MAX_ROUTES:
+                    key = (method, OTHER_ROUTE)
+                stats = self._routes.setdefault(key, RouteStats())
+            status_class = f"{status // 100}xx"
+            stats.statuses[status_class] = stats.statuses.get(status_class, 0) + 1
+            stats.duration_ms.observe(duration_ms)
+            stats.sql_ms.observe(sql_ms)
+            stats.sql_queries.observe(sql_queries)
+            stats.response_bytes.observe(size)
+
+    def reset(self):
+        with self._lock:
+            self._routes = {}
+            self.started_at = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            routes = [
+                {
+                    'method': method,
+                    'route': route,
+                    'statuses': dict(stats.statuses),
+                    **{attr: getattr(stats, attr).as_dict() for attr, _, _ in HISTOGRAMS},
+                }
+                for (method, route), stats in sorted(self._routes.items())
+            ]
+        return {'since': self.started_at, 'routes': routes}
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            items = sorted(self._routes.items())
+            lines.append('# HELP http_requests_total Requests by route and status class')
+            lines.append('# TYPE http_requests_total counter')
+            items = [(f'method="{escape_label(method)}",route="{escape_label(route)}"', stats)
+                     for (method, route), stats in items]
+            for labels, stats in items:
+                for status_class, count in sorted(stats.statuses.items()):
+                    lines.append(f'http_requests_total{{{labels},status="{status_class}"}} {count}')
+
+            for attr, name, help_text in HISTOGRAMS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, stats in items:
+                    histogram = getattr(stats, attr)
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.bounds) + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{labels}}} {round(histogram.total, 3)}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        self.record(request, response, counter, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        # زیر ASGI کوئری‌ها روی نخ sync همان درخواست اجرا می‌شوند؛ شمارنده باید روی اتصال همان نخ نصب شود
+        counter = QueryCounter()
+        started = time.perf_counter()
+        await sync_to_async(_add_execute_wrapper)(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remove_execute_wrapper)(counter)
+        self.record(request, response, counter, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, counter, duration):
+        match = getattr(request, 'resolver_match', None)
+        route = (match.view_name or match.route) if match else UNMATCHED_ROUTE
+        size = 0 if response.streaming else len(response.content)
+        registry.record(request.method, route, response.status_code, duration * 1000,
+                        counter.count, counter.seconds * 1000, size)
+
+
+def _add_execute_wrapper(wrapper):
+    connection.execute_wrappers.append(wrapper)
+
+
+def _remove_execute_wrapper(wrapper):
+    connection.execute_wrappers.remove(wrapper)
+
+
+class PrometheusRenderer(renderers.BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class MetricsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [renderers.JSONRenderer, PrometheusRenderer]
+
+    def get(self, request):
+        if request.user.role != 'ADMIN':
+            return Response({'error': 'Admin only'}, status=403)
+        if request.accepted_renderer.format == 'prometheus':
+            return Response(registry.prometheus() + response_cache.stats.prometheus())
+        return Response(dict(registry.snapshot(), response_cache=response_cache.stats.snapshot()))
@@ -0,0 +1,83 @@
+"""
+صفحه‌بندی با کرسر (keyset) روی (زمان ایجاد، شناسه)
+
+به جای OFFSET، هر صفحه از جایی که صفحه قبل تمام شده با یک شرط روی کلید ادامه پیدا می‌کند،
+پس هزینه هر صفحه مستقل از عمق تاریخچه است و با یک ایندکس مرکب پاسخ داده می‌شود.
+"""
+import base64
+import datetime
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    # ویو می‌تواند با cursor_field فیلد زمان را تغییر دهد (مثلا submitted_at)
+    cursor_field = 'created_at'
+    invalid_cursor_message = 'کرسر نامعتبر است'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, value, pk):
+        payload = json.dumps([value.isoformat(), pk])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            return datetime.datetime.fromisoformat(value), int(pk)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        field = getattr(view, 'cursor_field', self.cursor_field)
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+
+        queryset = queryset.order_by(f'-{field}', '-id')
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk}))
+
+        rows = list(queryset[:self.page_size_value + 1])
+        self.next_cursor = None
+        if len(rows) > self.page_size_value:
+            rows = rows[:self.page_size_value]
+            self.next_cursor = self.encode_cursor(getattr(rows[-1], field), rows[-1].pk)
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
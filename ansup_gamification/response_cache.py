@@ -0,0 +1,123 @@
+"""
+کش پاسخ اندپوینت‌های تقریبا ثابت (کاتالوگ فروشگاه، پلن‌های استیکینگ، نشان‌ها و ...)
+
+کلیدها نسخه‌دار هستند: هر فضای نام (namespace) یک شمارنده نسخه در کش دارد و کلید هر پاسخ
+شامل نسخه فعلی است. با تغییر داده، نسخه افزایش پیدا می‌کند و همه کلیدهای قبلی بدون حذف تک‌تک
+بی‌اعتبار می‌شوند (و بعدا با پایان timeout از کش خارج می‌شوند).
+backend همان CACHES['default'] جنگو است: حافظه محلی به صورت پیش‌فرض و Redis با تنظیم REDIS_URL.
+"""
+import functools
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+KEY_PREFIX = 'respcache'
+DEFAULT_TIMEOUT = 300
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}  # namespace -> [hits, misses]
+
+    def record(self, namespace, hit):
+        with self._lock:
+            counts = self._counts.setdefault(namespace, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts = {}
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                namespace: {
+                    'hits': hits, 'misses': misses,
+                    'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+                }
+                for namespace, (hits, misses) in sorted(self._counts.items())
+            }
+
+    def prometheus(self):
+        from .metrics import escape_label
+        lines = ['# HELP response_cache_requests_total Response cache lookups by namespace and result',
+                 '# TYPE response_cache_requests_total counter']
+        for namespace, stats in self.snapshot().items():
+            for key, result in (('hits', 'hit'), ('misses', 'miss')):
+                lines.append(f'response_cache_requests_total{{namespace="{escape_label(namespace)}",result="{result}"}} '
+                             f'{stats[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+stats = CacheStats()
+
+
+def _version_key(namespace, user_id=None):
+    scope = f"{namespace}:{user_id}" if user_id is not None else namespace
+    return f"{KEY_PREFIX}:{scope}:version"
+
+
+def _bump(version_key):
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        cache.set(version_key, 1, None)
+
+
+def invalidate(namespace, user_id=None):
+    """
+    بی‌اعتبار کردن همه پاسخ‌های یک فضای نام (یا فقط پاسخ‌های یک کاربر)
+    """
+    version_key = _version_key(namespace, user_id)
+    _bump(version_key)
+    # پاسخی که تا پایان تراکنش با داده قدیمی ساخته شود هم باید دور ریخته شود
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(functools.partial(_bump, version_key))
+
+
+def get_or_compute(namespace, variant, compute, user_id=None, timeout=None):
+    version = cache.get_or_set(_version_key(namespace, user_id), 0, None)
+    digest = hashlib.md5(str(variant).encode()).hexdigest()
+    key = f"{KEY_PREFIX}:{namespace}:{user_id or '-'}:{version}:{digest}"
+
+    value = cache.get(key)
+    stats.record(namespace, hit=value is not None)
+    if value is None:
+        value = compute()
+        # None یعنی «قابل کش نیست» (مثلا پاسخ خطا)
+        if value is not None:
+            cache.set(key, value, timeout or getattr(settings, 'RESPONSE_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+    return value
+
+
+def cached_response(namespace, per_user=False):
+    """
+    دکوراتور اکشن‌های GET ویوست‌ها؛ فقط پاسخ‌های 200 ذخیره می‌شوند.
+    کلید بر اساس آدرس کامل درخواست (میزبان + مسیر + پارامترها) ساخته می‌شود.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            computed = []
+
+            def compute():
+                response = method(self, request, *args, **kwargs)
+                computed.append(response)
+                return response.data if response.status_code == 200 else None
+
+            variant = request.build_absolute_uri()
+            data = get_or_compute(namespace, variant, compute, user_id=request.user.pk if per_user else None)
+            if computed:
+                response = computed[0]
+                response['X-Cache'] = 'MISS'
+                return response
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        return wrapper
+    return decorator
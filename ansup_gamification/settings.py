@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ansup_gamification.metrics.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -166,4 +167,36 @@ SIMPLE_JWT = {
 
     # این خط را دقیقاً به این شکل تغییر دهید:
     'AUTH_HEADER_TYPES': ('Bearer',),
-}
\ No newline at end of file
+}
+
+# قوانین حضور و غیاب (محاسبه تاخیر و امتیاز روزانه)
+ATTENDANCE_RULES = {
+    'WORK_START': '08:00',
+    'GRACE_MINUTES': 0,
+    'ON_TIME_POINTS': 10,
+    'LATE_PENALTY_PER_MINUTE': 1,
+    'MAX_DAILY_PENALTY': 60,
+}
+
+# کش (ایندکس رتبه‌بندی و کش پاسخ‌ها)؛ با تنظیم REDIS_URL بین همه پروسه‌ها مشترک می‌شود
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+RESPONSE_CACHE_TIMEOUT = 300
+
+# سقف حجم فایل مستندات گزارش ماموریت (فقط تصویر؛ به صورت جریانی روی دیسک نوشته می‌شود)
+SUBMISSION_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+
+# ارسال اعلان‌های تلگرام (پردازشگر send_notifications)
+TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
+TELEGRAM_API_BASE = os.environ.get('TELEGRAM_API_BASE', 'https://api.telegram.org')
+
+# بایگانی ماهانه تراکنش‌ها (دستور archive_transactions): هر ماه یک فایل SQLite جدا
+TRANSACTION_ARCHIVE_DIR = os.environ.get('TRANSACTION_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+# تعداد ماه‌های اخیر (به جز ماه جاری) که در جدول اصلی می‌مانند
+TRANSACTION_HOT_MONTHS = 3
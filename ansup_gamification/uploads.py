@@ -0,0 +1,109 @@
+"""
+دریافت جریانی فایل‌های آپلودی با محدودیت حجم و نوع
+
+HashingUploadHandler تکه‌های فایل را مستقیم در یک فایل موقت روی دیسک می‌نویسد و همزمان
+هش SHA-256 آن را حساب می‌کند؛ کل فایل هیچ‌وقت در حافظه نگه داشته نمی‌شود.
+نوع فایل از روی چند بایت اول (نه Content-Type ادعایی کلاینت) تشخیص داده می‌شود و
+به محض عبور از سقف حجم یا نوع نامجاز، بقیه فایل بدون ذخیره رد می‌شود.
+"""
+import hashlib
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers
+
+# امضای ابتدای فایل -> (نوع MIME، پسوند)
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png', '.png'),
+    (b'GIF87a', 'image/gif', '.gif'),
+    (b'GIF89a', 'image/gif', '.gif'),
+]
+# حداکثر حجم بقیه فیلدهای فرم در کنار فایل (برای رد زودهنگام با Content-Length)
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+def sniff_image(head):
+    for signature, mime, ext in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mime, ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp', '.webp'
+    return None
+
+
+class HashedUploadedFile(TemporaryUploadedFile):
+    sha256 = None
+    extension = ''
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    فقط فیلدهای field_names را پردازش می‌کند و بقیه را به handlerهای بعدی می‌سپارد.
+    خطای رد فایل در self.error نگه داشته می‌شود.
+    """
+
+    def __init__(self, field_names, max_bytes, sniff=sniff_image, request=None):
+        super().__init__(request)
+        self.field_names = set(field_names)
+        self.max_bytes = max_bytes
+        self.sniff = sniff
+        self.error = None
+        self.active = False
+
+    def new_file(self, field_name, *args, **kwargs):
+        self.active = field_name in self.field_names
+        if not self.active:
+            return
+        super().new_file(field_name, *args, **kwargs)
+        self.file = HashedUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.digest = hashlib.sha256()
+        self.received = 0
+        self.head = b''
+        raise StopFutureHandlers()
+
+    def reject(self, message):
+        self.error = message
+        self.active = False
+        raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self.reject(f"حجم فایل بیشتر از {self.max_bytes / (1024 * 1024):g} مگابایت است.")
+
+        if self.head is not None:
+            # تکه اول ممکن است کوتاه‌تر از امضا باشد
+            self.head += raw_data[:16]
+            if len(self.head) >= 12 or self.received >= 12:
+                detected = self.sniff(self.head)
+                if detected is None:
+                    self.reject('نوع فایل مجاز نیست.')
+                self.file.content_type, self.file.extension = detected
+                self.head = None
+
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.active = False
+        if self.head is not None:
+            # فایل کوتاه‌تر از ۱۲ بایت
+            detected = self.sniff(self.head)
+            if detected is None:
+                # فایل برگردانده می‌شود تا handlerهای بعدی آن را نسازند؛ ویو با دیدن error آن را نادیده می‌گیرد
+                self.error = 'نوع فایل مجاز نیست.'
+            else:
+                self.file.content_type, self.file.extension = detected
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.digest.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
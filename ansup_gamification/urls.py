@@ -7,6 +7,10 @@ from rest_framework.routers import DefaultRouter
 # --- ویوهای مربوط به احراز هویت (JWT) ---
 from rest_framework_simplejwt.views import TokenRefreshView
 from users.views import CustomTokenObtainPairView
+from ansup_gamification.metrics import MetricsView
+from users import async_views as users_async
+from gamification import async_views as gamification_async
+from operations import async_views as operations_async
 
 # --- وارد کردن ویوهای اپلیکیشن‌ها ---
 from users.views import UserViewSet, MessageViewSet
@@ -64,6 +68,16 @@ urlpatterns = [
     # مسیرهای API که توسط روتر ساخته شدند
     path('api/', include(router.urls)),
 
+    # نسخه async اندپوینت‌های پرتکرار (برای اجرا زیر ASGI)
+    path('api/async/users/me/', users_async.me, name='async-me'),
+    path('api/async/users/dashboard_stats/', users_async.dashboard_stats, name='async-dashboard-stats'),
+    path('api/async/users/leaderboard/', users_async.leaderboard, name='async-leaderboard'),
+    path('api/async/wallet/summary/', gamification_async.wallet_summary, name='async-wallet-summary'),
+    path('api/async/missions/', operations_async.mission_list, name='async-missions'),
+
+    # آمار کارایی اندپوینت‌ها (فقط مدیر)
+    path('api/metrics', MetricsView.as_view(), name='metrics'),
+
     # مسیرهای لاگین و رفرش توکن
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
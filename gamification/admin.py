@@ -1,8 +1,12 @@
 from django.contrib import admin
-from .models import Transaction, Product, StakingPlan, Badge, UserBadge
+from .models import (Transaction, Product, StakingPlan, StakingPosition, Badge, ArchivedPeriod, UserBadge,
+                     UserTokenTotal)
 
 admin.site.register(Transaction)
 admin.site.register(Product)
 admin.site.register(StakingPlan)
+admin.site.register(StakingPosition)
+admin.site.register(ArchivedPeriod)
 admin.site.register(Badge)
 admin.site.register(UserBadge)
+admin.site.register(UserTokenTotal)
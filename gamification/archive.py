@@ -0,0 +1,295 @@
+"""
+بایگانی ماهانه دفتر تراکنش‌ها
+
+تراکنش‌های ماه‌های قدیمی (قدیمی‌تر از TRANSACTION_HOT_MONTHS ماه اخیر) به یک فایل SQLite جدا
+برای هر ماه منتقل و از جدول اصلی حذف می‌شوند، پس خواندن‌های پرتکرار (لیست تراکنش‌ها، لاگ همدلی،
+جدول ادمین) همیشه روی یک جدول کوچک انجام می‌شوند. فهرست ماه‌های بایگانی‌شده در ArchivedPeriod است.
+
+پرسش‌های تاریخچه فقط وقتی به فایل‌های بایگانی سر می‌زنند که بازه زمانی به قبل از اولین ماه
+جدول اصلی برسد و فقط فایل ماه‌هایی باز می‌شوند که با بازه هم‌پوشانی دارند.
+بایگانی یک ماه فقط بعد از ساخته شدن نقاط موجودی همان ماه (BalanceCheckpoint) مجاز است تا
+پرسش‌های موجودی تاریخی همچنان با یک نقطه و یک دنباله کوتاه پاسخ داده شوند.
+"""
+import datetime
+import os
+import sqlite3
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ansup_gamification import response_cache
+from .balances import build_checkpoints, month_start, next_month
+from .models import ArchivedPeriod, BalanceCheckpoint, Transaction
+
+SCHEMA = """
+CREATE TABLE transactions (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    amount INTEGER NOT NULL,
+    token_type TEXT NOT NULL,
+    description TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX tx_user_created ON transactions (user_id, created_at, id);
+CREATE INDEX tx_created ON transactions (created_at, id);
+"""
+COLUMNS = 'id, user_id, amount, token_type, description, created_at'
+# زمان‌ها به UTC و با قالبی ذخیره می‌شوند که مقایسه رشته‌ای همان ترتیب زمانی را بدهد
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def to_text(moment):
+    return moment.astimezone(datetime.timezone.utc).strftime(TIME_FORMAT)
+
+
+def from_text(value):
+    return datetime.datetime.strptime(value, TIME_FORMAT).replace(tzinfo=datetime.timezone.utc)
+
+
+def archive_dir():
+    return settings.TRANSACTION_ARCHIVE_DIR
+
+
+def period_bounds(period_start):
+    start = timezone.make_aware(datetime.datetime.combine(period_start, datetime.time.min))
+    return start, next_month(start)
+
+
+def archived_periods():
+    """
+    [(ابتدای ماه، نام فایل)] به ترتیب زمان؛ در فضای نام archive کش می‌شود
+    """
+    return response_cache.get_or_compute(
+        'archive', 'periods',
+        lambda: list(ArchivedPeriod.objects.order_by('period_start').values_list('period_start', 'file_name'))
+    )
+
+
+def hot_start():
+    """
+    ابتدای قدیمی‌ترین ماهی که در جدول اصلی است (None یعنی چیزی بایگانی نشده)
+    """
+    periods = archived_periods()
+    return period_bounds(periods[-1][0])[1] if periods else None
+
+
+def partitions(start=None, end=None, newest_first=False):
+    """
+    نام فایل ماه‌های بایگانی‌شده‌ای که با بازه [start, end) هم‌پوشانی دارند
+    """
+    selected = []
+    for period_start, file_name in archived_periods():
+        first, last = period_bounds(period_start)
+        if (start is None or last > start) and (end is None or first < end):
+            selected.append(file_name)
+    return selected[::-1] if newest_first else selected
+
+
+def connect(file_name):
+    path = os.path.join(archive_dir(), file_name)
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def query(sql, params=(), start=None, end=None):
+    """
+    اجرای sql روی جدول transactions همه فایل‌های هم‌پوشان با بازه و برگرداندن ردیف‌ها
+    """
+    for file_name in partitions(start, end):
+        conn = connect(file_name)
+        try:
+            yield from conn.execute(sql, params)
+        finally:
+            conn.close()
+
+
+def range_filter(start, end):
+    clauses, params = [], []
+    if start is not None:
+        clauses.append('created_at >= ?')
+        params.append(to_text(start))
+    if end is not None:
+        clauses.append('created_at < ?')
+        params.append(to_text(end))
+    return clauses, params
+
+
+def sum_amounts(user_id, start, end):
+    """
+    جمع مبلغ تراکنش‌های بایگانی‌شده کاربر در بازه [start, end)
+    """
+    boundary = hot_start()
+    if boundary is None or (start is not None and start >= boundary):
+        return 0
+    clauses, params = range_filter(start, end)
+    sql = ' AND '.join(['user_id = ?', *clauses])
+    return sum(total or 0 for total, in query(f"SELECT SUM(amount) FROM transactions WHERE {sql}",
+                                               [user_id, *params], start, end))
+
+
+def user_rows(user_id, start, end, columns='created_at, amount'):
+    clauses, params = range_filter(start, end)
+    sql = ' AND '.join(['user_id = ?', *clauses])
+    return query(f"SELECT {columns} FROM transactions WHERE {sql}", [user_id, *params], start, end)
+
+
+def history(user_id=None, start=None, end=None, before=None, limit=20):
+    """
+    تراکنش‌ها از جدیدترین به قدیمی‌ترین در بازه [start, end) (before: کرسر (created_at, id))
+    ابتدا جدول اصلی و فقط اگر صفحه پر نشد ماه‌های بایگانی به ترتیب از جدید به قدیم خوانده می‌شوند
+    خروجی: لیست Transaction (ردیف‌های بایگانی ذخیره‌نشده هستند)
+    """
+    qs = Transaction.objects.order_by('-created_at', '-id')
+    if user_id is not None:
+        qs = qs.filter(user_id=user_id)
+    if start is not None:
+        qs = qs.filter(created_at__gte=start)
+    if end is not None:
+        qs = qs.filter(created_at__lt=end)
+    if before is not None:
+        qs = qs.filter(Q(created_at__lt=before[0]) | Q(created_at=before[0], id__lt=before[1]))
+    rows = list(qs[:limit])
+
+    boundary = hot_start()
+    if len(rows) >= limit or boundary is None or (start is not None and start >= boundary):
+        return rows
+
+    clauses, params = range_filter(start, end)
+    if user_id is not None:
+        clauses.append('user_id = ?')
+        params.append(user_id)
+    if before is not None:
+        clauses.append('(created_at < ? OR (created_at = ? AND id < ?))')
+        params += [to_text(before[0]), to_text(before[0]), before[1]]
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    for file_name in partitions(start, end, newest_first=True):
+        conn = connect(file_name)
+        try:
+            found = conn.execute(f"SELECT {COLUMNS} FROM transactions {where} ORDER BY created_at DESC, id DESC "
+                                 f"LIMIT ?", [*params, limit - len(rows)]).fetchall()
+        finally:
+            conn.close()
+        rows += [Transaction(id=pk, user_id=uid, amount=amount, token_type=token_type, description=description,
+                             created_at=from_text(created_at))
+                 for pk, uid, amount, token_type, description, created_at in found]
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def write_partition(path, rows):
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    written = total = 0
+    try:
+        conn.executescript(SCHEMA)
+        batch = []
+        for pk, user_id, amount, token_type, description, created_at in rows:
+            batch.append((pk, user_id, amount, token_type, description, to_text(created_at)))
+            written += 1
+            total += amount
+            if len(batch) >= 5000:
+                conn.executemany(f"INSERT INTO transactions ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", batch)
+                batch = []
+        conn.executemany(f"INSERT INTO transactions ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", batch)
+        conn.commit()
+    finally:
+        conn.close()
+    # فایل کامل با یک rename جایگزین می‌شود؛ فایل نیمه‌کاره هیچ‌وقت دیده نمی‌شود
+    os.replace(tmp_path, path)
+    return written, total
+
+
+def purge_users(user_ids):
+    """
+    حذف ردیف‌های بایگانی‌شده کاربران حذف‌شده (همان کاری که CASCADE با جدول اصلی می‌کند)
+    خروجی: تعداد ردیف‌های حذف‌شده
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    marks = ', '.join('?' * len(user_ids))
+    removed = 0
+    for period_start, file_name in archived_periods():
+        path = os.path.join(archive_dir(), file_name)
+        if not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(path)
+        try:
+            rows, total = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM transactions "
+                                       f"WHERE user_id IN ({marks})", user_ids).fetchone()
+            if not rows:
+                continue
+            conn.execute(f"DELETE FROM transactions WHERE user_id IN ({marks})", user_ids)
+            conn.commit()
+        finally:
+            conn.close()
+        ArchivedPeriod.objects.filter(period_start=period_start).update(rows=F('rows') - rows,
+                                                                       amount_total=F('amount_total') - total)
+        removed += rows
+    return removed
+
+
+def archive_month(period_start):
+    """
+    انتقال تراکنش‌های یک ماه به فایل بایگانی؛ خروجی ArchivedPeriod یا None اگر تراکنشی نبود
+    """
+    start, end = period_bounds(period_start)
+    if ArchivedPeriod.objects.filter(period_start=period_start).exists():
+        raise ArchiveError(f"ماه {period_start:%Y-%m} قبلا بایگانی شده است.")
+    if ArchivedPeriod.objects.filter(period_start__gt=period_start).exists():
+        raise ArchiveError('ماه‌ها باید به ترتیب از قدیمی به جدید بایگانی شوند.')
+
+    month = Transaction.objects.filter(created_at__gte=start, created_at__lt=end)
+    active_users = month.values('user_id').distinct().count()
+    if not active_users:
+        return None
+    # موجودی پایان ماه هر کاربر فعال باید قبل از حذف ردیف‌ها ثبت شده باشد
+    if BalanceCheckpoint.objects.filter(as_of=end).count() < active_users:
+        raise ArchiveError(f"نقاط موجودی ماه {period_start:%Y-%m} ساخته نشده است (build_balance_checkpoints).")
+
+    os.makedirs(archive_dir(), exist_ok=True)
+    file_name = f"transactions-{period_start:%Y-%m}.sqlite3"
+    rows = month.order_by('id').values_list('id', 'user_id', 'amount', 'token_type', 'description', 'created_at')
+    written, total = write_partition(os.path.join(archive_dir(), file_name), rows.iterator(chunk_size=5000))
+
+    with transaction.atomic():
+        deleted, _ = month.archive_delete()
+        if deleted != written:
+            # ردیف‌ها بین نوشتن فایل و حذف تغییر کرده‌اند؛ فایل در اجرای بعدی بازنویسی می‌شود
+            raise ArchiveError(f"تعداد ردیف‌های ماه {period_start:%Y-%m} در حین بایگانی تغییر کرد.")
+        period = ArchivedPeriod.objects.create(period_start=period_start, file_name=file_name, rows=written,
+                                               amount_total=total)
+        response_cache.invalidate('archive')
+        return period
+
+
+def archive_old_months(hot_months=None, now=None):
+    """
+    بایگانی همه ماه‌های قدیمی‌تر از hot_months ماه اخیر؛ لیست ArchivedPeriodهای جدید
+    """
+    hot_months = settings.TRANSACTION_HOT_MONTHS if hot_months is None else hot_months
+    cutoff = month_start(now or timezone.now())
+    for _ in range(hot_months):
+        cutoff = month_start(cutoff - datetime.timedelta(days=1))
+
+    build_checkpoints(until=cutoff)
+    first = Transaction.objects.filter(created_at__lt=cutoff).order_by('created_at').values_list(
+        'created_at', flat=True).first()
+    archived = []
+    if first is None:
+        return archived
+    period = month_start(first)
+    while period < cutoff:
+        result = archive_month(period.date())
+        if result:
+            archived.append(result)
+        period = next_month(period)
+    return archived
@@ -0,0 +1,15 @@
+"""
+نسخه async خلاصه کیف پول برای اجرا زیر ASGI (خروجی مشابه WalletViewSet.summary)
+"""
+from ansup_gamification.async_api import async_api_view, json_response
+from .models import UserTokenTotal
+
+
+@async_api_view
+async def wallet_summary(request):
+    user = request.user
+    stats = await UserTokenTotal.objects.asummary_for(user)
+    return json_response({
+        'balance': user.current_balance,
+        'stats': stats
+    })
@@ -0,0 +1,128 @@
+"""
+موتور اعطای خودکار نشان‌ها
+
+شرط هر نشان (Badge.criteria) در یک قالب کوچک نوشته می‌شود و به یک قانون ترجمه می‌شود:
+
+    sum CULTURAL >= 1000     جمع توکن‌های یک نوع (از جمع‌های تجمیعی UserTokenTotal)
+    missions >= 10           تعداد گزارش‌کارهای تایید‌شده
+    streak >= 10             بیشترین تعداد ورود به‌موقع پشت سر هم
+
+شرط‌هایی که در این قالب نباشند نشان دستی حساب می‌شوند و خودکار داده نمی‌شوند.
+با ثبت هر تراکنش، حضور یا تایید گزارش فقط قوانین همان نوع و فقط برای کاربران درگیر،
+بعد از commit تراکنش دیتابیس، بررسی می‌شوند.
+"""
+import functools
+import re
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Count
+
+from users.notifications import notify_users
+from ansup_gamification import response_cache
+from .models import Badge, UserBadge, UserTokenTotal, Transaction
+
+Rule = namedtuple('Rule', ['badge_id', 'badge_name', 'kind', 'arg', 'threshold'])
+
+KINDS = ('sum', 'missions', 'streak')
+TOKEN_TYPES = {code for code, _ in Transaction.TOKEN_TYPES}
+RULE_PATTERN = re.compile(r'^(sum)\s+([A-Za-z]+)\s*(?:>=|≥)\s*(\d+)$|^(missions|streak)\s*(?:>=|≥)\s*(\d+)$',
+                          re.IGNORECASE)
+
+
+def compile_rule(badge):
+    """
+    ترجمه شرط نشان به Rule؛ برای شرط‌های آزاد None
+    """
+    match = RULE_PATTERN.match((badge.criteria or '').strip())
+    if not match:
+        return None
+    if match.group(1):
+        token_type = match.group(2).upper()
+        if token_type not in TOKEN_TYPES:
+            return None
+        return Rule(badge.pk, badge.name, 'sum', token_type, int(match.group(3)))
+    return Rule(badge.pk, badge.name, match.group(4).lower(), None, int(match.group(5)))
+
+
+def load_rules():
+    # در فضای نام badges کش می‌شوند؛ سیگنال تغییر Badge همین فضای نام را بی‌اعتبار می‌کند
+    return response_cache.get_or_compute(
+        'badges', 'rules',
+        lambda: [rule for rule in map(compile_rule, Badge.objects.only('id', 'name', 'criteria')) if rule]
+    )
+
+
+def touch(user_ids, kind):
+    """
+    زمان‌بندی بررسی قوانین نوع kind برای کاربران، بعد از commit تراکنش جاری
+    """
+    user_ids = set(user_ids)
+    if user_ids:
+        transaction.on_commit(functools.partial(evaluate, user_ids, [kind]))
+
+
+def evaluate(user_ids, kinds=KINDS):
+    """
+    اعطای نشان‌هایی که شرطشان برقرار شده؛ تعداد نشان‌های جدید را برمی‌گرداند
+    """
+    rules = [rule for rule in load_rules() if rule.kind in kinds]
+    user_ids = set(user_ids)
+    if not rules or not user_ids:
+        return 0
+
+    owned = set(UserBadge.objects.filter(user_id__in=user_ids, badge_id__in={r.badge_id for r in rules})
+                .values_list('user_id', 'badge_id'))
+    pending = [(user_id, rule) for user_id in user_ids for rule in rules if (user_id, rule.badge_id) not in owned]
+    if not pending:
+        return 0
+
+    candidates = {user_id for user_id, _ in pending}
+    metrics = {}
+    pending_kinds = {rule.kind for _, rule in pending}
+    if 'sum' in pending_kinds:
+        types = {rule.arg for _, rule in pending if rule.kind == 'sum'}
+        rows = UserTokenTotal.objects.filter(user_id__in=candidates, token_type__in=types)
+        for user_id, token_type, total in rows.values_list('user_id', 'token_type', 'total'):
+            metrics[(user_id, 'sum', token_type)] = total
+    if 'missions' in pending_kinds:
+        metrics.update(((user_id, 'missions', None), count) for user_id, count in approved_missions(candidates))
+    if 'streak' in pending_kinds:
+        metrics.update(((user_id, 'streak', None), run) for user_id, run in on_time_streaks(candidates))
+
+    earned = [(user_id, rule) for user_id, rule in pending
+              if metrics.get((user_id, rule.kind, rule.arg), 0) >= rule.threshold]
+    if not earned:
+        return 0
+
+    with transaction.atomic():
+        # قید یکتای (کاربر، نشان) از اعطای تکراری در بررسی‌های همزمان جلوگیری می‌کند
+        UserBadge.objects.bulk_create([UserBadge(user_id=user_id, badge_id=rule.badge_id) for user_id, rule in earned],
+                                      ignore_conflicts=True)
+        notify_users((user_id, f"تبریک! نشان «{rule.badge_name}» را دریافت کردید.") for user_id, rule in earned)
+    return len(earned)
+
+
+def approved_missions(user_ids):
+    from operations.models import MissionSubmission
+    return (MissionSubmission.objects.filter(user_id__in=user_ids, status='APPROVED')
+            .values_list('user_id').annotate(count=Count('id')).order_by())
+
+
+def on_time_streaks(user_ids):
+    """
+    (user_id, بیشترین تعداد ردیف‌های به‌موقع پشت سر هم) به ترتیب تاریخ
+    """
+    from operations.models import Attendance
+    rows = (Attendance.objects.filter(user_id__in=user_ids).order_by('user_id', 'date')
+            .values_list('user_id', 'status'))
+    current_user, run, best = None, 0, 0
+    for user_id, status in rows.iterator(chunk_size=2000):
+        if user_id != current_user:
+            if current_user is not None:
+                yield current_user, best
+            current_user, run, best = user_id, 0, 0
+        run = run + 1 if status == 'On-time' else 0
+        best = max(best, run)
+    if current_user is not None:
+        yield current_user, best
@@ -0,0 +1,198 @@
+"""
+موجودی تاریخی کاربران
+
+موجودی در یک لحظه برابر است با نزدیک‌ترین BalanceCheckpoint قبل از آن به علاوه تراکنش‌های
+بعد از همان نقطه؛ پس به جای جمع زدن کل دفتر تراکنش‌ها فقط تراکنش‌های حداکثر یک ماه خوانده می‌شوند.
+نقاط ماهانه توسط دستور build_balance_checkpoints ساخته می‌شوند. تراکنش‌های ماه‌های بایگانی‌شده
+(gamification/archive.py) از فایل‌های بایگانی همان ماه‌ها خوانده می‌شوند.
+"""
+import datetime
+
+from django.db import models, transaction
+from django.db.models import Max, Min, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from users.models import User
+from .models import BalanceCheckpoint, Transaction
+
+# بیشترین تعداد نقطه سری زمانی؛ بازه‌های طولانی‌تر هفتگی، ماهانه یا سالانه می‌شوند
+MAX_POINTS = 120
+# روزهایی که ابتدای خودشان و روز بعدشان (با تبدیل به UTC) قابل نمایش است
+FIRST_DAY = datetime.date.min + datetime.timedelta(days=1)
+LAST_DAY = datetime.date.max - datetime.timedelta(days=1)
+
+
+def month_start(moment):
+    moment = timezone.localtime(moment)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(moment):
+    return (moment + datetime.timedelta(days=32)).replace(day=1)
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def parse_day(value):
+    """
+    تاریخ ISO پارامترهای درخواست؛ روزهای خارج از [FIRST_DAY, LAST_DAY] هم ValueError می‌دهند
+    """
+    day = datetime.date.fromisoformat(value)
+    if not FIRST_DAY <= day <= LAST_DAY:
+        raise ValueError(f"تاریخ {value} خارج از بازه مجاز است")
+    return day
+
+
+def build_checkpoints(until=None, rebuild=False):
+    """
+    ساخت نقاط ماهانه بعد از آخرین نقطه موجود تا ابتدای ماه جاری (فقط ماه‌های بسته‌شده)
+    خروجی: تعداد نقاط ساخته‌شده
+    """
+    from . import archive
+    until = month_start(until or timezone.now())
+    with transaction.atomic():
+        if rebuild:
+            BalanceCheckpoint.objects.all().delete()
+
+        last = BalanceCheckpoint.objects.aggregate(last=Max('as_of'))['last']
+        if last is None:
+            # بعد از بایگانی، ابتدای دفتر در قدیمی‌ترین فایل بایگانی است
+            firsts = [Transaction.objects.aggregate(first=Min('created_at'))['first'],
+                      *[archive.period_bounds(period_start)[0] for period_start, _ in archive.archived_periods()[:1]]]
+            first = min(filter(None, firsts), default=None)
+            if first is None:
+                return 0
+            boundary = next_month(month_start(first))
+        else:
+            boundary = next_month(month_start(last))
+
+        # آخرین موجودی ثبت‌شده هر کاربر (نقاط به ترتیب زمان، پس آخرین مقدار می‌ماند)
+        running = dict(BalanceCheckpoint.objects.order_by('user_id', 'as_of')
+                       .values_list('user_id', 'balance').iterator(chunk_size=5000))
+        previous = last or boundary - datetime.timedelta(days=365 * 100)
+        # فایل‌های بایگانی ممکن است هنوز ردیف کاربران حذف‌شده را داشته باشند
+        user_ids = set(User.objects.values_list('id', flat=True)) if archive.archived_periods() else set()
+        created = 0
+        while boundary <= until:
+            totals = dict(Transaction.objects.filter(created_at__gte=previous, created_at__lt=boundary)
+                          .values('user_id').annotate(total=Sum('amount')).order_by().values_list('user_id', 'total'))
+            clauses, params = archive.range_filter(previous, boundary)
+            for user_id, total in archive.query(
+                    f"SELECT user_id, SUM(amount) FROM transactions WHERE {' AND '.join(clauses)} GROUP BY user_id",
+                    params, previous, boundary):
+                if user_id in user_ids:
+                    totals[user_id] = totals.get(user_id, 0) + total
+            checkpoints = []
+            for user_id, total in totals.items():
+                running[user_id] = running.get(user_id, 0) + total
+                checkpoints.append(BalanceCheckpoint(user_id=user_id, as_of=boundary, balance=running[user_id]))
+            BalanceCheckpoint.objects.bulk_create(checkpoints, batch_size=1000)
+            created += len(checkpoints)
+            previous, boundary = boundary, next_month(boundary)
+    return created
+
+
+def balance_before(user_id, moment):
+    """
+    موجودی کاربر درست قبل از moment (جمع تراکنش‌های با created_at < moment)
+    """
+    from . import archive
+    checkpoint = (BalanceCheckpoint.objects.filter(user_id=user_id, as_of__lte=moment)
+                  .order_by('-as_of').values_list('as_of', 'balance').first())
+    tail = Transaction.objects.filter(user_id=user_id, created_at__lt=moment)
+    if checkpoint:
+        tail = tail.filter(created_at__gte=checkpoint[0])
+    # دنباله‌ای که به ماه‌های بایگانی‌شده برسد از فایل همان ماه‌ها خوانده می‌شود
+    archived = archive.sum_amounts(user_id, checkpoint[0] if checkpoint else None, moment)
+    return (checkpoint[1] if checkpoint else 0) + (tail.aggregate(total=Sum('amount'))['total'] or 0) + archived
+
+
+def balance_on(user_id, day):
+    """
+    موجودی در پایان روز day
+    """
+    return balance_before(user_id, start_of_day(day + datetime.timedelta(days=1)))
+
+
+def bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'year':
+        return day.replace(month=1, day=1)
+    return day
+
+
+def next_bucket(day, granularity):
+    if granularity == 'week':
+        return day + datetime.timedelta(days=7)
+    if granularity == 'month':
+        return (day + datetime.timedelta(days=32)).replace(day=1)
+    if granularity == 'year':
+        return day.replace(year=day.year + 1)
+    return day + datetime.timedelta(days=1)
+
+
+def pick_granularity(start, end, max_points=MAX_POINTS):
+    days = (end - start).days + 1
+    if days <= max_points:
+        return 'day'
+    if days <= max_points * 7:
+        return 'week'
+    if (end.year - start.year) * 12 + end.month - start.month + 1 <= max_points:
+        return 'month'
+    return 'year'
+
+
+def ledger_range(user_id, start, end):
+    """
+    محدود کردن [start, end] به دوره‌ای که دفتر برای کاربر ردیف دارد (تا امروز)؛ قبل از اولین تراکنش
+    موجودی صفر است و بعد از امروز تغییری نمی‌کند، پس نقطه‌های حذف‌شده اطلاعاتی ندارند
+    """
+    from . import archive
+    periods = archive.archived_periods()
+    first = (archive.period_bounds(periods[0][0])[0] if periods else
+             Transaction.objects.filter(user_id=user_id).aggregate(first=Min('created_at'))['first'])
+    if first is not None:
+        start = min(max(start, timezone.localtime(first).date()), end)
+    return start, max(min(end, timezone.localdate()), start)
+
+
+def balance_series(user_id, start, end, max_points=MAX_POINTS):
+    """
+    موجودی پایان هر روز/هفته/ماه/سال در بازه [start, end]؛ بازه‌ای که ماهانه هم بیش از max_points
+    نقطه شود به دوره فعالیت کاربر محدود می‌شود و نقطه‌ها هرگز از max_points بیشتر نیستند
+    خروجی: (granularity، لیست {'date': آخرین روز دوره، 'balance': ...})
+    """
+    from . import archive
+    if pick_granularity(start, end, max_points) == 'year':
+        start, end = ledger_range(user_id, start, end)
+    granularity = pick_granularity(start, end, max_points)
+    if granularity == 'year':
+        # حتی در بازه سالانه تعداد نقاط از max_points بیشتر نمی‌شود
+        start = max(start, datetime.date(max(end.year - max_points + 1, 1), 1, 1))
+    first, last = start_of_day(start), start_of_day(end + datetime.timedelta(days=1))
+    balance = balance_before(user_id, first)
+    changes = dict(
+        Transaction.objects.filter(user_id=user_id, created_at__gte=first, created_at__lt=last)
+        .annotate(bucket=Trunc('created_at', granularity, output_field=models.DateField()))
+        .values('bucket').annotate(total=Sum('amount')).order_by().values_list('bucket', 'total')
+    )
+    boundary = archive.hot_start()
+    if boundary is not None and first < boundary:
+        for created_at, amount in archive.user_rows(user_id, first, last):
+            bucket = bucket_start(timezone.localtime(archive.from_text(created_at)).date(), granularity)
+            changes[bucket] = changes.get(bucket, 0) + amount
+
+    points = []
+    bucket = bucket_start(start, granularity)
+    while bucket <= end:
+        following = next_bucket(bucket, granularity)
+        balance += changes.get(bucket, 0)
+        points.append({'date': min(following - datetime.timedelta(days=1), end), 'balance': balance})
+        bucket = following
+    return granularity, points
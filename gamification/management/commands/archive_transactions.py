@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gamification.archive import archive_old_months, ArchiveError
+
+
+class Command(BaseCommand):
+    help = ('انتقال تراکنش‌های ماه‌های قدیمی به فایل‌های بایگانی ماهانه (SQLite) '
+            'بعد از ساخت نقاط موجودی همان ماه‌ها')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hot-months', type=int, default=settings.TRANSACTION_HOT_MONTHS,
+                            help='تعداد ماه‌های اخیر (به جز ماه جاری) که در جدول اصلی می‌مانند')
+
+    def handle(self, *args, **options):
+        try:
+            archived = archive_old_months(hot_months=options['hot_months'])
+        except ArchiveError as e:
+            raise CommandError(str(e))
+
+        for period in archived:
+            self.stdout.write(f"{period.period_start:%Y-%m}: {period.rows} تراکنش -> {period.file_name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(archived)} ماه بایگانی شد."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from gamification.badges import evaluate, load_rules
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'بررسی قوانین نشان‌ها برای همه کاربران (به صورت دسته‌ای) و اعطای نشان‌های جامانده'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rules = load_rules()
+        if not rules:
+            self.stdout.write('هیچ نشانی با شرط قابل ارزیابی تعریف نشده است.')
+            return
+
+        awarded = 0
+        chunk = []
+        for user_id in User.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=options['chunk_size']):
+            chunk.append(user_id)
+            if len(chunk) == options['chunk_size']:
+                awarded += evaluate(chunk)
+                chunk = []
+        if chunk:
+            awarded += evaluate(chunk)
+        self.stdout.write(f"{len(rules)} قانون بررسی شد، {awarded} نشان جدید اعطا شد.")
@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+from django.db.models import Sum
+
+from users.models import User
+from gamification.models import Product, Transaction
+from gamification.purchases import purchase_product, OutOfStock, InsufficientBalance
+
+PREFIX = 'bench_purchase_'
+
+
+class Command(BaseCommand):
+    help = ('بنچمارک خرید همزمان از فروشگاه با چند نخ: گزارش خرید بر ثانیه و بررسی اینکه '
+            'هیچ موجودی منفی نشود و هیچ کالایی بیش از موجودی فروخته نشود. '
+            'کاربران و کالاهای آزمایشی روی دیتابیس تنظیم‌شده ساخته و در پایان حذف می‌شوند.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=2000, help='تعداد کل تلاش‌های خرید')
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--products', type=int, default=5)
+        parser.add_argument('--stock', type=int, default=100, help='موجودی اولیه هر کالا')
+        parser.add_argument('--price', type=int, default=30)
+        parser.add_argument('--balance', type=int, default=1000, help='موجودی اولیه هر کاربر')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='داده‌های آزمایشی حذف نشوند')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError(f"کاربران {PREFIX}* از اجرای قبلی باقی مانده‌اند.")
+
+        users = [User(username=f"{PREFIX}{i}", current_balance=options['balance'])
+                 for i in range(options['users'])]
+        User.objects.bulk_create(users)
+        users = list(User.objects.filter(username__startswith=PREFIX))
+        products = [Product.objects.create(title=f"{PREFIX}{i}", price=options['price'], stock=options['stock'])
+                    for i in range(options['products'])]
+
+        try:
+            outcomes, elapsed = self.run(users, products, options)
+            self.report(users, products, outcomes, elapsed, options)
+        finally:
+            if not options['keep']:
+                Product.objects.filter(pk__in=[p.pk for p in products]).delete()
+                User.objects.filter(pk__in=[u.pk for u in users]).delete()
+
+    def run(self, users, products, options):
+        rng = random.Random(options['seed'])
+        plan = [(rng.choice(users), rng.choice(products)) for _ in range(options['attempts'])]
+        chunks = [plan[i::options['threads']] for i in range(options['threads'])]
+        outcomes = Counter()
+        lock = threading.Lock()
+
+        def worker(chunk):
+            local = Counter()
+            try:
+                for user, product in chunk:
+                    try:
+                        purchase_product(user, product)
+                        local['ok'] += 1
+                    except OutOfStock:
+                        local['out_of_stock'] += 1
+                    except InsufficientBalance:
+                        local['insufficient_balance'] += 1
+                    except OperationalError:
+                        # مثلا database is locked در SQLite
+                        local['db_error'] += 1
+            finally:
+                connection.close()
+            with lock:
+                outcomes.update(local)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            list(pool.map(worker, chunks))
+        return outcomes, time.perf_counter() - started
+
+    def report(self, users, products, outcomes, elapsed, options):
+        self.stdout.write(
+            f"{options['attempts']} تلاش با {options['threads']} نخ در {elapsed:.2f} ثانیه: "
+            f"{outcomes['ok'] / elapsed:.1f} خرید موفق بر ثانیه"
+        )
+        for key in ['ok', 'out_of_stock', 'insufficient_balance', 'db_error']:
+            self.stdout.write(f"  {key}: {outcomes[key]}")
+
+        problems = []
+        spent = dict(
+            Transaction.objects.filter(user__in=users, token_type='SPEND')
+            .values_list('user_id').annotate(total=Sum('amount')).order_by()
+        )
+        for user in User.objects.filter(pk__in=[u.pk for u in users]):
+            if user.current_balance < 0:
+                problems.append(f"موجودی منفی برای {user.username}: {user.current_balance}")
+            if options['balance'] + spent.get(user.pk, 0) != user.current_balance:
+                problems.append(f"موجودی {user.username} با دفتر تراکنش‌ها نمی‌خواند")
+
+        sold_total = 0
+        for product in Product.objects.filter(pk__in=[p.pk for p in products]):
+            sold = options['stock'] - product.stock
+            sold_total += sold
+            if product.stock < 0:
+                problems.append(f"فروش بیش از موجودی برای {product.title}: {product.stock}")
+        if sold_total != outcomes['ok']:
+            problems.append(f"تعداد کالای کسرشده ({sold_total}) با خریدهای موفق ({outcomes['ok']}) برابر نیست")
+
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError('ناسازگاری در نتایج بنچمارک پیدا شد.')
+        self.stdout.write(self.style.SUCCESS('هیچ موجودی منفی یا فروش بیش از موجودی دیده نشد.'))
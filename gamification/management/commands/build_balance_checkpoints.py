@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from gamification.balances import build_checkpoints
+
+
+class Command(BaseCommand):
+    help = 'ساخت نقاط ماهانه موجودی کاربران (برای پاسخ سریع به موجودی در یک تاریخ گذشته)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='حذف همه نقاط و ساخت دوباره از ابتدای دفتر')
+
+    def handle(self, *args, **options):
+        created = build_checkpoints(rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f"{created} نقطه موجودی ساخته شد."))
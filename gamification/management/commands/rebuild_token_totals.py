@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from gamification import archive
+from gamification.models import Transaction, UserTokenTotal
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'بازسازی جمع‌های تجمیعی (کاربر، نوع توکن) از روی دفتر تراکنش‌ها و بررسی صحت آن‌ها'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='فقط مقایسه جمع‌ها با دفتر تراکنش‌ها، بدون بازنویسی')
+
+    def ledger_totals(self):
+        rows = Transaction.objects.values_list('user_id', 'token_type').annotate(total=Sum('amount')).order_by()
+        totals = {(user_id, token_type): total for user_id, token_type, total in rows}
+        # تراکنش‌های ماه‌های بایگانی‌شده (به جز کاربرانی که بعد از بایگانی حذف شده‌اند)
+        user_ids = set(User.objects.values_list('id', flat=True))
+        for user_id, token_type, total in archive.query(
+                'SELECT user_id, token_type, SUM(amount) FROM transactions GROUP BY user_id, token_type'):
+            if user_id in user_ids:
+                totals[(user_id, token_type)] = totals.get((user_id, token_type), 0) + total
+        return totals
+
+    def stored_totals(self):
+        rows = UserTokenTotal.objects.values_list('user_id', 'token_type', 'total')
+        return {(user_id, token_type): total for user_id, token_type, total in rows}
+
+    def diff(self, expected, stored):
+        mismatches = []
+        for key in expected.keys() | stored.keys():
+            if expected.get(key, 0) != stored.get(key, 0):
+                mismatches.append((key, expected.get(key, 0), stored.get(key, 0)))
+        return sorted(mismatches)
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                expected = self.ledger_totals()
+                UserTokenTotal.objects.all().delete()
+                UserTokenTotal.objects.bulk_create(
+                    [UserTokenTotal(user_id=user_id, token_type=token_type, total=total)
+                     for (user_id, token_type), total in expected.items()],
+                    batch_size=500
+                )
+            self.stdout.write(f"{len(expected)} ردیف تجمیعی بازسازی شد.")
+
+        mismatches = self.diff(self.ledger_totals(), self.stored_totals())
+        for (user_id, token_type), expected, stored in mismatches:
+            self.stdout.write(f"کاربر {user_id} / {token_type}: دفتر={expected} ذخیره‌شده={stored}")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} مغایرت پیدا شد.")
+        self.stdout.write(self.style.SUCCESS('جمع‌های تجمیعی با دفتر تراکنش‌ها مطابقت دارند.'))
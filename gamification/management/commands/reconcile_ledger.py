@@ -0,0 +1,45 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gamification.reconciliation import find_drift, apply_fixes
+
+
+class Command(BaseCommand):
+    help = ('مقایسه موجودی و امتیاز کل کاربران با دفتر تراکنش‌ها (بازه‌های شناسه به صورت موازی) '
+            'و نوشتن گزارش مغایرت‌ها')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='تعداد شناسه کاربر در هر بازه')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--report', help='مسیر فایل CSV گزارش (پیش‌فرض: خروجی استاندارد)')
+        parser.add_argument('--fix', action='store_true', help='اصلاح ستون‌های ذخیره‌شده بر اساس دفتر تراکنش‌ها')
+
+    def handle(self, *args, **options):
+        drifts = find_drift(chunk_size=options['chunk_size'], workers=options['workers'])
+        self.write_report(drifts, options['report'])
+
+        if not drifts:
+            self.stdout.write(self.style.SUCCESS('موجودی و امتیاز همه کاربران با دفتر تراکنش‌ها مطابقت دارد.'))
+            return
+        if options['fix']:
+            fixed = apply_fixes(drifts)
+            self.stdout.write(self.style.SUCCESS(f"{fixed} کاربر از {len(drifts)} مغایرت اصلاح شد."))
+            if fixed < len(drifts):
+                raise CommandError(f"{len(drifts) - fixed} کاربر موجودی منفی در دفتر دارند و اصلاح نشدند.")
+            return
+        raise CommandError(f"{len(drifts)} مغایرت پیدا شد.")
+
+    def write_report(self, drifts, path):
+        out = open(path, 'w', newline='', encoding='utf-8') if path else self.stdout
+        try:
+            writer = csv.writer(out)
+            writer.writerow(['user_id', 'username', 'stored_balance', 'ledger_balance', 'balance_diff',
+                             'stored_points', 'ledger_points', 'points_diff'])
+            for d in drifts:
+                writer.writerow([d.user_id, d.username, d.stored_balance, d.ledger_balance,
+                                 d.ledger_balance - d.stored_balance, d.stored_points, d.ledger_points,
+                                 d.ledger_points - d.stored_points])
+        finally:
+            if path:
+                out.close()
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gamification.replay import replay_ledger, ReplayError
+
+
+class Command(BaseCommand):
+    help = ('بازسازی موجودی، امتیاز کل و لول همه کاربران از روی دفتر تراکنش‌ها '
+            '(خواندن جریانی و جمع برداری با NumPy)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200_000, help='تعداد تراکنش در هر تکه')
+        parser.add_argument('--batch-size', type=int, default=2000, help='تعداد کاربر در هر bulk_update')
+        parser.add_argument('--dry-run', action='store_true', help='فقط محاسبه و گزارش، بدون نوشتن')
+
+    def handle(self, *args, **options):
+        try:
+            report = replay_ledger(chunk_size=options['chunk_size'], batch_size=options['batch_size'],
+                                   dry_run=options['dry_run'])
+        except ReplayError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"{report['rows']} تراکنش در {report['seconds']} ثانیه ({report['rows_per_sec']} ردیف در ثانیه)، "
+            f"بیشینه حافظه {report['peak_memory_mb']} مگابایت"
+        )
+        verb = 'نیاز به تغییر دارند' if options['dry_run'] else 'به‌روز شدند'
+        self.stdout.write(self.style.SUCCESS(f"{report['changed']} کاربر از {report['users']} {verb}."))
+        if report['negative']:
+            self.stdout.write(self.style.WARNING(
+                f"جمع دفتر {len(report['negative'])} کاربر منفی است و تغییر نکرد: {report['negative'][:20]}"
+            ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from gamification.staking import settle_matured, rebuild_plan_aggregates
+
+
+class Command(BaseCommand):
+    help = 'تسویه دسته‌ای سرمایه‌گذاری‌های سررسیدشده (برگشت اصل و سود به کیف پول)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--rebuild-aggregates', action='store_true',
+                            help='محاسبه دوباره جمع سرمایه و تعداد کاربران فعال هر طرح از روی موقعیت‌ها')
+
+    def handle(self, *args, **options):
+        settled = settle_matured(batch_size=options['batch_size'])
+        self.stdout.write(f"{settled} سرمایه‌گذاری تسویه شد.")
+        if options['rebuild_aggregates']:
+            plans = rebuild_plan_aggregates()
+            self.stdout.write(f"جمع‌های {plans} طرح بازسازی شد.")
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_token_totals(apps, schema_editor):
+    # محاسبه جمع‌های اولیه از روی دفتر تراکنش‌های موجود
+    Transaction = apps.get_model('gamification', 'Transaction')
+    UserTokenTotal = apps.get_model('gamification', 'UserTokenTotal')
+    rows = Transaction.objects.values('user_id', 'token_type').annotate(total=Sum('amount')).order_by()
+    UserTokenTotal.objects.bulk_create(
+        [UserTokenTotal(user_id=r['user_id'], token_type=r['token_type'], total=r['total']) for r in rows],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0003_product_stakingplan_alter_userbadge_unique_together_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTokenTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token_type', models.CharField(choices=[('PERFORMANCE', 'عملکرد'), ('DISCIPLINE', 'نظم'), ('CULTURAL', 'فرهنگی'), ('IDEA', 'ایده و خلاقیت'), ('SPEND', 'خرید/خرج'), ('STAKING', 'سرمایه\u200cگذاری'), ('ADMIN', 'اصلاح مدیریتی')], max_length=20)),
+                ('total', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'token_type')},
+            },
+        ),
+        migrations.RunPython(backfill_token_totals, migrations.RunPython.noop),
+    ]
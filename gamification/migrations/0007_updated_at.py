@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0006_index_suite'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='badge',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='stakingplan',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
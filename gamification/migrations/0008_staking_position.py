@@ -0,0 +1,45 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0007_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stakingplan',
+            name='active_users_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='stakingplan',
+            name='total_staked',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StakingPosition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField()),
+                ('profit_percent', models.PositiveIntegerField()),
+                ('started_at', models.DateTimeField()),
+                ('matures_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('ACTIVE', 'فعال'), ('SETTLED', 'تسویه شده')], default='ACTIVE', max_length=10)),
+                ('payout', models.PositiveIntegerField(blank=True, null=True)),
+                ('settled_at', models.DateTimeField(blank=True, null=True)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='positions', to='gamification.stakingplan')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staking_positions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'ACTIVE')), fields=['matures_at'], name='staking_active_maturity_idx'), models.Index(fields=['user', '-started_at'], name='staking_user_started_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'ACTIVE')), fields=('user', 'plan'), name='staking_one_active_per_plan')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:18
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_badges(apps, schema_editor):
+    # نشان‌های تکراری دستی: قدیمی‌ترین ردیف نگه داشته می‌شود
+    UserBadge = apps.get_model('gamification', 'UserBadge')
+    duplicates = (UserBadge.objects.values('user_id', 'badge_id').annotate(n=Count('id'), keep=Min('id'))
+                  .filter(n__gt=1).order_by())
+    for row in duplicates:
+        UserBadge.objects.filter(user_id=row['user_id'], badge_id=row['badge_id']).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0008_staking_position'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_badges, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userbadge',
+            constraint=models.UniqueConstraint(fields=('user', 'badge'), name='user_badge_uniq'),
+        ),
+    ]
@@ -1,6 +1,54 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q, Sum, Case, When, Value, IntegerField
 from django.conf import settings
 
+# نگاشت نوع توکن به کلیدهای خلاصه کیف پول و داشبورد
+SUMMARY_TOKEN_KEYS = [
+    ('PERFORMANCE', 'performance'),
+    ('DISCIPLINE', 'discipline'),
+    ('CULTURAL', 'cultural'),
+    ('IDEA', 'trend'),
+]
+
+
+# فیلدهایی که جمع‌های تجمیعی (کاربر، نوع توکن) به آن‌ها وابسته‌اند
+LEDGER_FIELDS = {'user', 'user_id', 'token_type', 'amount'}
+
+
+def check_ledger_fields(fields):
+    blocked = LEDGER_FIELDS.intersection(fields)
+    if blocked:
+        raise ValueError(f"فیلدهای {', '.join(sorted(blocked))} تراکنش با update قابل تغییر نیستند.")
+
+
+class TransactionQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # درج گروهی و به‌روزرسانی جمع‌های تجمیعی در یک تراکنش دیتابیس
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            UserTokenTotal.objects.add_transactions(objs)
+        return objs
+
+    # UPDATE مستقیم مبلغ/کاربر/نوع جمع‌ها را از دفتر جدا می‌کند؛ اصلاح با تراکنش جبرانی یا save انجام شود
+    def update(self, **kwargs):
+        check_ledger_fields(kwargs)
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        check_ledger_fields(fields)
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def delete(self):
+        # حذف تراکنش‌ها و کم کردن مبلغشان از جمع‌های تجمیعی در یک تراکنش دیتابیس
+        with transaction.atomic(using=self.db):
+            rows = self.order_by().values_list('user_id', 'token_type').annotate(total=Sum('amount'))
+            UserTokenTotal.objects.apply_deltas({(user_id, token_type): -total for user_id, token_type, total in rows})
+            return super().delete()
+
+    def archive_delete(self):
+        # ردیف‌های منتقل‌شده به فایل بایگانی هنوز بخشی از دفتر هستند و جمع‌ها تغییر نمی‌کنند
+        return super().delete()
+
 
 class Transaction(models.Model):
     """
@@ -21,9 +69,153 @@ class Transaction(models.Model):
     description = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = TransactionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # صفحه‌بندی با کرسر روی (created_at, id)
+            models.Index(fields=['user', '-created_at', '-id'], name='tx_user_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='tx_created_idx'),
+            models.Index(fields=['user', 'token_type'], name='tx_user_type_idx'),
+            # لاگ همدلی: آخرین تراکنش‌های یک نوع توکن
+            models.Index(fields=['token_type', '-created_at', '-id'], name='tx_type_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user} - {self.amount} ({self.token_type})"
 
+    def save(self, *args, **kwargs):
+        # ثبت یا اصلاح تراکنش و جمع تجمیعی آن باید با هم انجام شوند
+        with transaction.atomic(using=kwargs.get('using')):
+            if self._state.adding:
+                super().save(*args, **kwargs)
+                UserTokenTotal.objects.add_transactions([self])
+                return
+
+            # اصلاح از پنل ادمین: اثر ردیف ذخیره‌شده برداشته و اثر ردیف جدید اضافه می‌شود
+            state = Transaction.objects.select_for_update().filter(pk=self.pk).values_list(
+                'user_id', 'token_type', 'amount')
+            before = state.first()
+            super().save(*args, **kwargs)
+            after = state.first()
+            if before != after:
+                deltas = {after[:2]: after[2]}
+                if before:
+                    deltas[before[:2]] = deltas.get(before[:2], 0) - before[2]
+                UserTokenTotal.objects.apply_deltas(deltas)
+                from .badges import touch
+                touch([after[0]], 'sum')
+
+    def delete(self, *args, **kwargs):
+        # مبلغ ذخیره‌شده (نه مقدار داخل حافظه) از جمع‌ها کم می‌شود
+        with transaction.atomic(using=kwargs.get('using')):
+            stored = Transaction.objects.filter(pk=self.pk).values_list('user_id', 'token_type', 'amount').first()
+            if stored:
+                UserTokenTotal.objects.apply_deltas({stored[:2]: -stored[2]})
+            return super().delete(*args, **kwargs)
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    موجودی کاربر در ابتدای هر ماه (جمع تراکنش‌های قبل از as_of)
+    فقط برای ماه‌هایی ساخته می‌شود که کاربر در آن‌ها تراکنش داشته؛ gamification/balances.py
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    as_of = models.DateTimeField()
+    balance = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            # نزدیک‌ترین نقطه قبل از یک زمان با پیمایش معکوس همین ایندکس پیدا می‌شود
+            models.UniqueConstraint(fields=['user', 'as_of'], name='balance_checkpoint_uniq'),
+        ]
+
+
+class ArchivedPeriod(models.Model):
+    """
+    ماهی که تراکنش‌هایش از جدول اصلی به یک فایل SQLite جدا منتقل شده؛ gamification/archive.py
+    """
+    period_start = models.DateField(unique=True)
+    file_name = models.CharField(max_length=100)
+    rows = models.PositiveIntegerField()
+    amount_total = models.BigIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-period_start']
+
+    def __str__(self):
+        return f"{self.period_start:%Y-%m} ({self.rows})"
+
+
+class UserTokenTotalManager(models.Manager):
+    # تعداد کلیدهایی که در هر دستور UPDATE به‌روزرسانی می‌شوند
+    BATCH_SIZE = 500
+
+    def add_transactions(self, transactions):
+        """
+        اعمال مبلغ تراکنش‌های جدید روی جمع‌های (کاربر، نوع توکن) با UPDATE شرطی
+        """
+        deltas = {}
+        for t in transactions:
+            key = (t.user_id, t.token_type)
+            deltas[key] = deltas.get(key, 0) + t.amount
+        self.apply_deltas(deltas)
+
+        from .badges import touch
+        touch({user_id for user_id, _ in deltas}, 'sum')
+
+    def apply_deltas(self, deltas):
+        """
+        deltas: {(user_id, token_type): تغییر}؛ حذف و اصلاح تراکنش‌ها هم از همین مسیر می‌گذرند
+        تغییرهایی که از این مسیر نگذرند فقط با دستور rebuild_token_totals اصلاح می‌شوند
+        """
+        items = [(key, amount) for key, amount in deltas.items() if amount]
+        for start in range(0, len(items), self.BATCH_SIZE):
+            batch = items[start:start + self.BATCH_SIZE]
+            # ساخت ردیف صفر برای کلیدهایی که هنوز وجود ندارند
+            self.bulk_create(
+                [self.model(user_id=user_id, token_type=token_type) for (user_id, token_type), _ in batch],
+                ignore_conflicts=True
+            )
+            keys = Q()
+            whens = []
+            for (user_id, token_type), amount in batch:
+                keys |= Q(user_id=user_id, token_type=token_type)
+                whens.append(When(user_id=user_id, token_type=token_type, then=Value(amount)))
+            self.filter(keys).update(
+                total=F('total') + Case(*whens, default=Value(0), output_field=IntegerField())
+            )
+
+    def summary_for(self, user):
+        """
+        جمع امتیازات کاربر به تفکیک دسته برای نمودارها (یک جستجوی ایندکس‌شده)
+        """
+        totals = dict(self.filter(user=user).values_list('token_type', 'total'))
+        return {key: totals.get(t_type, 0) for t_type, key in SUMMARY_TOKEN_KEYS}
+
+    async def asummary_for(self, user):
+        totals = {t_type: total async for t_type, total in self.filter(user=user).values_list('token_type', 'total')}
+        return {key: totals.get(t_type, 0) for t_type, key in SUMMARY_TOKEN_KEYS}
+
+
+class UserTokenTotal(models.Model):
+    """
+    جمع تجمیعی تراکنش‌های هر کاربر به تفکیک نوع توکن
+    همزمان با ثبت، اصلاح (save) یا حذف هر تراکنش به‌روز می‌شود تا نیازی به جمع زدن کل دفتر نباشد
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='token_totals')
+    token_type = models.CharField(max_length=20, choices=Transaction.TOKEN_TYPES)
+    total = models.IntegerField(default=0)
+
+    objects = UserTokenTotalManager()
+
+    class Meta:
+        unique_together = ('user', 'token_type')
+
+    def __str__(self):
+        return f"{self.user} - {self.token_type}: {self.total}"
+
 
 class Product(models.Model):
     """
@@ -44,6 +236,13 @@ class Product(models.Model):
     image = models.ImageField(upload_to='products/', null=True, blank=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # فروشگاه فقط کالاهای فعال را نشان می‌دهد (ایندکس جزئی)
+            models.Index(fields=['category', 'id'], condition=models.Q(is_active=True), name='product_active_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -58,20 +257,77 @@ class StakingPlan(models.Model):
     profit_percent = models.PositiveIntegerField(help_text="درصد سود")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # جمع‌های تجمیعی موقعیت‌های فعال؛ فقط با UPDATE اتمی در gamification/staking.py تغییر می‌کنند
+    total_staked = models.PositiveBigIntegerField(default=0)
+    active_users_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.name} ({self.profit_percent}%)"
 
 
+class StakingPosition(models.Model):
+    """
+    توکن‌های قفل‌شده یک کاربر در یک پلن سرمایه‌گذاری
+    سود به صورت خطی و در لحظه خواندن محاسبه می‌شود (بدون ثبت ردیف سود دوره‌ای)
+    """
+    STATUS_CHOICES = [('ACTIVE', 'فعال'), ('SETTLED', 'تسویه شده')]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='staking_positions')
+    plan = models.ForeignKey(StakingPlan, on_delete=models.PROTECT, related_name='positions')
+    amount = models.PositiveIntegerField()
+    # شرایط پلن در لحظه شروع (تغییر بعدی پلن روی موقعیت‌های باز اثر ندارد)
+    profit_percent = models.PositiveIntegerField()
+    started_at = models.DateTimeField()
+    matures_at = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ACTIVE')
+    payout = models.PositiveIntegerField(null=True, blank=True)
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # هر کاربر در هر پلن حداکثر یک موقعیت فعال دارد (شمارش کاربران فعال پلن بر همین اساس است)
+            models.UniqueConstraint(fields=['user', 'plan'], condition=Q(status='ACTIVE'),
+                                    name='staking_one_active_per_plan'),
+        ]
+        indexes = [
+            # پیدا کردن موقعیت‌های سررسیدشده برای تسویه
+            models.Index(fields=['matures_at'], condition=Q(status='ACTIVE'), name='staking_active_maturity_idx'),
+            models.Index(fields=['user', '-started_at'], name='staking_user_started_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.amount} ({self.plan})"
+
+    def profit_at(self, moment):
+        # سود کل دوره به نسبت زمان سپری‌شده، گرد به پایین
+        total = (self.matures_at - self.started_at).total_seconds()
+        elapsed = min(max((moment - self.started_at).total_seconds(), 0), total)
+        if total <= 0:
+            return self.amount * self.profit_percent // 100
+        return int(self.amount * self.profit_percent * elapsed // (100 * total))
+
+    @property
+    def full_profit(self):
+        return self.amount * self.profit_percent // 100
+
+
 # (اختیاری) مدل بج‌ها اگر بخواهید استفاده کنید
 class Badge(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     icon_name = models.CharField(max_length=50)
     criteria = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
 
 
 class UserBadge(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='badges')
     badge = models.ForeignKey(Badge, on_delete=models.CASCADE)
-    earned_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    earned_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'badge'], name='user_badge_uniq'),
+        ]
@@ -0,0 +1,60 @@
+"""
+موتور خرید از فروشگاه
+
+کسر موجودی کیف پول و کسر موجودی کالا هر کدام با یک UPDATE شرطی انجام می‌شوند
+(F-expression به همراه شرط محافظ در WHERE)، بنابراین هیچ خواندن-تغییر-نوشتنی
+در پایتون انجام نمی‌شود و خریدهای همزمان نمی‌توانند موجودی را منفی یا کالا را
+بیش از موجودی بفروشند.
+"""
+from django.db import transaction
+from django.db.models import F, Q, Case, When, Value
+from django.db.models.functions import Now
+
+from users.models import User
+from users.notifications import notify_users
+from ansup_gamification import response_cache
+from .models import Product, Transaction
+
+
+class PurchaseError(Exception):
+    message = 'خرید انجام نشد.'
+
+
+class OutOfStock(PurchaseError):
+    message = 'متاسفانه موجودی این کالا تمام شده است.'
+
+
+class InsufficientBalance(PurchaseError):
+    message = 'موجودی AC شما برای این خرید کافی نیست.'
+
+
+def purchase_product(user, product):
+    """
+    خرید یک عدد از کالا برای کاربر؛ در صورت عدم موفقیت PurchaseError می‌دهد
+    """
+    with transaction.atomic():
+        # کسر موجودی کالا (۱- یعنی نامحدود و تغییری نمی‌کند)
+        reserved = Product.objects.filter(pk=product.pk, is_active=True).filter(
+            Q(stock=-1) | Q(stock__gt=0)
+        ).update(stock=Case(When(stock=-1, then=Value(-1)), default=F('stock') - 1), updated_at=Now())
+        if not reserved:
+            raise OutOfStock()
+        # UPDATE مستقیم سیگنال post_save ندارد؛ موجودی نمایش‌داده‌شده در کاتالوگ تغییر کرده است
+        if product.stock != -1:
+            response_cache.invalidate('products')
+
+        # کسر پول فقط اگر موجودی کافی باشد؛ در غیر این صورت کل تراکنش برگردانده می‌شود
+        debited = User.objects.filter(pk=user.pk, current_balance__gte=product.price).update(
+            current_balance=F('current_balance') - product.price, updated_at=Now()
+        )
+        if not debited:
+            raise InsufficientBalance()
+
+        spend = Transaction.objects.create(
+            user_id=user.pk,
+            amount=-product.price,
+            token_type='SPEND',
+            description=f"خرید از فروشگاه: {product.title}"
+        )
+        notify_users([(user.pk, f"خرید «{product.title}» با موفقیت ثبت شد.")])
+        return spend
@@ -0,0 +1,114 @@
+"""
+تطبیق موجودی و امتیاز کل کاربران با دفتر تراکنش‌ها
+
+کاربران به بازه‌های شناسه تقسیم می‌شوند و هر بازه در یک نخ جدا بررسی می‌شود: جمع دفتر کل
+با GROUP BY در خود دیتابیس حساب می‌شود و با ستون‌های ذخیره‌شده همان بازه مقایسه می‌شود.
+مقدار مورد انتظار:
+    current_balance = جمع همه تراکنش‌ها
+    total_points    = جمع تراکنش‌های مثبت به جز STAKING (برگشت اصل و سود سرمایه‌گذاری امتیاز نیست)
+تراکنش‌های ماه‌های بایگانی‌شده با همان GROUP BY روی فایل‌های بایگانی جمع زده می‌شوند.
+اصلاح به صورت اختلاف (F + delta) و با یک UPDATE برای هر بازه اعمال می‌شود تا تغییرات همزمان از بین نروند.
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Now
+
+from users.models import User
+from users.levels import relevel_all
+from . import archive
+from .models import Transaction
+
+Drift = namedtuple('Drift', ['user_id', 'username', 'stored_balance', 'ledger_balance',
+                             'stored_points', 'ledger_points'])
+
+# نوع‌هایی که مبلغ مثبتشان به امتیاز کل اضافه نمی‌شود
+NON_POINT_TYPES = ('STAKING',)
+
+
+def ledger_totals(lo, hi):
+    """
+    {user_id: (balance, points)} از روی دفتر تراکنش‌ها برای کاربران بازه [lo, hi]
+    """
+    points = Sum('amount', filter=Q(amount__gt=0) & ~Q(token_type__in=NON_POINT_TYPES))
+    rows = (Transaction.objects.filter(user__gte=lo, user__lte=hi).values('user_id')
+            .annotate(balance=Sum('amount'), points=Coalesce(points, 0)).order_by()
+            .values_list('user_id', 'balance', 'points'))
+    totals = {user_id: (balance, points) for user_id, balance, points in rows}
+
+    # ماه‌های بایگانی‌شده هم بخشی از دفتر هستند
+    excluded = ', '.join('?' * len(NON_POINT_TYPES))
+    archived = archive.query(
+        f"SELECT user_id, SUM(amount), SUM(CASE WHEN amount > 0 AND token_type NOT IN ({excluded}) "
+        f"THEN amount ELSE 0 END) FROM transactions WHERE user_id BETWEEN ? AND ? GROUP BY user_id",
+        [*NON_POINT_TYPES, lo, hi]
+    )
+    for user_id, balance, points in archived:
+        stored_balance, stored_points = totals.get(user_id, (0, 0))
+        totals[user_id] = (stored_balance + balance, stored_points + points)
+    return totals
+
+
+def check_range(lo, hi):
+    """
+    لیست Drift کاربران بازه [lo, hi]؛ هر دو خواندن در یک تراکنش انجام می‌شوند
+    """
+    with transaction.atomic():
+        expected = ledger_totals(lo, hi)
+        stored = User.objects.filter(id__range=(lo, hi)).values_list('id', 'username', 'current_balance', 'total_points')
+        drifts = []
+        for user_id, username, balance, points in stored:
+            ledger_balance, ledger_points = expected.get(user_id, (0, 0))
+            if (balance, points) != (ledger_balance, ledger_points):
+                drifts.append(Drift(user_id, username, balance, ledger_balance, points, ledger_points))
+    return drifts
+
+
+def id_ranges(chunk_size):
+    bounds = User.objects.aggregate(lo=Min('id'), hi=Max('id'))
+    if bounds['lo'] is None:
+        return []
+    return [(lo, min(lo + chunk_size - 1, bounds['hi'])) for lo in range(bounds['lo'], bounds['hi'] + 1, chunk_size)]
+
+
+def find_drift(chunk_size=5000, workers=4):
+    ranges = id_ranges(chunk_size)
+    if workers <= 1:
+        return [drift for lo, hi in ranges for drift in check_range(lo, hi)]
+
+    def check(bounds):
+        try:
+            return check_range(*bounds)
+        finally:
+            # اتصال دیتابیس هر نخ جداست
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [drift for drifts in pool.map(check, ranges) for drift in drifts]
+
+
+def apply_fixes(drifts, batch_size=500):
+    """
+    اصلاح ستون‌های ذخیره‌شده به اندازه اختلاف با دفتر تراکنش‌ها؛ تعداد کاربران اصلاح‌شده را برمی‌گرداند
+    موجودی منفی در دفتر قابل ذخیره نیست و این کاربران فقط گزارش می‌شوند
+    """
+    drifts = [d for d in drifts if d.ledger_balance >= 0]
+    for start in range(0, len(drifts), batch_size):
+        batch = drifts[start:start + batch_size]
+        balance_whens = [When(pk=d.user_id, then=Value(d.ledger_balance - d.stored_balance)) for d in batch]
+        points_whens = [When(pk=d.user_id, then=Value(d.ledger_points - d.stored_points)) for d in batch]
+        ids = [d.user_id for d in batch]
+        with transaction.atomic():
+            User.objects.filter(pk__in=ids).update(
+                current_balance=F('current_balance') + Case(*balance_whens, default=Value(0), output_field=IntegerField()),
+                total_points=F('total_points') + Case(*points_whens, default=Value(0), output_field=IntegerField()),
+                updated_at=Now()
+            )
+            relevel_all(User.objects.filter(pk__in=ids))
+
+    if any(d.ledger_points != d.stored_points for d in drifts):
+        from users.ranking import rank_index
+        rank_index.invalidate()
+    return len(drifts)
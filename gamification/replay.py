@@ -0,0 +1,133 @@
+"""
+بازسازی برداری موجودی، امتیاز کل و لول همه کاربران از روی دفتر تراکنش‌ها
+
+دفتر به صورت جریانی (values_list().iterator()) و در تکه‌های ثابت خوانده می‌شود؛ هر تکه به آرایه NumPy
+تبدیل و با یک bincount روی کلید (شماره ردیف فشرده کاربر، نوع توکن) جمع زده می‌شود، پس حافظه مصرفی
+به اندازه (تعداد کاربران × تعداد نوع توکن) است و نه تعداد تراکنش‌ها یا بزرگ‌ترین شناسه کاربر.
+نتیجه فقط برای کاربرانی که مقدارشان تغییر کرده با bulk_update دسته‌ای نوشته می‌شود.
+"""
+import time
+from itertools import chain, islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from users.levels import curve
+from users.models import User
+from . import archive
+from .models import Transaction
+from .reconciliation import NON_POINT_TYPES
+
+try:
+    import resource
+except ImportError:  # ویندوز
+    resource = None
+
+
+class ReplayError(Exception):
+    pass
+
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    # در لینوکس ru_maxrss بر حسب کیلوبایت است
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def replay_ledger(chunk_size=200_000, batch_size=2000, dry_run=False):
+    """
+    خروجی: گزارش شامل تعداد ردیف‌ها، کاربران تغییرکرده، سرعت (ردیف در ثانیه) و بیشینه حافظه
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise ReplayError('برای بازسازی برداری کتابخانه numpy باید نصب باشد.')
+
+    rows_read = 0
+    users = 0
+    # کاربرانی که جمع دفترشان منفی است و قابل ذخیره نیستند
+    negative = []
+    started = time.perf_counter()
+    types = [code for code, _ in Transaction.TOKEN_TYPES]
+    type_index = {code: i for i, code in enumerate(types)}
+    # ستون آخر برای نوع‌هایی که در TOKEN_TYPES نیستند (ردیف‌های قدیمی)؛ مثل بقیه امتیاز حساب می‌شوند
+    other = len(types)
+    width = other + 1
+    point_types = np.array([code not in NON_POINT_TYPES for code in types] + [True])
+
+    with transaction.atomic():
+        # شناسه‌ها به شماره ردیف فشرده نگاشت می‌شوند تا حافظه به تعداد کاربران بستگی داشته باشد نه به بزرگ‌ترین شناسه
+        ids = np.fromiter(User.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=5000),
+                          dtype=np.int64)
+        balances = np.zeros(ids.size * width, dtype=np.int64)
+        earned = np.zeros(ids.size * width, dtype=np.int64)
+
+        # جدول اصلی و سپس فایل‌های ماه‌های بایگانی‌شده، هر دو به صورت جریانی
+        rows = chain(
+            Transaction.objects.values_list('user_id', 'token_type', 'amount').iterator(chunk_size=chunk_size),
+            archive.query('SELECT user_id, token_type, amount FROM transactions'),
+        )
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            user_ids, token_types, amounts = zip(*chunk)
+            user_ids = np.fromiter(user_ids, dtype=np.int64, count=len(chunk))
+            positions = np.searchsorted(ids, user_ids)
+            # ردیف‌های بایگانی کاربری که بعد از بایگانی حذف شده در ids نیستند و کنار گذاشته می‌شوند
+            known = positions < ids.size
+            known[known] = ids[positions[known]] == user_ids[known]
+            keys = positions * width
+            keys += np.fromiter((type_index.get(t, other) for t in token_types), dtype=np.int64, count=len(chunk))
+            amounts = np.fromiter(amounts, dtype=np.int64, count=len(chunk))
+            keys, amounts = keys[known], amounts[known]
+            # bincount با وزن خروجی float64 دارد؛ مبالغ صحیح تا 2^53 بدون خطا جمع می‌شوند
+            balances += np.rint(np.bincount(keys, weights=amounts, minlength=balances.size)).astype(np.int64)
+            earned += np.rint(np.bincount(keys, weights=np.maximum(amounts, 0),
+                                          minlength=earned.size)).astype(np.int64)
+            rows_read += len(chunk)
+
+        balance = balances.reshape(ids.size, width).sum(axis=1)
+        points = earned.reshape(ids.size, width)[:, point_types].sum(axis=1)
+        thresholds, levels = curve()
+        if thresholds:
+            index = np.searchsorted(np.array(thresholds), points, side='right') - 1
+            level = np.where(index >= 0, np.array(levels)[np.maximum(index, 0)], 1)
+        else:
+            level = np.ones(ids.size, dtype=np.int64)
+
+        now = timezone.now()
+        changed = []
+        rows = User.objects.order_by('id').values_list('id', 'current_balance', 'total_points', 'level')
+        for user_id, stored_balance, stored_points, stored_level in rows.iterator(chunk_size=5000):
+            position = int(np.searchsorted(ids, user_id))
+            if position >= ids.size or ids[position] != user_id:
+                # کاربری که بعد از شروع بازسازی ساخته شده
+                continue
+            users += 1
+            values = int(balance[position]), int(points[position]), int(level[position])
+            if values[0] < 0:
+                negative.append(user_id)
+                continue
+            if values != (stored_balance, stored_points, stored_level):
+                changed.append(User(pk=user_id, current_balance=values[0], total_points=values[1],
+                                    level=values[2], updated_at=now))
+
+        if not dry_run and changed:
+            fields = ['current_balance', 'total_points', 'level', 'updated_at']
+            for start in range(0, len(changed), batch_size):
+                User.objects.bulk_update(changed[start:start + batch_size], fields)
+            from users.ranking import rank_index
+            rank_index.invalidate()
+
+    elapsed = time.perf_counter() - started
+    return {
+        'rows': rows_read,
+        'users': users,
+        'changed': len(changed),
+        'negative': negative,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(rows_read / elapsed, 1) if elapsed > 0 else None,
+        'peak_memory_mb': peak_memory_mb(),
+    }
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Product, Transaction, StakingPlan, Badge, UserBadge
+from django.utils import timezone
+from .models import Product, Transaction, StakingPlan, StakingPosition, Badge, UserBadge
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -25,8 +26,8 @@ class TransactionSerializer(serializers.ModelSerializer):
 
 class StakingPlanSerializer(serializers.ModelSerializer):
     # فیلدهای محاسباتی برای نمایش در پنل ادمین
-    total_stacked = serializers.SerializerMethodField()
-    active_users_count = serializers.SerializerMethodField()
+    total_stacked = serializers.IntegerField(source='total_staked', read_only=True)
+    active_users_count = serializers.IntegerField(read_only=True)
     is_golden = serializers.SerializerMethodField()
 
     class Meta:
@@ -34,16 +35,27 @@ class StakingPlanSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'duration_months', 'profit_percent', 'is_active', 'total_stacked', 'active_users_count',
                   'is_golden']
 
-    def get_total_stacked(self, obj):
-        return 0  # در فاز بعدی می‌توانیم محاسبه واقعی را اضافه کنیم
-
-    def get_active_users_count(self, obj):
-        return 0  # در فاز بعدی
-
     def get_is_golden(self, obj):
         return obj.profit_percent >= 20  # اگر سود بیشتر از ۲۰٪ بود طلایی نمایش بده
 
 
+class StakingPositionSerializer(serializers.ModelSerializer):
+    plan_name = serializers.CharField(source='plan.name', read_only=True)
+    # سود تا همین لحظه (محاسبه خطی، بدون ذخیره)
+    accrued_profit = serializers.SerializerMethodField()
+    expected_profit = serializers.IntegerField(source='full_profit', read_only=True)
+
+    class Meta:
+        model = StakingPosition
+        fields = ['id', 'plan', 'plan_name', 'amount', 'profit_percent', 'started_at', 'matures_at', 'status',
+                  'accrued_profit', 'expected_profit', 'payout', 'settled_at']
+
+    def get_accrued_profit(self, obj):
+        if obj.status == 'SETTLED':
+            return obj.payout - obj.amount
+        return obj.profit_at(self.context.get('now') or timezone.now())
+
+
 class BadgeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Badge
@@ -0,0 +1,33 @@
+import functools
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ansup_gamification import response_cache
+from users.models import User
+from . import archive
+from .models import Product, StakingPlan, Badge, ArchivedPeriod
+
+# مدل -> فضای نام کش پاسخ‌هایی که از آن ساخته می‌شوند
+CACHED_MODELS = {
+    Product: 'products',
+    StakingPlan: 'staking_plans',
+    Badge: 'badges',
+    ArchivedPeriod: 'archive',
+}
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=StakingPlan)
+@receiver([post_save, post_delete], sender=Badge)
+@receiver([post_save, post_delete], sender=ArchivedPeriod)
+def invalidate_catalog_cache(sender, **kwargs):
+    response_cache.invalidate(CACHED_MODELS[sender])
+
+
+@receiver(post_delete, sender=User)
+def purge_archived_transactions(sender, instance, **kwargs):
+    # ردیف‌های جدول اصلی با CASCADE حذف می‌شوند؛ فایل‌های بایگانی بعد از commit پاک می‌شوند
+    # (خطای این مرحله فقط لاگ می‌شود و بازسازی‌ها ردیف‌های کاربران ناموجود را نادیده می‌گیرند)
+    transaction.on_commit(functools.partial(archive.purge_users, [instance.pk]), robust=True)
@@ -0,0 +1,156 @@
+"""
+موتور استیکینگ (سرمایه‌گذاری توکن)
+
+با شروع یک موقعیت، مبلغ با یک UPDATE شرطی از موجودی کاربر کم و در StakingPosition قفل می‌شود.
+سود به صورت خطی از روی زمان شروع و سررسید محاسبه می‌شود و تا زمان تسویه هیچ ردیفی برای آن
+ثبت نمی‌شود. تسویه موقعیت‌های سررسیدشده دسته‌ای انجام می‌شود: یک bulk_update برای موقعیت‌ها،
+یک bulk_create برای تراکنش‌های دفتر کل و UPDATEهای گروهی برای موجودی کاربران و جمع‌های پلن.
+"""
+import calendar
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from users.models import User
+from users.notifications import notify_users
+from ansup_gamification import response_cache
+from .models import StakingPlan, StakingPosition, Transaction
+
+
+class StakingError(Exception):
+    message = 'سرمایه‌گذاری انجام نشد.'
+
+
+class InvalidAmount(StakingError):
+    message = 'مبلغ سرمایه‌گذاری نامعتبر است.'
+
+
+class InsufficientBalance(StakingError):
+    message = 'موجودی شما برای این سرمایه‌گذاری کافی نیست.'
+
+
+class AlreadyStaking(StakingError):
+    message = 'شما در حال حاضر در این طرح سرمایه‌گذاری فعال دارید.'
+
+
+def add_months(moment, months):
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    day = min(moment.day, calendar.monthrange(year, month)[1])
+    return moment.replace(year=year, month=month, day=day)
+
+
+def join_staking(user, plan, amount):
+    """
+    قفل کردن amount توکن از موجودی کاربر در پلن؛ در صورت عدم موفقیت StakingError می‌دهد
+    """
+    if amount <= 0:
+        raise InvalidAmount()
+    now = timezone.now()
+    with transaction.atomic():
+        debited = User.objects.filter(pk=user.pk, current_balance__gte=amount).update(
+            current_balance=F('current_balance') - amount, updated_at=Now()
+        )
+        if not debited:
+            raise InsufficientBalance()
+
+        try:
+            with transaction.atomic():
+                position = StakingPosition.objects.create(
+                    user_id=user.pk, plan=plan, amount=amount, profit_percent=plan.profit_percent,
+                    started_at=now, matures_at=add_months(now, plan.duration_months),
+                )
+        except IntegrityError:
+            raise AlreadyStaking()
+
+        Transaction.objects.create(
+            user_id=user.pk,
+            amount=-amount,
+            token_type='STAKING',
+            description=f"سرمایه‌گذاری در طرح {plan.name}"
+        )
+        StakingPlan.objects.filter(pk=plan.pk).update(
+            total_staked=F('total_staked') + amount,
+            active_users_count=F('active_users_count') + 1,
+            updated_at=Now()
+        )
+        response_cache.invalidate('staking_plans')
+        return position
+
+
+def settle_matured(now=None, batch_size=500):
+    """
+    تسویه همه موقعیت‌های سررسیدشده در دسته‌های batch_size تایی؛ تعداد تسویه‌شده‌ها را برمی‌گرداند
+    """
+    now = now or timezone.now()
+    settled = 0
+    while True:
+        count = _settle_batch(now, batch_size)
+        settled += count
+        if count < batch_size:
+            return settled
+
+
+def _settle_batch(now, batch_size):
+    with transaction.atomic():
+        positions = list(
+            StakingPosition.objects.select_for_update(skip_locked=True)
+            .filter(status='ACTIVE', matures_at__lte=now)
+            .select_related('plan').order_by('matures_at')[:batch_size]
+        )
+        if not positions:
+            return 0
+
+        payouts = {}
+        plan_totals = defaultdict(lambda: [0, 0])
+        ledger = []
+        for position in positions:
+            position.status = 'SETTLED'
+            position.settled_at = now
+            position.payout = position.amount + position.full_profit
+            payouts[position.user_id] = payouts.get(position.user_id, 0) + position.payout
+            plan_totals[position.plan_id][0] += position.amount
+            plan_totals[position.plan_id][1] += 1
+            ledger.append(Transaction(
+                user_id=position.user_id,
+                amount=position.payout,
+                token_type='STAKING',
+                description=f"تسویه سرمایه‌گذاری طرح {position.plan.name} (سود {position.full_profit})"
+            ))
+
+        StakingPosition.objects.bulk_update(positions, ['status', 'settled_at', 'payout'])
+        Transaction.objects.bulk_create(ledger)
+        # سود استیکینگ فقط به کیف پول اضافه می‌شود و امتیاز لیدربرد نیست
+        User.objects.apply_increments({user_id: (total, 0) for user_id, total in payouts.items()})
+        for plan_id, (amount, users) in plan_totals.items():
+            StakingPlan.objects.filter(pk=plan_id).update(
+                total_staked=F('total_staked') - amount,
+                active_users_count=F('active_users_count') - users,
+                updated_at=Now()
+            )
+        response_cache.invalidate('staking_plans')
+        notify_users([(position.user_id, f"سرمایه‌گذاری شما در طرح {position.plan.name} تسویه شد: "
+                                         f"{position.payout} توکن به کیف پول شما برگشت.")
+                      for position in positions])
+        return len(positions)
+
+
+def rebuild_plan_aggregates():
+    """
+    محاسبه دوباره جمع‌های پلن‌ها از روی موقعیت‌های فعال (برای اصلاح داده)
+    """
+    totals = {row['plan_id']: row for row in StakingPosition.objects.filter(status='ACTIVE')
+              .values('plan_id').annotate(amount=Sum('amount'), users=Count('user_id', distinct=True))}
+    now = timezone.now()
+    plans = list(StakingPlan.objects.all())
+    for plan in plans:
+        row = totals.get(plan.pk, {})
+        plan.total_staked = row.get('amount') or 0
+        plan.active_users_count = row.get('users') or 0
+        plan.updated_at = now
+    StakingPlan.objects.bulk_update(plans, ['total_staked', 'active_users_count', 'updated_at'])
+    response_cache.invalidate('staking_plans')
+    return len(plans)
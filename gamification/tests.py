@@ -1,3 +1,564 @@
-from django.test import TestCase
+import csv
+import datetime
+import importlib.util
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ansup_gamification import response_cache
+from ansup_gamification.explain import QueryPlanAssertionsMixin
+from ansup_gamification.pagination import KeysetPagination
+from users.models import User
+from operations.models import Attendance
+from .archive import archive_old_months, history, purge_users
+from .badges import load_rules
+from .balances import balance_on, balance_series, build_checkpoints
+from .models import (Transaction, Product, UserTokenTotal, Badge, UserBadge, StakingPlan, StakingPosition,
+                     BalanceCheckpoint, ArchivedPeriod)
+from .purchases import purchase_product, OutOfStock, InsufficientBalance
+from .reconciliation import find_drift
+from .replay import replay_ledger
+from .staking import settle_matured
+
+
+class HotQueryPlanTests(QueryPlanAssertionsMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('employee', password='x')
+
+    def test_user_transaction_page(self):
+        qs = Transaction.objects.filter(user=self.user).order_by('-created_at', '-id')[:21]
+        self.assertUsesIndex(qs, 'tx_user_created_idx')
+
+    def test_user_token_type_filter(self):
+        qs = Transaction.objects.filter(user=self.user, token_type='PERFORMANCE')
+        self.assertUsesIndex(qs, 'tx_user_type_idx')
+
+    def test_empathy_logs(self):
+        qs = Transaction.objects.filter(token_type='CULTURAL').order_by('-created_at')[:10]
+        self.assertUsesIndex(qs, 'tx_type_created_idx')
+
+    def test_token_totals_lookup(self):
+        self.assertNoFullScan(UserTokenTotal.objects.filter(user=self.user))
+
+    def test_active_products(self):
+        self.assertUsesIndex(Product.objects.filter(is_active=True), 'product_active_idx')
+        self.assertUsesIndex(Product.objects.filter(is_active=True, category='daily'), 'product_active_idx')
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('employee', password='x')
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        Transaction.objects.bulk_create([Transaction(user=self.user, amount=i, token_type='PERFORMANCE',
+                                                     description='d') for i in range(5)])
+        # سه تراکنش با زمان یکسان؛ ترتیب بین آن‌ها با id تعیین می‌شود
+        moment = timezone.now() - timedelta(days=1)
+        self.ids = list(Transaction.objects.order_by('id').values_list('id', flat=True))
+        Transaction.objects.filter(id__in=self.ids[1:4]).update(created_at=moment)
+
+    def get(self, query=''):
+        return self.client.get(f'/api/transactions/?page_size=2{query}', headers=self.headers)
+
+    def test_cursor_round_trip(self):
+        paginator = KeysetPagination()
+        moment = timezone.now()
+        self.assertEqual(paginator.decode_cursor(paginator.encode_cursor(moment, 42)), (moment, 42))
+
+    def test_pages_break_ties_by_id(self):
+        seen, cursor = [], None
+        while True:
+            data = self.get(f'&cursor={cursor}' if cursor else '').json()
+            seen += [row['id'] for row in data['results']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+            self.assertIn(f'cursor={cursor}', data['next'])
+        # جدیدترین (بدون تغییر زمان) اول، سپس سه ردیف هم‌زمان به ترتیب نزولی id
+        self.assertEqual(seen, [self.ids[4], self.ids[0], self.ids[3], self.ids[2], self.ids[1]])
+
+    def test_invalid_cursor_is_404(self):
+        for cursor in ('@@', 'bm90LWpzb24=', 'WyJ4IiwgMV0='):
+            self.assertEqual(self.get(f'&cursor={cursor}').status_code, 404)
+
+
+class TokenTotalTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('employee', password='x')
+        self.other = User.objects.create_user('other', password='x')
+
+    def totals(self):
+        return dict(((u, t), total) for u, t, total in UserTokenTotal.objects.exclude(total=0)
+                    .values_list('user_id', 'token_type', 'total'))
+
+    def check(self):
+        call_command('rebuild_token_totals', check=True, stdout=io.StringIO())
+
+    def test_maintained_on_insert_edit_and_delete(self):
+        tx = Transaction.objects.create(user=self.user, amount=100, token_type='CULTURAL', description='a')
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, amount=50, token_type='CULTURAL', description='b'),
+            Transaction(user=self.user, amount=-20, token_type='SPEND', description='c'),
+            Transaction(user=self.other, amount=70, token_type='IDEA', description='d'),
+        ])
+        self.assertEqual(self.totals(), {(self.user.id, 'CULTURAL'): 150, (self.user.id, 'SPEND'): -20,
+                                         (self.other.id, 'IDEA'): 70})
+
+        # اصلاح از مسیر save: اثر قبلی برداشته و اثر جدید اضافه می‌شود
+        tx.amount, tx.token_type = 30, 'IDEA'
+        tx.save()
+        self.assertEqual(self.totals()[(self.user.id, 'CULTURAL')], 50)
+        self.assertEqual(self.totals()[(self.user.id, 'IDEA')], 30)
+        self.check()
+
+        Transaction.objects.get(pk=tx.pk).delete()
+        Transaction.objects.filter(token_type__in=['SPEND', 'IDEA']).delete()
+        self.assertEqual(self.totals(), {(self.user.id, 'CULTURAL'): 50})
+        self.check()
+
+        with self.assertRaises(ValueError):
+            Transaction.objects.update(amount=1)
+        with self.assertRaises(ValueError):
+            Transaction.objects.bulk_update(list(Transaction.objects.all()), ['token_type'])
+        # حذف کاربر ردیف‌ها و جمع‌هایش را با هم حذف می‌کند
+        self.user.delete()
+        self.assertEqual(self.totals(), {})
+
+    def test_rebuild_repairs_drift(self):
+        Transaction.objects.create(user=self.user, amount=100, token_type='CULTURAL', description='a')
+        Transaction.objects.create(user=self.other, amount=40, token_type='IDEA', description='b')
+        UserTokenTotal.objects.filter(user=self.user).update(total=7)
+        UserTokenTotal.objects.create(user=self.other, token_type='SPEND', total=-5)
+
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_token_totals', check=True, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+        call_command('rebuild_token_totals', stdout=io.StringIO())
+        self.assertEqual(self.totals(), {(self.user.id, 'CULTURAL'): 100, (self.other.id, 'IDEA'): 40})
+        self.check()
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        response_cache.stats.reset()
+        self.user = User.objects.create_user('employee', password='x', current_balance=100)
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        self.product = Product.objects.create(title='mug', price=10, stock=5, category='daily')
+
+    def get(self, path):
+        return self.client.get(path, headers=self.headers)
+
+    def test_hit_after_miss_without_catalog_queries(self):
+        self.assertEqual(self.get('/api/shop/')['X-Cache'], 'MISS')
+        # فقط احراز هویت کاربر و کوئری تجمیعی ETag
+        with self.assertNumQueries(2):
+            response = self.get('/api/shop/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()[0]['stock'], 5)
+        # پارامترهای متفاوت کلید جدا دارند
+        self.assertEqual(self.get('/api/shop/?category=daily')['X-Cache'], 'MISS')
+        self.assertEqual(response_cache.stats.snapshot()['products'], {'hits': 1, 'misses': 2, 'hit_ratio': 0.333})
+        lines = response_cache.stats.prometheus().splitlines()
+        self.assertIn('response_cache_requests_total{namespace="products",result="hit"} 1', lines)
+        self.assertIn('response_cache_requests_total{namespace="products",result="miss"} 2', lines)
+
+    def test_signals_and_purchase_invalidate(self):
+        self.get('/api/shop/')
+        self.get('/api/badges/')
+
+        self.product.title = 'cup'
+        self.product.save()
+        self.assertEqual(self.get('/api/shop/').json()[0]['title'], 'cup')
+
+        self.client.post(f'/api/shop/{self.product.id}/purchase/', headers=self.headers)
+        self.assertEqual(self.get('/api/shop/').json()[0]['stock'], 4)
+
+        Badge.objects.create(name='b', description='d', icon_name='i', criteria='c')
+        self.assertEqual(len(self.get('/api/badges/').json()), 1)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('employee', password='x', current_balance=100)
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        self.product = Product.objects.create(title='mug', price=10, stock=5)
+
+    def get(self, path, etag=None):
+        headers = dict(self.headers, **({'If-None-Match': etag} if etag else {}))
+        return self.client.get(path, headers=headers)
+
+    def test_not_modified_until_catalog_changes(self):
+        etag = self.get('/api/shop/')['ETag']
+        # فقط احراز هویت و کوئری تجمیعی نسخه
+        with self.assertNumQueries(2):
+            response = self.get('/api/shop/', etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        # UPDATE مستقیم خرید هم updated_at را جلو می‌برد
+        self.client.post(f'/api/shop/{self.product.id}/purchase/', headers=self.headers)
+        self.assertEqual(self.get('/api/shop/', etag).status_code, 200)
+
+        self.product.delete()
+        self.assertNotEqual(self.get('/api/shop/')['ETag'], etag)
+
+    def test_profile_etag_follows_balance_changes(self):
+        etag = self.get('/api/users/me/')['ETag']
+        self.assertEqual(self.get('/api/users/me/', etag).status_code, 304)
+        self.assertEqual(self.get('/api/async/users/me/', etag).status_code, 304)
+
+        User.objects.apply_increments({self.user.id: (5, 5)})
+        self.assertEqual(self.get('/api/users/me/', etag).status_code, 200)
+
+
+class PurchaseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('employee', password='x', current_balance=25)
+        self.product = Product.objects.create(title='mug', price=10, stock=2)
+
+    def test_guarded_updates_without_reads(self):
+        with CaptureQueriesContext(connection) as queries:
+            purchase_product(self.user, self.product)
+        sql = [q['sql'] for q in queries.captured_queries]
+        # بدون خواندن-تغییر-نوشتن: کالا و کاربر فقط با UPDATE شرطی تغییر می‌کنند
+        self.assertFalse([s for s in sql if s.startswith('SELECT') and ('"stock"' in s or '"current_balance"' in s)])
+        product_update, user_update = [s for s in sql if s.startswith('UPDATE "gamification_product"') or
+                                       s.startswith('UPDATE "users_user"')]
+        self.assertIn('"stock" > 0', product_update)
+        self.assertIn('"current_balance" >= 10', user_update)
+
+        self.user.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((self.user.current_balance, self.product.stock), (15, 1))
+        self.assertEqual(Transaction.objects.get(user=self.user).amount, -10)
+
+    def test_failures_roll_back(self):
+        purchase_product(self.user, self.product)
+        purchase_product(self.user, self.product)
+        with self.assertRaises(OutOfStock):
+            purchase_product(self.user, self.product)
+
+        # کسری موجودی کیف پول، کاهش موجودی کالا را هم برمی‌گرداند
+        unlimited = Product.objects.create(title='pen', price=10, stock=-1)
+        with self.assertRaises(InsufficientBalance):
+            purchase_product(self.user, unlimited)
+        limited = Product.objects.create(title='cup', price=10, stock=3)
+        with self.assertRaises(InsufficientBalance):
+            purchase_product(self.user, limited)
+        limited.refresh_from_db()
+        unlimited.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual((limited.stock, unlimited.stock, self.user.current_balance), (3, -1, 5))
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+
+
+class StakingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('employee', password='x', current_balance=1000)
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        self.plan = StakingPlan.objects.create(name='gold', duration_months=3, profit_percent=12)
+
+    def join(self, amount):
+        return self.client.post('/api/wallet/join-staking/', {'plan_id': self.plan.id, 'amount': amount},
+                                headers=self.headers)
+
+    def test_join_locks_funds_and_settlement_pays_out(self):
+        self.assertEqual(self.join(5000).status_code, 400)
+        self.assertEqual(self.join(400).status_code, 200)
+        # فقط یک موقعیت فعال در هر طرح
+        self.assertEqual(self.join(100).status_code, 400)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.current_balance, 600)
+        plan = self.client.get('/api/wallet/staking-plans/', headers=self.headers).json()[0]
+        self.assertEqual((plan['total_stacked'], plan['active_users_count']), (400, 1))
+
+        position = StakingPosition.objects.get()
+        halfway = position.started_at + (position.matures_at - position.started_at) / 2
+        self.assertEqual(position.profit_at(halfway), 24)
+        self.assertEqual(settle_matured(now=halfway), 0)
+
+        self.assertEqual(settle_matured(now=position.matures_at + timedelta(seconds=1)), 1)
+        self.user.refresh_from_db()
+        self.plan.refresh_from_db()
+        self.assertEqual(self.user.current_balance, 1048)
+        self.assertEqual((self.plan.total_staked, self.plan.active_users_count), (0, 0))
+        self.assertEqual(UserTokenTotal.objects.get(user=self.user, token_type='STAKING').total, 48)
+        row = self.client.get('/api/wallet/staking-positions/', headers=self.headers).json()[0]
+        self.assertEqual((row['status'], row['accrued_profit'], row['payout']), ('SETTLED', 48, 448))
+
+
+class BadgeRuleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('employee', password='x')
+        self.other = User.objects.create_user('other', password='x')
+        self.cultural = Badge.objects.create(name='culture', description='d', icon_name='i',
+                                             criteria='sum CULTURAL >= 100')
+        self.streak = Badge.objects.create(name='punctual', description='d', icon_name='i', criteria='streak ≥ 3')
+        Badge.objects.create(name='manual', description='d', icon_name='i', criteria='انتخاب مدیر')
+
+    def test_compile_rules(self):
+        self.assertEqual([(r.kind, r.arg, r.threshold) for r in load_rules()],
+                         [('sum', 'CULTURAL', 100), ('streak', None, 3)])
+
+    def test_awards_incrementally_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(user=self.user, amount=60, token_type='CULTURAL', description='a')
+        self.assertFalse(UserBadge.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.bulk_create([
+                Transaction(user=self.user, amount=50, token_type='CULTURAL', description='b'),
+                Transaction(user=self.other, amount=500, token_type='IDEA', description='c'),
+            ])
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(user=self.user, amount=10, token_type='CULTURAL', description='d')
+        self.assertEqual(list(UserBadge.objects.values_list('user_id', 'badge_id')), [(self.user.id, self.cultural.id)])
+
+    def test_streak_and_backfill(self):
+        for day, status in enumerate(['On-time', 'On-time', 'Late', 'On-time', 'On-time', 'On-time'], start=1):
+            Attendance.objects.create(user=self.other, date=datetime.date(2024, 1, day), check_in=datetime.time(8),
+                                      status=status)
+        # بدون اجرای callbackهای commit، فقط دستور بازبینی نشان را می‌دهد
+        self.assertFalse(UserBadge.objects.exists())
+        call_command('award_badges', chunk_size=1, stdout=io.StringIO())
+        self.assertEqual(list(UserBadge.objects.values_list('user_id', 'badge_id')), [(self.other.id, self.streak.id)])
+
+
+class ReconciliationTests(TestCase):
+    def test_report_and_fix_drift(self):
+        good = User.objects.create_user('good', password='x')
+        drifted = User.objects.create_user('drifted', password='x', current_balance=70, total_points=900)
+        User.objects.create_user('empty', password='x')
+        Transaction.objects.create(user=good, amount=100, token_type='PERFORMANCE', description='a')
+        Transaction.objects.create(user=drifted, amount=100, token_type='CULTURAL', description='b')
+        Transaction.objects.create(user=drifted, amount=-40, token_type='SPEND', description='c')
+        Transaction.objects.create(user=drifted, amount=30, token_type='STAKING', description='d')
+        User.objects.apply_increments({good.id: (100, 100)})
+
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('reconcile_ledger', chunk_size=1, workers=1, stdout=out)
+        rows = list(csv.reader(io.StringIO(out.getvalue())))
+        self.assertEqual(rows[1:], [[str(drifted.id), 'drifted', '70', '90', '20', '900', '100', '-800']])
+
+        call_command('reconcile_ledger', workers=1, fix=True, stdout=io.StringIO())
+        drifted.refresh_from_db()
+        self.assertEqual((drifted.current_balance, drifted.total_points, drifted.level), (90, 100, 1))
+        call_command('reconcile_ledger', workers=1, stdout=io.StringIO())
+
+
+class ParallelReconciliationTests(TransactionTestCase):
+    def test_worker_threads_match_serial_run(self):
+        users = [User.objects.create_user(f'u{i}', password='x') for i in range(7)]
+        for i, user in enumerate(users):
+            Transaction.objects.create(user=user, amount=10 * (i + 1), token_type='PERFORMANCE', description='a')
+        User.objects.apply_increments({u.id: (10 * (i + 1), 10 * (i + 1)) for i, u in enumerate(users)})
+        drifted = [users[1].id, users[5].id]
+        User.objects.filter(pk__in=drifted).update(current_balance=F('current_balance') + 5)
+
+        # هر بازه در نخ خودش و با اتصال جدا بررسی می‌شود
+        parallel = find_drift(chunk_size=2, workers=3)
+        self.assertEqual(sorted(d.user_id for d in parallel), drifted)
+        self.assertEqual(sorted(parallel), sorted(find_drift(chunk_size=2, workers=1)))
+
+        call_command('reconcile_ledger', chunk_size=2, fix=True, stdout=io.StringIO())
+        self.assertEqual(find_drift(chunk_size=2, workers=3), [])
+
+
+class BalanceCheckpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('employee', password='x')
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        for day, amount in [((2024, 1, 10), 100), ((2024, 1, 20), -30), ((2024, 2, 5), 50), ((2024, 3, 15), 25)]:
+            tx = Transaction.objects.create(user=self.user, amount=amount, token_type='PERFORMANCE', description='x')
+            Transaction.objects.filter(pk=tx.pk).update(
+                created_at=timezone.make_aware(datetime.datetime(*day, 12)))
+
+    def test_checkpoints_and_point_in_time_balance(self):
+        self.assertEqual(build_checkpoints(until=timezone.make_aware(datetime.datetime(2024, 3, 20))), 2)
+        self.assertEqual(list(BalanceCheckpoint.objects.order_by('as_of').values_list('balance', flat=True)), [70, 120])
+        # فقط نقطه ماه قبل و دنباله تراکنش‌های بعد از آن
+        with self.assertNumQueries(2):
+            self.assertEqual(balance_on(self.user.id, datetime.date(2024, 3, 20)), 145)
+        self.assertEqual(balance_on(self.user.id, datetime.date(2024, 1, 15)), 100)
+
+        response = self.client.get('/api/wallet/balance-at/?date=2024-02-10', headers=self.headers)
+        self.assertEqual(response.json()['balance'], 120)
+
+    def test_history_is_downsampled(self):
+        data = self.client.get('/api/wallet/balance-history/?from=2024-01-01&to=2024-01-31', headers=self.headers).json()
+        self.assertEqual((data['granularity'], len(data['points'])), ('day', 31))
+        self.assertEqual(data['points'][19]['balance'], 70)
+
+        data = self.client.get('/api/wallet/balance-history/?from=2023-01-01&to=2024-03-31', headers=self.headers).json()
+        self.assertEqual(data['granularity'], 'week')
+        data = self.client.get('/api/wallet/balance-history/?from=2020-01-01&to=2024-03-31', headers=self.headers).json()
+        self.assertEqual(data['granularity'], 'month')
+        self.assertEqual([p['balance'] for p in data['points'][-3:]], [70, 120, 145])
+        self.assertEqual(data['points'][-1]['date'], '2024-03-31')
+
+    def test_long_and_out_of_range_requests(self):
+        # بازه‌ای که ماهانه هم بیش از ۱۲۰ نقطه است به دوره فعالیت کاربر تا امروز محدود می‌شود
+        data = self.client.get('/api/wallet/balance-history/?from=0001-01-02&to=9999-12-30',
+                               headers=self.headers).json()
+        self.assertLessEqual(len(data['points']), 120)
+        self.assertEqual(data['points'][-1], {'date': str(timezone.localdate()), 'balance': 145})
+
+        with mock.patch('django.utils.timezone.localdate', return_value=datetime.date(2024, 12, 31)):
+            granularity, points = balance_series(self.user.id, datetime.date(1, 1, 2), datetime.date(9999, 12, 30))
+            self.assertEqual((granularity, len(points), points[0]), ('week', 52, {'date': datetime.date(2024, 1, 14),
+                                                                                 'balance': 100}))
+            granularity, points = balance_series(self.user.id, datetime.date(1, 1, 2), datetime.date(9999, 12, 30),
+                                                 max_points=5)
+            self.assertEqual((granularity, points), ('year', [{'date': datetime.date(2024, 12, 31), 'balance': 145}]))
+
+        for query in ('balance-history/?to=9999-12-31', 'balance-history/?from=0001-01-01',
+                      'balance-at/?date=9999-12-31', 'transaction-history/?to=9999-12-31'):
+            self.assertEqual(self.client.get(f'/api/wallet/{query}', headers=self.headers).status_code, 400, query)
+        # ابتدای پیش‌فرض بازه (۹۰ روز قبل) هم از اولین روز مجاز عقب‌تر نمی‌رود
+        data = self.client.get('/api/wallet/balance-history/?to=0001-01-03', headers=self.headers).json()
+        self.assertEqual(data['points'], [{'date': '0001-01-02', 'balance': 0}, {'date': '0001-01-03', 'balance': 0}])
+
+
+@skipUnless(importlib.util.find_spec('numpy'), 'numpy نصب نیست')
+class LedgerReplayTests(TestCase):
+    def test_replay_rebuilds_counters(self):
+        cache.clear()
+        drifted = User.objects.create_user('drifted', password='x', current_balance=5, total_points=5)
+        clean = User.objects.create_user('clean', password='x')
+        Transaction.objects.bulk_create([
+            Transaction(user=drifted, amount=700, token_type='PERFORMANCE', description='a'),
+            Transaction(user=drifted, amount=-100, token_type='SPEND', description='b'),
+            Transaction(user=drifted, amount=-20, token_type='ADMIN', description='c'),
+            Transaction(user=drifted, amount=60, token_type='STAKING', description='d'),
+        ])
+
+        report = replay_ledger(chunk_size=3, batch_size=1)
+        self.assertEqual((report['rows'], report['users'], report['changed']), (4, 2, 1))
+        drifted.refresh_from_db()
+        self.assertEqual((drifted.current_balance, drifted.total_points, drifted.level), (640, 700, 2))
+        clean.refresh_from_db()
+        self.assertEqual((clean.current_balance, clean.total_points, clean.level), (0, 0, 1))
+
+    def test_unknown_types_and_sparse_ids(self):
+        cache.clear()
+        sparse = User.objects.create_user('sparse', password='x', id=10 ** 9)
+        # ردیف‌های قدیمی با نوعی بیرون از TOKEN_TYPES در ستون «سایر» جمع می‌شوند
+        Transaction.objects.bulk_create([
+            Transaction(user=sparse, amount=300, token_type='LEGACY', description='a'),
+            Transaction(user=sparse, amount=-50, token_type='SPEND', description='b'),
+        ])
+        report = replay_ledger()
+        self.assertEqual((report['rows'], report['users'], report['changed']), (2, 1, 1))
+        sparse.refresh_from_db()
+        self.assertEqual((sparse.current_balance, sparse.total_points), (250, 300))
+
+    def test_adjustment_rejects_unknown_types(self):
+        admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        headers = {'Authorization': f"Bearer {AccessToken.for_user(admin)}"}
+
+        def adjust(**data):
+            return self.client.post('/api/admin/wallet/adjustment/', {'user_id': admin.id, 'amount': 10, **data},
+                                    headers=headers)
+
+        self.assertEqual(adjust(type='bonus').status_code, 400)
+        self.assertEqual(adjust(amount='ten').status_code, 400)
+        self.assertEqual(adjust(user_id='x').status_code, 400)
+        self.assertEqual(adjust(type='idea').status_code, 200)
+        self.assertEqual(list(Transaction.objects.values_list('token_type', 'amount')), [('IDEA', 10)])
+
+
+class TransactionArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir, ignore_errors=True)
+        self.enterContext(override_settings(TRANSACTION_ARCHIVE_DIR=self.archive_dir))
+        self.user = User.objects.create_user('employee', password='x')
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        for day, amount, token_type in [((2024, 1, 10), 100, 'PERFORMANCE'), ((2024, 1, 20), -30, 'SPEND'),
+                                        ((2024, 2, 5), 50, 'CULTURAL'), ((2024, 3, 15), 25, 'IDEA')]:
+            tx = Transaction.objects.create(user=self.user, amount=amount, token_type=token_type, description='x')
+            Transaction.objects.filter(pk=tx.pk).update(created_at=timezone.make_aware(datetime.datetime(*day, 12)))
+        User.objects.apply_increments({self.user.id: (145, 175)})
+        self.archived = archive_old_months(hot_months=1, now=timezone.make_aware(datetime.datetime(2024, 4, 10)))
+
+    def test_old_months_move_to_files(self):
+        self.assertEqual([(p.period_start, p.rows, p.amount_total) for p in self.archived],
+                         [(datetime.date(2024, 1, 1), 2, 70), (datetime.date(2024, 2, 1), 1, 50)])
+        self.assertEqual(list(Transaction.objects.values_list('amount', flat=True)), [25])
+
+        # صفحه اول از جدول اصلی و فایل فوریه، صفحه دوم فقط از فایل ژانویه
+        page = self.client.get('/api/wallet/transaction-history/?page_size=2', headers=self.headers).json()
+        self.assertEqual([t['amount'] for t in page['results']], [25, 50])
+        page = self.client.get(f"/api/wallet/transaction-history/?page_size=2&cursor={page['next_cursor']}",
+                               headers=self.headers).json()
+        self.assertEqual(([t['amount'] for t in page['results']], page['next_cursor']), ([-30, 100], None))
+        # بازه‌ای که فقط در جدول اصلی است به فایل‌ها سر نمی‌زند
+        with mock.patch('gamification.archive.connect') as connect:
+            page = self.client.get('/api/wallet/transaction-history/?from=2024-03-01', headers=self.headers).json()
+        self.assertEqual([t['amount'] for t in page['results']], [25])
+        connect.assert_not_called()
+
+    def test_derived_data_reads_archive(self):
+        self.assertEqual(balance_on(self.user.id, datetime.date(2024, 1, 15)), 100)
+        self.assertEqual(balance_on(self.user.id, datetime.date(2024, 3, 20)), 145)
+        data = self.client.get('/api/wallet/balance-history/?from=2024-01-01&to=2024-03-31', headers=self.headers)
+        self.assertEqual([p['balance'] for p in data.json()['points'] if p['date'] in ('2024-01-14', '2024-02-29')],
+                         [100, 120])
+
+        call_command('reconcile_ledger', workers=1, stdout=io.StringIO())
+        call_command('rebuild_token_totals', stdout=io.StringIO())
+        self.assertEqual(UserTokenTotal.objects.get(user=self.user, token_type='PERFORMANCE').total, 100)
+        if importlib.util.find_spec('numpy'):
+            self.assertEqual(replay_ledger()['rows'], 4)
+            self.assertEqual(replay_ledger()['changed'], 0)
+        self.assertEqual(build_checkpoints(rebuild=True, until=timezone.make_aware(datetime.datetime(2024, 4, 1))), 3)
+        self.assertEqual(balance_on(self.user.id, datetime.date(2024, 2, 10)), 120)
+
+    def test_deleted_user_rows_leave_the_archive(self):
+        leaver = User.objects.create_user('leaver', password='x')
+        tx = Transaction.objects.create(user=leaver, amount=40, token_type='PERFORMANCE', description='x')
+        Transaction.objects.filter(pk=tx.pk).update(created_at=timezone.make_aware(datetime.datetime(2024, 3, 1, 12)))
+        archive_old_months(hot_months=0, now=timezone.make_aware(datetime.datetime(2024, 4, 10)))
+        march = ArchivedPeriod.objects.get(period_start=datetime.date(2024, 3, 1))
+        self.assertEqual((march.rows, march.amount_total), (2, 65))
+
+        # ردیف‌های جدول اصلی با CASCADE می‌روند؛ فایل بایگانی بعد از commit پاک می‌شود
+        leaver_id = leaver.id
+        with self.captureOnCommitCallbacks() as callbacks:
+            leaver.delete()
+        self.assertEqual(len(callbacks), 1)
+
+        # تا اجرای پاک‌سازی، بازسازی‌ها ردیف‌های کاربر حذف‌شده را نادیده می‌گیرند
+        call_command('rebuild_token_totals', stdout=io.StringIO())
+        self.assertEqual(build_checkpoints(rebuild=True, until=timezone.make_aware(datetime.datetime(2024, 4, 1))), 3)
+        call_command('reconcile_ledger', workers=1, stdout=io.StringIO())
+        if importlib.util.find_spec('numpy'):
+            self.assertEqual(replay_ledger()['changed'], 0)
+
+        callbacks[0]()
+        march.refresh_from_db()
+        self.assertEqual((march.rows, march.amount_total), (1, 25))
+        self.assertEqual(purge_users([leaver_id]), 0)
+        self.assertEqual([t.amount for t in history()], [25, 50, -30, 100])
@@ -1,11 +1,21 @@
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db import transaction
-from django.db.models import Sum
-from .models import Product, Transaction, StakingPlan, Badge
-from .serializers import ProductSerializer, TransactionSerializer, StakingPlanSerializer, BadgeSerializer
+from .models import Product, Transaction, StakingPlan, StakingPosition, Badge, UserTokenTotal
+from .serializers import (ProductSerializer, TransactionSerializer, StakingPlanSerializer, StakingPositionSerializer,
+                          BadgeSerializer)
+from .purchases import purchase_product, PurchaseError
+from .staking import join_staking, StakingError
+from .balances import FIRST_DAY, balance_on, balance_series, parse_day, start_of_day
+from . import archive
 from users.models import User
+from ansup_gamification.pagination import KeysetPagination
+from ansup_gamification.response_cache import cached_response
+from ansup_gamification.conditional import conditional, make_etag, queryset_version
 
 
 # --- ویوهای مربوط به کاربران عادی ---
@@ -16,6 +26,7 @@ class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
     """
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         # هر کاربر فقط تراکنش‌های خودش را ببیند
@@ -37,37 +48,19 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
             qs = qs.filter(category=category)
         return qs
 
+    @conditional(lambda view, request: make_etag('products', *queryset_version(view.get_queryset())))
+    @cached_response('products')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     @action(detail=True, methods=['post'])
     def purchase(self, request, pk=None):
         product = self.get_object()
-        user = request.user
 
-        # ۱. بررسی موجودی کالا
-        if product.stock == 0:
-            return Response({'message': 'متاسفانه موجودی این کالا تمام شده است.'}, status=400)
-
-        # ۲. بررسی پول کاربر
-        if user.current_balance < product.price:
-            return Response({'message': 'موجودی AC شما برای این خرید کافی نیست.'}, status=400)
-
-        # ۳. انجام تراکنش اتمیک (یکپارچه)
-        with transaction.atomic():
-            # کسر پول
-            user.current_balance -= product.price
-            user.save()
-
-            # کسر موجودی کالا (اگر نامحدود نباشد)
-            if product.stock > 0:
-                product.stock -= 1
-                product.save()
-
-            # ثبت در تاریخچه تراکنش‌ها
-            Transaction.objects.create(
-                user=user,
-                amount=-product.price,
-                token_type='SPEND',
-                description=f"خرید از فروشگاه: {product.title}"
-            )
+        try:
+            purchase_product(request.user, product)
+        except PurchaseError as e:
+            return Response({'message': e.message}, status=400)
 
         return Response({'message': 'خرید با موفقیت انجام شد. کد پیگیری برایتان ارسال می‌شود.'})
 
@@ -82,16 +75,7 @@ class WalletViewSet(viewsets.ViewSet):
     def summary(self, request):
         user = request.user
         # جمع‌بندی امتیازات بر اساس دسته‌بندی برای نمودار دایره‌ای/میله‌ای
-        stats = {
-            'performance': Transaction.objects.filter(user=user, token_type='PERFORMANCE').aggregate(Sum('amount'))[
-                               'amount__sum'] or 0,
-            'discipline': Transaction.objects.filter(user=user, token_type='DISCIPLINE').aggregate(Sum('amount'))[
-                              'amount__sum'] or 0,
-            'cultural': Transaction.objects.filter(user=user, token_type='CULTURAL').aggregate(Sum('amount'))[
-                            'amount__sum'] or 0,
-            'trend': Transaction.objects.filter(user=user, token_type='IDEA').aggregate(Sum('amount'))[
-                         'amount__sum'] or 0,
-        }
+        stats = UserTokenTotal.objects.summary_for(user)
         return Response({
             'balance': user.current_balance,
             'stats': stats
@@ -104,14 +88,93 @@ class WalletViewSet(viewsets.ViewSet):
         return Response(TransactionSerializer(transactions, many=True).data)
 
     @action(detail=False, methods=['get'], url_path='staking-plans')
+    @conditional(lambda view, request: make_etag('staking_plans', *queryset_version(view._active_plans())))
+    @cached_response('staking_plans')
     def staking_plans(self, request):
-        plans = StakingPlan.objects.filter(is_active=True)
+        plans = self._active_plans()
         return Response(StakingPlanSerializer(plans, many=True).data)
 
+    def _active_plans(self):
+        return StakingPlan.objects.filter(is_active=True)
+
     @action(detail=False, methods=['post'], url_path='join-staking')
     def join_staking(self, request):
-        # منطق استیکینگ (فعلا فقط یک پیام موفقیت)
-        return Response({'message': 'شما با موفقیت در این طرح سرمایه‌گذاری کردید.'})
+        try:
+            plan = self._active_plans().get(pk=request.data.get('plan_id'))
+            amount = int(request.data.get('amount'))
+        except (StakingPlan.DoesNotExist, ValueError, TypeError):
+            return Response({'message': 'طرح یا مبلغ سرمایه‌گذاری نامعتبر است.'}, status=400)
+
+        try:
+            position = join_staking(request.user, plan, amount)
+        except StakingError as e:
+            return Response({'message': e.message}, status=400)
+
+        return Response({
+            'message': 'شما با موفقیت در این طرح سرمایه‌گذاری کردید.',
+            'position': StakingPositionSerializer(position).data
+        })
+
+    @action(detail=False, methods=['get'], url_path='staking-positions')
+    def staking_positions(self, request):
+        # سرمایه‌گذاری‌های کاربر به همراه سود انباشته تا این لحظه
+        positions = StakingPosition.objects.filter(user=request.user).select_related('plan').order_by('-started_at')
+        return Response(StakingPositionSerializer(positions, many=True).data)
+
+    def _history_user_id(self, request):
+        # ادمین می‌تواند موجودی هر کاربری را ببیند، کارمند فقط خودش
+        if request.user.role == 'ADMIN' and request.query_params.get('user'):
+            return int(request.query_params['user'])
+        return request.user.id
+
+    @action(detail=False, methods=['get'], url_path='balance-at')
+    def balance_at(self, request):
+        try:
+            user_id = self._history_user_id(request)
+            date = request.query_params.get('date')
+            day = parse_day(date) if date else timezone.localdate()
+        except ValueError:
+            return Response({'error': 'تاریخ یا کاربر نامعتبر است'}, status=400)
+        return Response({'date': day, 'balance': balance_on(user_id, day)})
+
+    @action(detail=False, methods=['get'], url_path='balance-history')
+    def balance_history(self, request):
+        params = request.query_params
+        try:
+            user_id = self._history_user_id(request)
+            end = parse_day(params['to']) if params.get('to') else timezone.localdate()
+            start = (parse_day(params['from']) if params.get('from')
+                     else end - datetime.timedelta(days=min(90, (end - FIRST_DAY).days)))
+        except ValueError:
+            return Response({'error': 'پارامترهای بازه یا کاربر نامعتبر است'}, status=400)
+        if start > end:
+            return Response({'error': 'ابتدای بازه بعد از انتهای آن است'}, status=400)
+
+        granularity, points = balance_series(user_id, start, end)
+        return Response({'granularity': granularity, 'points': points})
+
+    @action(detail=False, methods=['get'], url_path='transaction-history')
+    def transaction_history(self, request):
+        # تاریخچه کامل (شامل ماه‌های بایگانی‌شده) با صفحه‌بندی کرسر؛ from/to اختیاری و شامل هر دو روز
+        params = request.query_params
+        paginator = KeysetPagination()
+        paginator.request = request
+        try:
+            user_id = self._history_user_id(request)
+            start = start_of_day(parse_day(params['from'])) if params.get('from') else None
+            end = (start_of_day(parse_day(params['to']) + datetime.timedelta(days=1))
+                   if params.get('to') else None)
+        except ValueError:
+            return Response({'error': 'پارامترهای بازه یا کاربر نامعتبر است'}, status=400)
+        before = paginator.decode_cursor(params['cursor']) if params.get('cursor') else None
+
+        size = paginator.get_page_size(request)
+        rows = archive.history(user_id, start, end, before=before, limit=size + 1)
+        paginator.next_cursor = None
+        if len(rows) > size:
+            rows = rows[:size]
+            paginator.next_cursor = paginator.encode_cursor(rows[-1].created_at, rows[-1].id)
+        return paginator.get_paginated_response(TransactionSerializer(rows, many=True).data)
 
     @action(detail=False, methods=['get'], url_path='empathy-logs')
     def empathy_logs(self, request):
@@ -132,6 +195,11 @@ class BadgeViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = BadgeSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @conditional(lambda view, request: make_etag('badges', *queryset_version(view.get_queryset())))
+    @cached_response('badges')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 # --- ویوهای مربوط به ادمین ---
 
@@ -164,33 +232,39 @@ class AdminWalletViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['post'])
     def adjustment(self, request):
         # اصلاح دستی موجودی کاربر توسط ادمین
-        user_id = request.data.get('user_id')
-        amount = int(request.data.get('amount'))
         reason = request.data.get('reason')
-        token_type = request.data.get('type', 'PERFORMANCE').upper()
-
+        token_type = str(request.data.get('type') or 'PERFORMANCE').upper()
         try:
-            user = User.objects.get(pk=user_id)
-            user.current_balance += amount
-            # اگر پاداش است، به امتیاز کل هم اضافه شود
-            if amount > 0:
-                user.total_points += amount
-            user.save()
-
-            Transaction.objects.create(
-                user=user,
-                amount=amount,
-                token_type=token_type,
-                description=f"اصلاح مدیریتی: {reason}"
-            )
-            return Response({'message': 'اصلاح موجودی انجام شد.'})
-        except User.DoesNotExist:
+            user_id = int(request.data.get('user_id'))
+            amount = int(request.data.get('amount'))
+        except (TypeError, ValueError):
+            return Response({'error': 'شناسه کاربر یا مبلغ نامعتبر است'}, status=400)
+        if token_type not in {code for code, _ in Transaction.TOKEN_TYPES}:
+            return Response({'error': 'نوع توکن نامعتبر است'}, status=400)
+
+        if not User.objects.filter(pk=user_id).exists():
             return Response({'error': 'کاربر یافت نشد'}, status=404)
 
+        try:
+            with transaction.atomic():
+                # اگر پاداش است، به امتیاز کل هم اضافه شود (لول در همان UPDATE تعیین می‌شود)
+                User.objects.apply_increments({user_id: (amount, max(amount, 0))})
+                Transaction.objects.create(
+                    user_id=user_id,
+                    amount=amount,
+                    token_type=token_type,
+                    description=f"اصلاح مدیریتی: {reason}"
+                )
+        except IntegrityError:
+            # کسر بیش از موجودی فعلی
+            return Response({'error': 'موجودی کاربر برای این کسر کافی نیست.'}, status=400)
+        return Response({'message': 'اصلاح موجودی انجام شد.'})
+
     @action(detail=False, methods=['get'])
     def transactions(self, request):
-        # مشاهده تمام تراکنش‌های سیستم برای ادمین
-        transactions = Transaction.objects.all().order_by('-created_at')[:50]
+        # مشاهده تمام تراکنش‌های سیستم برای ادمین (صفحه‌بندی با کرسر)
+        paginator = KeysetPagination()
+        transactions = paginator.paginate_queryset(Transaction.objects.select_related('user'), request, view=self)
         # سریالایزر دستی ساده برای جدول ادمین
         data = [{
             'id': t.id,
@@ -200,4 +274,4 @@ class AdminWalletViewSet(viewsets.ViewSet):
             'description': t.description,
             'created_at': t.created_at
         } for t in transactions]
-        return Response(data)
\ No newline at end of file
+        return paginator.get_paginated_response(data)
\ No newline at end of file
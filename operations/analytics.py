@@ -0,0 +1,206 @@
+"""
+آمار حضور و غیاب از روی جدول‌های تجمیعی AttendanceRollup
+
+با ثبت ردیف‌های حضور فقط روزها و ماه‌های درگیر دوباره محاسبه می‌شوند:
+روزانه شرکت از ردیف‌های همان روز، ماهانه کاربر از ردیف‌های همان کاربر در آن ماه
+و ماهانه شرکت از جمع آمار روزانه همان ماه. آمار روزانه هر کاربر همان ردیف Attendance است.
+"""
+import bisect
+import datetime
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Attendance, AttendanceRollup
+
+# لبه پایینی بازه‌های تاخیر (دقیقه)
+DELAY_BUCKETS = [0, 1, 5, 10, 15, 30, 60, 120]
+# بیشترین تعداد کاربر در هر IN هنگام بازمحاسبه ماهانه
+USER_BATCH = 500
+
+
+def month_start(date):
+    return date.replace(day=1)
+
+
+def next_month(date):
+    return (date.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+class DelayStats:
+    FIELDS = ['days', 'on_time_count', 'late_count', 'total_delay', 'max_delay', 'fines', 'points']
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+        self.delay_histogram = [0] * len(DELAY_BUCKETS)
+
+    def add_row(self, delay, status, points):
+        self.days += 1
+        if status == 'On-time':
+            self.on_time_count += 1
+        else:
+            self.late_count += 1
+        delay = max(delay, 0)
+        self.total_delay += delay
+        self.max_delay = max(self.max_delay, delay)
+        if points < 0:
+            self.fines += -points
+        self.points += points
+        self.delay_histogram[bisect.bisect_right(DELAY_BUCKETS, delay) - 1] += 1
+
+    def merge(self, other):
+        for field in self.FIELDS:
+            if field == 'max_delay':
+                self.max_delay = max(self.max_delay, other.max_delay)
+            else:
+                setattr(self, field, getattr(self, field) + getattr(other, field))
+        for i, count in enumerate(other.delay_histogram):
+            self.delay_histogram[i] += count
+
+    @classmethod
+    def from_rollup(cls, rollup):
+        stats = cls()
+        stats.merge(rollup)
+        return stats
+
+    def percentile(self, p):
+        # درون‌یابی خطی داخل بازه‌ای که صدک در آن قرار دارد
+        total = sum(self.delay_histogram)
+        if not total:
+            return 0
+        target = total * p / 100
+        seen = 0
+        for i, count in enumerate(self.delay_histogram):
+            if count and seen + count >= target:
+                lower = DELAY_BUCKETS[i]
+                upper = DELAY_BUCKETS[i + 1] if i + 1 < len(DELAY_BUCKETS) else max(self.max_delay, lower)
+                upper = min(upper, max(self.max_delay, lower))
+                return round(lower + (upper - lower) * (target - seen) / count, 1)
+            seen += count
+        return self.max_delay
+
+    def as_rollup(self, period, period_start, user_id=None):
+        return AttendanceRollup(
+            period=period, period_start=period_start, user_id=user_id,
+            delay_histogram=self.delay_histogram,
+            **{field: getattr(self, field) for field in self.FIELDS}
+        )
+
+    def as_dict(self):
+        return {
+            'days': self.days,
+            'on_time': self.on_time_count,
+            'late': self.late_count,
+            'avg_delay': round(self.total_delay / self.days, 1) if self.days else 0,
+            'p50_delay': self.percentile(50),
+            'p90_delay': self.percentile(90),
+            'fines': self.fines,
+            'points': self.points,
+        }
+
+
+def refresh_rollups(keys):
+    """
+    بازمحاسبه آمار دوره‌های مربوط به ردیف‌های تغییرکرده
+    keys: مجموعه‌ای از (user_id, date)
+    """
+    keys = set(keys)
+    refresh_periods({date for _, date in keys}, {(user_id, month_start(date)) for user_id, date in keys})
+
+
+def refresh_periods(dates, user_months):
+    """
+    بازمحاسبه آمار روزانه شرکت برای dates و ماهانه کاربر برای user_months ((user_id, ابتدای ماه))
+    هر روز و هر (کاربر، ماه) فقط یک بار پیمایش می‌شود؛ ورود گروهی همه دوره‌ها را در پایان یک بار می‌دهد
+    """
+    dates, user_months = set(dates), set(user_months)
+    if not dates and not user_months:
+        return
+    months = {month_start(date) for date in dates} | {month for _, month in user_months}
+    users_by_month = {}
+    for user_id, month in user_months:
+        users_by_month.setdefault(month, []).append(user_id)
+
+    with transaction.atomic():
+        # ۱. روزانه کل شرکت
+        daily = {date: DelayStats() for date in dates}
+        rows = Attendance.objects.filter(date__in=dates).values_list('date', 'delay_minutes', 'status', 'daily_points')
+        for date, delay, status, points in rows.iterator():
+            daily[date].add_row(delay, status, points)
+        AttendanceRollup.objects.filter(period='DAY', user__isnull=True, period_start__in=dates).delete()
+        AttendanceRollup.objects.bulk_create(
+            [stats.as_rollup('DAY', date) for date, stats in daily.items() if stats.days], batch_size=1000
+        )
+
+        # ۲. ماهانه هر کاربر؛ برای هر ماه یک IN روی کاربران (در دسته‌های USER_BATCH)
+        monthly = {key: DelayStats() for key in user_months}
+        for month, user_ids in users_by_month.items():
+            for start in range(0, len(user_ids), USER_BATCH):
+                batch = user_ids[start:start + USER_BATCH]
+                rows = (Attendance.objects.filter(user_id__in=batch, date__gte=month, date__lt=next_month(month))
+                        .values_list('user_id', 'delay_minutes', 'status', 'daily_points'))
+                for user_id, delay, status, points in rows.iterator():
+                    monthly[(user_id, month)].add_row(delay, status, points)
+                AttendanceRollup.objects.filter(period='MONTH', period_start=month, user_id__in=batch).delete()
+        AttendanceRollup.objects.bulk_create(
+            [stats.as_rollup('MONTH', month, user_id) for (user_id, month), stats in monthly.items() if stats.days],
+            batch_size=1000
+        )
+
+        # ۳. ماهانه کل شرکت از روی آمار روزانه
+        company = {month: DelayStats() for month in months}
+        month_filter = Q()
+        for month in months:
+            month_filter |= Q(period_start__gte=month, period_start__lt=next_month(month))
+        for rollup in AttendanceRollup.objects.filter(month_filter, period='DAY', user__isnull=True):
+            company[month_start(rollup.period_start)].merge(rollup)
+        AttendanceRollup.objects.filter(period='MONTH', user__isnull=True, period_start__in=months).delete()
+        AttendanceRollup.objects.bulk_create(
+            [stats.as_rollup('MONTH', month) for month, stats in company.items() if stats.days]
+        )
+
+
+def rebuild_rollups(chunk_size=5000):
+    """
+    بازسازی کامل جدول‌های تجمیعی (مثلا بعد از مهاجرت داده)
+    """
+    AttendanceRollup.objects.all().delete()
+    dates, user_months = set(), set()
+    for user_id, date in Attendance.objects.values_list('user_id', 'date').iterator(chunk_size=chunk_size):
+        dates.add(date)
+        user_months.add((user_id, month_start(date)))
+    refresh_periods(dates, user_months)
+
+
+def analytics(start, end, granularity='DAY', user_id=None):
+    """
+    سری زمانی و خلاصه آمار در بازه [start, end]
+    """
+    if granularity == 'DAY' and user_id is not None:
+        # آمار روزانه یک کاربر مستقیما همان ردیف‌های حضور است
+        series = []
+        rows = Attendance.objects.filter(user_id=user_id, date__range=(start, end)).order_by('date')
+        for row in rows.values_list('date', 'delay_minutes', 'status', 'daily_points'):
+            stats = DelayStats()
+            stats.add_row(*row[1:])
+            series.append((row[0], stats))
+    else:
+        if granularity == 'MONTH':
+            start = month_start(start)
+        rows = AttendanceRollup.objects.filter(
+            period=granularity, user_id=user_id, period_start__range=(start, end)
+        ).order_by('period_start')
+        series = [(r.period_start, DelayStats.from_rollup(r)) for r in rows]
+
+    total = DelayStats()
+    for _, stats in series:
+        total.merge(stats)
+
+    summary = total.as_dict()
+    return {
+        'chart_data': [{'date': date, **stats.as_dict()} for date, stats in series],
+        'total_fines': summary['fines'],
+        'avg_delay': summary['avg_delay'],
+        'summary': dict(summary, p99_delay=total.percentile(99)),
+    }
@@ -0,0 +1,13 @@
+"""
+نسخه async لیست ماموریت‌ها برای اجرا زیر ASGI (خروجی مشابه MissionViewSet.list)
+"""
+from ansup_gamification.async_api import async_api_view, json_response
+from .serializers import MissionSerializer
+from .views import missions_for, with_user_status
+
+
+@async_api_view
+async def mission_list(request):
+    queryset = with_user_status(missions_for(request.user, request.GET), request.user)
+    missions = [m async for m in queryset]
+    return json_response(MissionSerializer(missions, many=True, context={'request': request}).data)
@@ -0,0 +1,224 @@
+"""
+ورود فایل‌های خروجی دستگاه حضور و غیاب (XLSX یا CSV)
+
+فایل ردیف به ردیف خوانده می‌شود و ردیف‌ها در دسته‌های CHUNK_SIZE تایی پردازش می‌شوند:
+نام‌های کاربری هر دسته با یک کوئری به کاربر تبدیل می‌شوند، تاخیر/وضعیت/امتیاز روزانه
+برای کل دسته محاسبه می‌شود و دسته با یک bulk_create (upsert روی کاربر و تاریخ) ذخیره می‌شود.
+حافظه مصرفی به اندازه فایل بستگی ندارد.
+"""
+import codecs
+import csv
+import datetime
+import time
+import zipfile
+from xml.etree.ElementTree import ParseError
+
+from django.conf import settings
+from django.db import transaction
+
+from users.models import User
+from gamification.badges import touch
+from .models import Attendance
+from .analytics import month_start, refresh_periods
+
+CHUNK_SIZE = 1000
+# حداکثر تعداد خطاهایی که با جزئیات در گزارش برگردانده می‌شوند
+MAX_REPORTED_ERRORS = 100
+
+COLUMNS = ('username', 'date', 'check_in', 'check_out')
+UPDATE_FIELDS = ['check_in', 'check_out', 'delay_minutes', 'status', 'daily_points']
+
+class ImportFormatError(Exception):
+    pass
+
+
+def attendance_rules():
+    # ساعت شروع کار و قواعد امتیاز فقط در settings.ATTENDANCE_RULES تعریف می‌شوند
+    rules = dict(settings.ATTENDANCE_RULES)
+    rules['WORK_START'] = parse_time(rules['WORK_START'])
+    return rules
+
+
+def parse_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value).strip())
+
+
+def parse_time(value):
+    if isinstance(value, datetime.datetime):
+        return value.time()
+    if isinstance(value, datetime.time):
+        return value
+    text = str(value).strip()
+    for fmt in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(text, fmt).time()
+        except ValueError:
+            pass
+    raise ValueError(f"ساعت نامعتبر: {text}")
+
+
+def evaluate_check_in(check_in, rules):
+    """
+    خروجی: (delay_minutes, status, daily_points)
+    """
+    start = rules['WORK_START']
+    delay = (check_in.hour * 60 + check_in.minute) - (start.hour * 60 + start.minute)
+    if delay <= rules['GRACE_MINUTES']:
+        return 0, 'On-time', rules['ON_TIME_POINTS']
+    penalty = min(delay * rules['LATE_PENALTY_PER_MINUTE'], rules['MAX_DAILY_PENALTY'])
+    return delay, 'Late', -penalty
+
+
+def iter_rows(uploaded_file):
+    """
+    ردیف‌های فایل را یکی‌یکی (بدون خواندن کل فایل) به صورت (شماره ردیف، دیکشنری) برمی‌گرداند
+    """
+    name = (uploaded_file.name or '').lower()
+    if name.endswith('.xlsx'):
+        rows = _iter_xlsx(uploaded_file)
+    elif name.endswith('.csv'):
+        rows = _iter_csv(uploaded_file)
+    else:
+        raise ImportFormatError('فقط فایل‌های xlsx و csv پشتیبانی می‌شوند.')
+
+    header = next(rows, None)
+    if header is None:
+        raise ImportFormatError('فایل خالی است.')
+    header = [str(h or '').strip().lower() for h in header]
+    missing = [c for c in COLUMNS[:3] if c not in header]
+    if missing:
+        raise ImportFormatError(f"ستون‌های لازم وجود ندارند: {', '.join(missing)}")
+    positions = {c: header.index(c) for c in COLUMNS if c in header}
+
+    for line_no, row in enumerate(rows, start=2):
+        if not row or all(v in (None, '') for v in row):
+            continue
+        yield line_no, {c: (row[i] if i < len(row) else None) for c, i in positions.items()}
+
+
+def _iter_csv(uploaded_file):
+    rows = csv.reader(codecs.iterdecode(uploaded_file, 'utf-8-sig'))
+    line_no = 0
+    try:
+        for line_no, row in enumerate(rows, start=1):
+            yield row
+    except UnicodeDecodeError:
+        raise ImportFormatError(f"فایل csv باید با کدگذاری UTF-8 ذخیره شده باشد (ردیف {line_no + 1}).")
+    except csv.Error as e:
+        raise ImportFormatError(f"فایل csv نامعتبر است (ردیف {line_no + 1}): {e}")
+
+
+def _iter_xlsx(uploaded_file):
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise ImportFormatError('برای خواندن فایل xlsx کتابخانه openpyxl باید نصب باشد.')
+    # فایل خراب یا فایلی که فقط پسوندش xlsx است
+    broken = (InvalidFileException, zipfile.BadZipFile, KeyError, ValueError, OSError, ParseError)
+    try:
+        # حالت read_only فایل را به صورت جریانی می‌خواند
+        workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    except broken:
+        raise ImportFormatError('فایل xlsx معتبر نیست یا خراب است.')
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    except broken:
+        raise ImportFormatError('فایل xlsx معتبر نیست یا خراب است.')
+    finally:
+        workbook.close()
+
+
+class AttendanceImporter:
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.rules = attendance_rules()
+        self.user_ids = {}
+        self.rows = 0
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        # دوره‌های آماری درگیر در کل فایل؛ بعد از آخرین دسته یک بار بازمحاسبه می‌شوند
+        self.dates = set()
+        self.user_months = set()
+
+    def reject(self, line_no, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line_no, 'error': message})
+
+    def run(self, uploaded_file):
+        started = time.perf_counter()
+        chunk = []
+        try:
+            for line_no, row in iter_rows(uploaded_file):
+                self.rows += 1
+                chunk.append((line_no, row))
+                if len(chunk) >= self.chunk_size:
+                    self.process_chunk(chunk)
+                    chunk = []
+            if chunk:
+                self.process_chunk(chunk)
+        finally:
+            # دسته‌های ثبت‌شده قبل از خطای فایل هم باید در آمار بیایند
+            refresh_periods(self.dates, self.user_months)
+
+        elapsed = time.perf_counter() - started
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(self.rows / elapsed, 1) if elapsed > 0 else None,
+        }
+
+    def resolve_users(self, usernames):
+        unknown = [u for u in usernames if u not in self.user_ids]
+        if unknown:
+            found = dict(User.objects.filter(username__in=unknown).values_list('username', 'id'))
+            for username in unknown:
+                self.user_ids[username] = found.get(username)
+
+    def process_chunk(self, chunk):
+        self.resolve_users({str(row['username'] or '').strip() for _, row in chunk})
+
+        records = {}
+        for line_no, row in chunk:
+            username = str(row['username'] or '').strip()
+            user_id = self.user_ids.get(username)
+            if user_id is None:
+                self.reject(line_no, f"کاربر یافت نشد: {username}")
+                continue
+            try:
+                date = parse_date(row['date'])
+                check_in = parse_time(row['check_in'])
+                check_out = parse_time(row['check_out']) if row.get('check_out') not in (None, '') else None
+            except (TypeError, ValueError) as e:
+                self.reject(line_no, str(e))
+                continue
+
+            delay, status, points = evaluate_check_in(check_in, self.rules)
+            # ردیف تکراری (کاربر، تاریخ) در یک دسته: آخرین ردیف معتبر است
+            records[(user_id, date)] = Attendance(
+                user_id=user_id, date=date, check_in=check_in, check_out=check_out,
+                delay_minutes=delay, status=status, daily_points=points
+            )
+
+        if records:
+            with transaction.atomic():
+                Attendance.objects.bulk_create(
+                    list(records.values()),
+                    update_conflicts=True,
+                    unique_fields=['user', 'date'],
+                    update_fields=UPDATE_FIELDS,
+                )
+                touch({user_id for user_id, _ in records}, 'streak')
+            self.imported += len(records)
+            for user_id, date in records:
+                self.dates.add(date)
+                self.user_months.add((user_id, month_start(date)))
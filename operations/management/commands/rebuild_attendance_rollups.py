@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from operations.analytics import rebuild_rollups
+from operations.models import AttendanceRollup
+
+
+class Command(BaseCommand):
+    help = 'بازسازی کامل آمار تجمیعی حضور و غیاب از روی ردیف‌های Attendance'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rebuild_rollups(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"{AttendanceRollup.objects.count()} ردیف تجمیعی ساخته شد."))
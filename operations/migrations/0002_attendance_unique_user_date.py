@@ -0,0 +1,30 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:54
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def remove_duplicate_attendance(apps, schema_editor):
+    # چند ردیف برای یک (کاربر، روز): مانند ورود فایل، آخرین ردیف ثبت‌شده نگه داشته می‌شود
+    Attendance = apps.get_model('operations', 'Attendance')
+    duplicates = (Attendance.objects.values('user_id', 'date').annotate(n=Count('id'), keep=Max('id'))
+                  .filter(n__gt=1).order_by())
+    for row in duplicates:
+        Attendance.objects.filter(user_id=row['user_id'], date=row['date']).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_attendance, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='attendance',
+            unique_together={('user', 'date')},
+        ),
+    ]
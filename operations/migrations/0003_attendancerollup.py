@@ -0,0 +1,38 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0002_attendance_unique_user_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('DAY', 'روزانه'), ('MONTH', 'ماهانه')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('days', models.IntegerField(default=0)),
+                ('on_time_count', models.IntegerField(default=0)),
+                ('late_count', models.IntegerField(default=0)),
+                ('total_delay', models.IntegerField(default=0)),
+                ('max_delay', models.IntegerField(default=0)),
+                ('fines', models.IntegerField(default=0)),
+                ('points', models.IntegerField(default=0)),
+                ('delay_histogram', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'user', 'period_start'], name='attendance_rollup_user_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('period', 'period_start', 'user'), name='attendance_rollup_user_uniq'), models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('period', 'period_start'), name='attendance_rollup_company_uniq')],
+            },
+        ),
+    ]
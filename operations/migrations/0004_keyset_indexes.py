@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0003_attendancerollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='missionsubmission',
+            index=models.Index(fields=['user', '-submitted_at', '-id'], name='submission_user_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='missionsubmission',
+            index=models.Index(fields=['-submitted_at', '-id'], name='submission_submitted_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0004_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mission',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at'], name='mission_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='missionsubmission',
+            index=models.Index(fields=['user', 'status'], name='submission_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='missionsubmission',
+            index=models.Index(fields=['mission', 'user'], name='submission_mission_user_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operations', '0005_index_suite'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mission',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
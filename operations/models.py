@@ -22,6 +22,13 @@ class Mission(models.Model):
     deadline = models.CharField(max_length=50, blank=True, null=True, verbose_name="مهلت")
     is_active = models.BooleanField(default=True, verbose_name="فعال")
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # لیست ماموریت‌های فعال کارمند (ایندکس جزئی)
+            models.Index(fields=['-created_at'], condition=models.Q(is_active=True), name='mission_active_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -39,6 +46,16 @@ class MissionSubmission(models.Model):
     admin_feedback = models.TextField(blank=True, null=True)
     submitted_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # صفحه‌بندی با کرسر روی (submitted_at, id)
+            models.Index(fields=['user', '-submitted_at', '-id'], name='submission_user_submitted_idx'),
+            models.Index(fields=['-submitted_at', '-id'], name='submission_submitted_idx'),
+            models.Index(fields=['user', 'status'], name='submission_user_status_idx'),
+            # وضعیت گزارش کاربر برای هر ماموریت (annotate در لیست ماموریت‌ها)
+            models.Index(fields=['mission', 'user'], name='submission_mission_user_idx'),
+        ]
+
 
 class Attendance(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attendances')
@@ -50,6 +67,52 @@ class Attendance(models.Model):
     daily_points = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # هر کاربر در هر روز فقط یک ردیف حضور دارد (کلید upsert در ورود فایل اکسل)
+        unique_together = ('user', 'date')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # کلید قبلی ردیف برای بازمحاسبه آمار در صورت تغییر تاریخ
+        instance._loaded_key = (instance.__dict__.get('user_id'), instance.__dict__.get('date'))
+        return instance
+
+
+class AttendanceRollup(models.Model):
+    """
+    آمار تجمیعی حضور و غیاب برای داشبورد مدیریت
+    روزانه برای کل شرکت و ماهانه برای هر کاربر و کل شرکت (user خالی = کل شرکت)
+    با ثبت هر ردیف حضور فقط دوره‌های مربوط به آن دوباره محاسبه می‌شوند
+    """
+    PERIOD_CHOICES = [('DAY', 'روزانه'), ('MONTH', 'ماهانه')]
+
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                             related_name='attendance_rollups')
+    days = models.IntegerField(default=0)
+    on_time_count = models.IntegerField(default=0)
+    late_count = models.IntegerField(default=0)
+    total_delay = models.IntegerField(default=0)
+    max_delay = models.IntegerField(default=0)
+    fines = models.IntegerField(default=0)
+    points = models.IntegerField(default=0)
+    # تعداد ردیف‌ها در هر بازه تاخیر (برای محاسبه صدک‌ها)
+    delay_histogram = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start', 'user'], condition=models.Q(user__isnull=False),
+                                    name='attendance_rollup_user_uniq'),
+            models.UniqueConstraint(fields=['period', 'period_start'], condition=models.Q(user__isnull=True),
+                                    name='attendance_rollup_company_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'user', 'period_start'], name='attendance_rollup_user_idx'),
+        ]
+
 
 class TrainingSession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -0,0 +1,75 @@
+"""
+بررسی (تایید/رد) گزارش‌کارهای ماموریت به صورت گروهی
+
+همه شناسه‌ها در یک تراکنش دیتابیس پردازش می‌شوند: وضعیت‌ها با یک UPDATE،
+تراکنش‌های پاداش با bulk_create و افزایش موجودی/امتیاز هر کاربر به صورت تجمیعی.
+"""
+from django.db import transaction
+
+from users.models import User
+from users.notifications import notify_users
+from gamification.models import Transaction
+from gamification.badges import touch
+from .models import MissionSubmission
+
+# نگاشت دسته‌بندی ماموریت به نوع توکن
+CATEGORY_TOKEN_TYPES = {
+    'performance': 'PERFORMANCE', 'cultural': 'CULTURAL',
+    'discipline': 'DISCIPLINE', 'creative': 'IDEA'
+}
+
+
+def review_submissions(ids, approve, feedback=None):
+    """
+    خروجی: {submission_id: نتیجه} با یکی از مقادیر
+    approved / rejected / already_approved / not_found
+    """
+    results = {}
+    with transaction.atomic():
+        submissions = {
+            s.id: s for s in
+            MissionSubmission.objects.select_for_update().select_related('mission').filter(id__in=ids)
+        }
+
+        changed = []
+        for submission_id in ids:
+            submission = submissions.get(submission_id)
+            if submission is None:
+                results[submission_id] = 'not_found'
+            elif submission.status == 'APPROVED':
+                # گزارش تایید‌شده قبلا پاداش گرفته و دوباره تغییر نمی‌کند
+                results[submission_id] = 'already_approved'
+            else:
+                results[submission_id] = 'approved' if approve else 'rejected'
+                changed.append(submission)
+
+        if not changed:
+            return results
+
+        fields = {'status': 'APPROVED' if approve else 'REJECTED'}
+        if feedback is not None:
+            fields['admin_feedback'] = feedback
+        MissionSubmission.objects.filter(id__in=[s.id for s in changed]).update(**fields)
+
+        if approve:
+            rewards = []
+            increments = {}
+            for submission in changed:
+                reward = submission.mission.reward_ac
+                rewards.append(Transaction(
+                    user_id=submission.user_id, amount=reward,
+                    token_type=CATEGORY_TOKEN_TYPES.get(submission.mission.category, 'PERFORMANCE'),
+                    description=f"پاداش: {submission.mission.title}"
+                ))
+                balance, points = increments.get(submission.user_id, (0, 0))
+                increments[submission.user_id] = (balance + reward, points + reward)
+
+            Transaction.objects.bulk_create(rewards)
+            User.objects.apply_increments(increments)
+            touch(increments, 'missions')
+            notify_users(
+                (s.user_id, f"گزارش ماموریت «{s.mission.title}» تایید شد و {s.mission.reward_ac} AC دریافت کردید.")
+                for s in changed
+            )
+
+    return results
@@ -1,4 +1,6 @@
+from django.conf import settings
 from rest_framework import serializers
+from users.avatars import avatar_url
 from .models import Mission, MissionSubmission, Attendance, TrainingSession
 
 class MissionSerializer(serializers.ModelSerializer):
@@ -15,6 +17,9 @@ class MissionSerializer(serializers.ModelSerializer):
         }
 
     def get_user_status(self, obj):
+        # مقدار از قبل در MissionViewSet.get_queryset محاسبه شده است
+        if hasattr(obj, 'user_status'):
+            return obj.user_status or 'NOT_STARTED'
         request = self.context.get('request')
         if request and request.user and not request.user.is_anonymous:
             sub = MissionSubmission.objects.filter(mission=obj, user=request.user).first()
@@ -35,10 +40,14 @@ class MissionSubmissionSerializer(serializers.ModelSerializer):
         # اضافه کردن mission و user به لیست read_only ارور را برطرف می‌کند
         read_only_fields = ['status', 'submitted_at', 'user', 'mission']
 
+    def validate_image(self, value):
+        # مسیر اصلی آپلود (missions/<id>/submit) جریانی است؛ این محدودیت برای ساخت مستقیم گزارش است
+        if value and value.size > settings.SUBMISSION_UPLOAD_MAX_BYTES:
+            raise serializers.ValidationError('حجم فایل بیش از حد مجاز است.')
+        return value
+
     def get_user_avatar(self, obj):
-        if obj.user.avatar:
-            return obj.user.avatar.url
-        return None
+        return avatar_url(obj.user)
 
 class AttendanceSerializer(serializers.ModelSerializer):
     name = serializers.ReadOnlyField(source='user.username')
@@ -67,6 +76,4 @@ class TrainingSessionSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_user_avatar(self, obj):
-        if obj.user.avatar:
-            return obj.user.avatar.url
-        return None
\ No newline at end of file
+        return avatar_url(obj.user)
\ No newline at end of file
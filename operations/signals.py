@@ -0,0 +1,33 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ansup_gamification import response_cache
+from gamification.badges import touch
+from .models import Attendance, MissionSubmission, TrainingSession
+from .analytics import refresh_rollups
+
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def refresh_attendance_rollups(sender, instance, **kwargs):
+    keys = {(instance.user_id, instance.date)}
+    # اگر تاریخ یا کاربر ردیف عوض شده، دوره قبلی هم باید بازمحاسبه شود
+    if getattr(instance, '_loaded_key', None):
+        keys.add(instance._loaded_key)
+    refresh_rollups(keys)
+    instance._loaded_key = (instance.user_id, instance.date)
+    touch([instance.user_id], 'streak')
+
+
+@receiver(post_save, sender=MissionSubmission)
+def check_mission_badges(sender, instance, **kwargs):
+    # تایید گروهی در reviews.py با UPDATE انجام می‌شود و خودش touch را صدا می‌زند
+    if instance.status == 'APPROVED':
+        touch([instance.user_id], 'missions')
+
+
+@receiver(post_save, sender=TrainingSession)
+@receiver(post_delete, sender=TrainingSession)
+def invalidate_training_catalog(sender, instance, **kwargs):
+    # فقط بخش «آموزش فعال» کاتالوگ همان کاربر تغییر می‌کند
+    response_cache.invalidate('training', user_id=instance.user_id)
@@ -1,3 +1,364 @@
-from django.test import TestCase
+import datetime
+import io
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from ansup_gamification.explain import QueryPlanAssertionsMixin
+from gamification.models import Transaction
+from users.models import User
+from .analytics import DelayStats, rebuild_rollups, refresh_periods
+from .attendance import AttendanceImporter, ImportFormatError
+from .models import Mission, MissionSubmission, Attendance, AttendanceRollup
+from .views import MissionSubmissionViewSet
+
+
+class MissionListQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('employee', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_missions(self, count):
+        for i in range(count):
+            mission = Mission.objects.create(title=f"ماموریت {i}", reward_ac=10)
+            if i % 2:
+                MissionSubmission.objects.create(user=self.user, mission=mission, status='REJECTED')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx), response.json()
+
+    def test_query_count_does_not_grow_with_missions(self):
+        self.create_missions(2)
+        few, _ = self.count_queries('/api/missions/')
+        self.create_missions(20)
+        many, data = self.count_queries('/api/missions/')
+
+        self.assertEqual(few, many)
+        self.assertEqual(len(data), 22)
+        self.assertEqual({m['user_status'] for m in data}, {'NOT_STARTED', 'REJECTED'})
+
+    def test_admin_list_reports_own_status(self):
+        admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        mission = Mission.objects.create(title='ماموریت', reward_ac=10)
+        MissionSubmission.objects.create(user=admin, mission=mission)
+        self.client.force_authenticate(admin)
+
+        _, data = self.count_queries('/api/missions/')
+        self.assertEqual(data[0]['user_status'], 'PENDING')
+
+
+class HotQueryPlanTests(QueryPlanAssertionsMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('employee', password='x')
+
+    def test_submissions_by_status(self):
+        qs = MissionSubmission.objects.filter(user=self.user, status='PENDING')
+        self.assertUsesIndex(qs, 'submission_user_status_idx')
+
+    def test_submission_status_per_mission(self):
+        qs = MissionSubmission.objects.filter(mission_id=1, user=self.user)
+        self.assertUsesIndex(qs, 'submission_mission_user_idx')
+
+    def test_attendance_by_user_and_date(self):
+        # ایندکس یکتای (user, date) این کوئری‌ها را پوشش می‌دهد
+        self.assertNoFullScan(Attendance.objects.filter(user=self.user, date='2026-01-01'))
+        self.assertNoFullScan(Attendance.objects.filter(user=self.user).order_by('-date')[:20])
+
+    def test_active_missions(self):
+        qs = Mission.objects.filter(is_active=True).order_by('-created_at')
+        self.assertUsesIndex(qs, 'mission_active_idx')
+
+
+class SubmissionUploadTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media, SUBMISSION_UPLOAD_MAX_BYTES=64 * 1024)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+        self.mission = Mission.objects.create(title='ماموریت', reward_ac=10)
+
+    def submit(self, username, content, name='evidence.png'):
+        user = User.objects.create_user(username, password='x')
+        self.client.force_authenticate(user)
+        upload = SimpleUploadedFile(name, content, content_type='image/png')
+        return self.client.post(f'/api/missions/{self.mission.id}/submit/',
+                                {'description': 'done', 'image': upload}, format='multipart')
+
+    def png(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (50, 50), 'green').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_identical_files_are_stored_once(self):
+        self.assertEqual(self.submit('a', self.png()).status_code, 201)
+        self.assertEqual(self.submit('b', self.png(), name='other.png').status_code, 201)
+
+        names = {s.image.name for s in MissionSubmission.objects.all()}
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names.pop().startswith('submissions/'))
+        dirs, _ = default_storage.listdir('submissions')
+        self.assertEqual(len(dirs), 1)
+        self.assertEqual(len(default_storage.listdir(f'submissions/{dirs[0]}')[1]), 1)
+
+    def test_rejects_wrong_type_and_oversized_files(self):
+        response = self.submit('a', b'%PDF-1.4 not an image at all')
+        self.assertEqual(response.status_code, 400)
+        response = self.submit('b', b'\x89PNG\r\n\x1a\n' + b'\0' * 100 * 1024)
+        self.assertIn(response.status_code, (400, 413))
+        self.assertFalse(MissionSubmission.objects.exists())
+
+
+class BulkReviewTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        self.user = User.objects.create_user('employee', password='x')
+        self.other = User.objects.create_user('other', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.kpi = Mission.objects.create(title='kpi', reward_ac=30, category='performance')
+        self.idea = Mission.objects.create(title='idea', reward_ac=20, category='creative')
+
+    def submit(self, user, mission, status='PENDING'):
+        return MissionSubmission.objects.create(user=user, mission=mission, status=status).id
+
+    def review(self, ids, action='approve', format='json'):
+        return self.client.post('/api/submissions/bulk-review/', {'action': action, 'ids': ids}, format=format)
+
+    def test_results_and_rewards(self):
+        first, second = self.submit(self.user, self.kpi), self.submit(self.user, self.idea)
+        third = self.submit(self.other, self.kpi, status='REJECTED')
+        done = self.submit(self.other, self.idea, status='APPROVED')
+
+        response = self.review([first, second, str(third), done, 99999, first])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'processed': 3, 'results': [
+            {'id': first, 'result': 'approved'}, {'id': second, 'result': 'approved'},
+            {'id': third, 'result': 'approved'}, {'id': done, 'result': 'already_approved'},
+            {'id': 99999, 'result': 'not_found'},
+        ]})
+
+        # پاداش‌های یک کاربر تجمیعی به موجودی و امتیاز اضافه می‌شوند
+        self.user.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.user.current_balance, self.user.total_points), (50, 50))
+        self.assertEqual((self.other.current_balance, self.other.total_points), (30, 30))
+        self.assertEqual(sorted(Transaction.objects.values_list('user_id', 'token_type', 'amount')),
+                         sorted([(self.user.id, 'PERFORMANCE', 30), (self.user.id, 'IDEA', 20),
+                                 (self.other.id, 'PERFORMANCE', 30)]))
+
+        # رد گروهی گزارش تایید‌شده را تغییر نمی‌دهد و پاداشی ثبت نمی‌کند
+        pending = self.submit(self.other, self.idea)
+        response = self.review([first, pending], action='reject')
+        self.assertEqual(response.json()['processed'], 1)
+        self.assertEqual(MissionSubmission.objects.get(id=pending).status, 'REJECTED')
+        self.assertEqual(MissionSubmission.objects.get(id=first).status, 'APPROVED')
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_invalid_ids_and_limit(self):
+        submission = self.submit(self.user, self.kpi)
+        for ids in ['12', [], ['x'], [1.5], [True], {'id': 1}]:
+            self.assertEqual(self.review(ids).status_code, 400, ids)
+        self.assertEqual(self.review([submission], action='delete').status_code, 400)
+
+        with mock.patch.object(MissionSubmissionViewSet, 'BULK_REVIEW_LIMIT', 2):
+            self.assertEqual(self.review([submission, submission + 1, submission + 2]).status_code, 400)
+            self.assertEqual(self.review([submission, submission, submission]).status_code, 200)
+        self.assertFalse(Transaction.objects.exclude(amount=30).exists())
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.review([submission]).status_code, 403)
+
+    def test_form_encoded_ids_are_not_split_into_characters(self):
+        submission = self.submit(self.user, self.kpi)
+        response = self.review([submission], format='multipart')
+        self.assertEqual(response.json()['results'], [{'id': submission, 'result': 'approved'}])
+        # "12" یک شناسه است، نه 1 و 2
+        response = self.client.post('/api/submissions/bulk-review/', f'action=approve&ids={submission}0',
+                                    content_type='application/x-www-form-urlencoded')
+        self.assertEqual(response.json()['results'], [{'id': submission * 10, 'result': 'not_found'}])
+        self.assertEqual(Transaction.objects.count(), 1)
+
+
+class AttendanceImportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        self.ali = User.objects.create_user('ali', password='x')
+        self.sara = User.objects.create_user('sara', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def upload(self, name, content):
+        return self.client.post('/api/attendance/upload-excel/', {'file': SimpleUploadedFile(name, content)},
+                                format='multipart')
+
+    def csv_file(self, *rows):
+        return '\n'.join(['username,date,check_in,check_out', *rows]).encode('utf-8')
+
+    def records(self):
+        return list(Attendance.objects.order_by('user_id', 'date')
+                    .values_list('user__username', 'date', 'delay_minutes', 'status', 'daily_points'))
+
+    def test_csv_rows_and_errors(self):
+        response = self.upload('day.csv', self.csv_file(
+            'ali,2024-01-10,08:00,17:00',
+            'sara,2024-01-10,08:25:00,',
+            ',,,',
+            'nobody,2024-01-10,08:00,',
+            'ali,2024-13-01,08:00,',
+            'ali,2024-01-11,late,',
+            'sara,2024-01-11,10:30,',
+        ))
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report['rows'], report['imported'], report['rejected']), (6, 3, 3))
+        # شماره ردیف‌ها با احتساب سرستون و ردیف خالی
+        self.assertEqual([e['row'] for e in report['errors']], [5, 6, 7])
+        self.assertEqual(self.records(), [
+            ('ali', datetime.date(2024, 1, 10), 0, 'On-time', 10),
+            ('sara', datetime.date(2024, 1, 10), 25, 'Late', -25),
+            ('sara', datetime.date(2024, 1, 11), 150, 'Late', -60),
+        ])
+
+    def test_reimport_updates_existing_rows(self):
+        self.upload('day.csv', self.csv_file('ali,2024-01-10,09:00,'))
+        # ردیف تکراری در یک فایل: آخرین ردیف معتبر است
+        response = self.upload('fix.csv', self.csv_file('ali,2024-01-10,08:30,', 'ali,2024-01-10,07:55,17:00'))
+        self.assertEqual(response.json()['imported'], 1)
+        row = Attendance.objects.get()
+        self.assertEqual((row.status, row.daily_points, row.check_out), ('On-time', 10, datetime.time(17)))
+
+    @override_settings(ATTENDANCE_RULES={'WORK_START': '09:00', 'GRACE_MINUTES': 5, 'ON_TIME_POINTS': 3,
+                                         'LATE_PENALTY_PER_MINUTE': 2, 'MAX_DAILY_PENALTY': 100})
+    def test_rules_come_from_settings(self):
+        self.upload('day.csv', self.csv_file('ali,2024-01-10,09:05,', 'sara,2024-01-10,09:20,'))
+        self.assertEqual([r[3:] for r in self.records()], [('On-time', 3), ('Late', -40)])
+
+    def test_xlsx(self):
+        from openpyxl import Workbook
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['Username', 'Date', 'Check_In'])
+        sheet.append(['ali', datetime.date(2024, 1, 10), datetime.time(8, 10)])
+        sheet.append(['sara', '2024-01-10', '07:50'])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+
+        response = self.upload('day.xlsx', buffer.getvalue())
+        self.assertEqual(response.json()['imported'], 2)
+        self.assertEqual([r[3:] for r in self.records()], [('Late', -10), ('On-time', 10)])
+
+    def test_unreadable_files_are_rejected(self):
+        cases = [
+            ('day.csv', 'username,date,check_in\nعلي,2024-01-10,08:00\n'.encode('cp1256')),
+            ('day.xlsx', b'not a zip archive'),
+            ('day.xlsx', self.csv_file('ali,2024-01-10,08:00,')),
+            ('day.csv', b'user,day\nali,2024-01-10\n'),
+            ('day.txt', b''),
+            ('day.csv', b''),
+        ]
+        for name, content in cases:
+            self.assertEqual(self.upload(name, content).status_code, 400, name)
+        self.assertFalse(Attendance.objects.exists())
+
+
+class AttendanceRollupTests(TestCase):
+    def setUp(self):
+        self.ali = User.objects.create_user('ali', password='x')
+        self.sara = User.objects.create_user('sara', password='x')
+
+    def add(self, user, day, delay):
+        status, points = ('On-time', 10) if delay == 0 else ('Late', -delay)
+        return Attendance.objects.create(user=user, date=datetime.date(2024, *day), check_in=datetime.time(8),
+                                         delay_minutes=delay, status=status, daily_points=points)
+
+    def snapshot(self):
+        fields = ['period', 'period_start', 'user_id', *DelayStats.FIELDS, 'delay_histogram']
+        return sorted(AttendanceRollup.objects.values_list(*fields), key=repr)
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        rebuild_rollups(chunk_size=2)
+        self.assertEqual(incremental, self.snapshot())
+        return incremental
+
+    def test_incremental_refresh_matches_full_rebuild(self):
+        self.add(self.ali, (1, 10), 0)
+        self.add(self.ali, (1, 11), 12)
+        row = self.add(self.sara, (1, 10), 40)
+        self.add(self.sara, (2, 1), 3)
+        rollups = self.assertMatchesRebuild()
+        self.assertEqual(len([r for r in rollups if r[0] == 'DAY']), 3)
+
+        # ویرایش با جابه‌جایی ماه: هر دو دوره قبلی و جدید بازمحاسبه می‌شوند
+        row = Attendance.objects.get(pk=row.pk)
+        row.date, row.delay_minutes, row.daily_points = datetime.date(2024, 2, 2), 70, -60
+        row.save()
+        self.assertMatchesRebuild()
+
+        Attendance.objects.get(user=self.ali, date=datetime.date(2024, 1, 11)).delete()
+        self.assertMatchesRebuild()
+
+        content = 'username,date,check_in\nali,2024-01-10,08:30\nsara,2024-03-05,08:00\nali,2024-02-01,09:15\n'
+        AttendanceImporter(chunk_size=2).run(SimpleUploadedFile('day.csv', content.encode()))
+        rollups = self.assertMatchesRebuild()
+
+        company = {r[1]: r for r in rollups if r[0] == 'MONTH' and r[2] is None}
+        self.assertEqual(sorted(company), [datetime.date(2024, m, 1) for m in (1, 2, 3)])
+        # (days, on_time, late, total_delay, max_delay, fines, points) ماه فوریه کل شرکت
+        self.assertEqual(company[datetime.date(2024, 2, 1)][3:10], (3, 0, 3, 148, 75, 123, -123))
+
+    def test_import_refreshes_each_period_once(self):
+        rows = [f"{name},2024-01-{day:02d},08:{day:02d}" for day in range(1, 6) for name in ('ali', 'sara')]
+        content = '\n'.join(['username,date,check_in', *rows]).encode()
+        with mock.patch('operations.attendance.refresh_periods', wraps=refresh_periods) as refresh:
+            report = AttendanceImporter(chunk_size=3).run(SimpleUploadedFile('days.csv', content))
+        self.assertEqual(report['imported'], 10)
+        # یک بازمحاسبه بعد از آخرین دسته به جای یکی برای هر دسته
+        refresh.assert_called_once()
+        dates, user_months = refresh.call_args.args
+        self.assertEqual(len(dates), 5)
+        self.assertEqual(user_months, {(self.ali.id, datetime.date(2024, 1, 1)),
+                                       (self.sara.id, datetime.date(2024, 1, 1))})
+        self.assertMatchesRebuild()
+
+        # خطای فایل بعد از ثبت چند دسته: دسته‌های ثبت‌شده همچنان در آمار می‌آیند
+        content = b'username,date,check_in\nali,2024-02-01,08:00\nali,2024-02-02,08:00\nsara,2024-02-03,\xff\n'
+        with self.assertRaises(ImportFormatError):
+            AttendanceImporter(chunk_size=1).run(SimpleUploadedFile('bad.csv', content))
+        self.assertTrue(AttendanceRollup.objects.filter(period='DAY', period_start=datetime.date(2024, 2, 2)).exists())
+        self.assertMatchesRebuild()
+
+    def test_histogram_buckets_and_percentiles(self):
+        stats = DelayStats()
+        for delay in [0, 1, 4, 5, 9, 10, 119, 120, 500, -3]:
+            stats.add_row(delay, 'Late' if delay > 0 else 'On-time', 0)
+        # لبه پایینی هر بازه داخل همان بازه است؛ تاخیر منفی صفر حساب می‌شود
+        self.assertEqual(stats.delay_histogram, [2, 2, 2, 1, 0, 0, 1, 2])
+
+        stats = DelayStats()
+        for delay in [0, 0, 10, 10]:
+            stats.add_row(delay, 'On-time' if delay == 0 else 'Late', 0)
+        self.assertEqual(stats.percentile(50), 1.0)
+        # سقف بازه به بیشترین تاخیر دیده‌شده محدود می‌شود
+        self.assertEqual(stats.percentile(90), 10.0)
+        self.assertEqual(DelayStats().percentile(50), 0)
+
+        stats = DelayStats()
+        for delay in [130, 300]:
+            stats.add_row(delay, 'Late', 0)
+        # آخرین بازه سقف ندارد و تا max_delay درون‌یابی می‌شود
+        self.assertEqual((stats.percentile(50), stats.percentile(100)), (210.0, 300.0))
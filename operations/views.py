@@ -1,8 +1,8 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db import transaction
-from django.db.models import Q, Sum, Avg
+from django.db.models import Q, Sum, Avg, OuterRef, Subquery
+from django.conf import settings
 from django.utils import timezone
 import datetime
 
@@ -13,7 +13,52 @@ from .serializers import (
     AttendanceSerializer,
     TrainingSessionSerializer
 )
-from gamification.models import Transaction
+from ansup_gamification.pagination import KeysetPagination
+from ansup_gamification import response_cache
+from ansup_gamification.hashed_files import store_hashed
+from ansup_gamification.uploads import HashingUploadHandler, FORM_OVERHEAD_BYTES
+from .reviews import review_submissions
+from .attendance import AttendanceImporter, ImportFormatError
+from .analytics import analytics as attendance_analytics
+
+
+def missions_for(user, params):
+    """
+    ماموریت‌های قابل نمایش برای کاربر بر اساس نقش و پارامتر status
+    """
+    # --- اگر کاربر ادمین است ---
+    if user.role == 'ADMIN':
+        status_param = params.get('status')
+        qs = Mission.objects.all().order_by('-created_at')
+        if status_param == 'active':
+            return qs.filter(is_active=True)
+        elif status_param == 'completed':
+            return qs.filter(is_active=False)
+        return qs
+
+    # --- اگر کاربر کارمند است ---
+    status_param = params.get('status', 'active')
+    user_subs = MissionSubmission.objects.filter(user=user)
+
+    if status_param == 'completed':
+        ids = user_subs.filter(status='APPROVED').values_list('mission_id', flat=True)
+        return Mission.objects.filter(id__in=ids)
+
+    elif status_param == 'pending':
+        ids = user_subs.filter(status='PENDING').values_list('mission_id', flat=True)
+        return Mission.objects.filter(id__in=ids)
+
+    else:  # active (پیش‌فرض)
+        done_ids = user_subs.filter(status__in=['PENDING', 'APPROVED']).values_list('mission_id', flat=True)
+        return Mission.objects.filter(is_active=True).exclude(id__in=done_ids).order_by('-created_at')
+
+
+def with_user_status(queryset, user):
+    # وضعیت گزارش کاربر جاری برای هر ماموریت در همان کوئری لیست (جلوگیری از N+1 در سریالایزر)
+    user_status = MissionSubmission.objects.filter(
+        mission=OuterRef('pk'), user=user
+    ).order_by('pk').values('status')[:1]
+    return queryset.annotate(user_status=Subquery(user_status))
 
 
 # --- 1. مدیریت هوشمند ماموریت‌ها ---
@@ -27,33 +72,10 @@ class MissionViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        user = self.request.user
-
-        # --- اگر کاربر ادمین است ---
-        if user.role == 'ADMIN':
-            status_param = self.request.GET.get('status')
-            qs = Mission.objects.all().order_by('-created_at')
-            if status_param == 'active':
-                return qs.filter(is_active=True)
-            elif status_param == 'completed':
-                return qs.filter(is_active=False)
-            return qs
-
-        # --- اگر کاربر کارمند است ---
-        status_param = self.request.GET.get('status', 'active')
-        user_subs = MissionSubmission.objects.filter(user=user)
-
-        if status_param == 'completed':
-            ids = user_subs.filter(status='APPROVED').values_list('mission_id', flat=True)
-            return Mission.objects.filter(id__in=ids)
-
-        elif status_param == 'pending':
-            ids = user_subs.filter(status='PENDING').values_list('mission_id', flat=True)
-            return Mission.objects.filter(id__in=ids)
-
-        else:  # active (پیش‌فرض)
-            done_ids = user_subs.filter(status__in=['PENDING', 'APPROVED']).values_list('mission_id', flat=True)
-            return Mission.objects.filter(is_active=True).exclude(id__in=done_ids).order_by('-created_at')
+        return with_user_status(self._missions_queryset(), self.request.user)
+
+    def _missions_queryset(self):
+        return missions_for(self.request.user, self.request.GET)
 
     def create(self, request, *args, **kwargs):
         # فقط ادمین اجازه ساخت ماموریت دارد
@@ -64,6 +86,19 @@ class MissionViewSet(viewsets.ModelViewSet):
     # اکشن ثبت گزارش کار (مخصوص کارمندان)
     @action(detail=True, methods=['post'], url_path='submit')
     def report_mission(self, request, pk=None):
+        max_bytes = settings.SUBMISSION_UPLOAD_MAX_BYTES
+        # رد درخواست‌های خیلی بزرگ قبل از خواندن بدنه
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > max_bytes + FORM_OVERHEAD_BYTES:
+            return Response({'error': 'حجم فایل بیش از حد مجاز است.'}, status=413)
+
+        # بدنه فقط بعد از این خط (اولین دسترسی به request.data) خوانده می‌شود
+        upload_handler = HashingUploadHandler(['image'], max_bytes, request=request._request)
+        request._request.upload_handlers = [upload_handler, *request._request.upload_handlers]
+
         mission = self.get_object()
 
         # بررسی تکراری نبودن گزارش
@@ -71,11 +106,19 @@ class MissionViewSet(viewsets.ModelViewSet):
                                             status__in=['PENDING', 'APPROVED']).exists():
             return Response({'error': 'گزارش این ماموریت قبلا ثبت شده است.'}, status=400)
 
-        serializer = MissionSubmissionSerializer(data=request.data)
+        # فایل جدا از سریالایزر و بر اساس هش محتوا ذخیره می‌شود (فایل‌های تکراری یک بار ذخیره می‌شوند)
+        data = {key: value for key, value in request.data.items() if key != 'image'}
+        if upload_handler.error:
+            return Response({'error': upload_handler.error}, status=400)
+        serializer = MissionSubmissionSerializer(data=data)
 
         # حالا سریالایزر بدون نیاز به فیلد mission معتبر (valid) می‌شود
         if serializer.is_valid():
-            serializer.save(user=request.user, mission=mission)
+            image = request.FILES.get('image')
+            extra = {}
+            if image is not None:
+                extra['image'], _ = store_hashed(image, 'submissions', digest=image.sha256, ext=image.extension)
+            serializer.save(user=request.user, mission=mission, **extra)
             return Response({'message': 'ثبت شد!'}, status=201)
 
         return Response(serializer.errors, status=400)
@@ -95,11 +138,15 @@ class AdminMissionViewSet(MissionViewSet):
 class MissionSubmissionViewSet(viewsets.ModelViewSet):
     serializer_class = MissionSubmissionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    cursor_field = 'submitted_at'
+    BULK_REVIEW_LIMIT = 1000
 
     def get_queryset(self):
+        qs = MissionSubmission.objects.select_related('user', 'mission')
         if self.request.user.role == 'ADMIN':
-            return MissionSubmission.objects.all().order_by('-submitted_at')
-        return MissionSubmission.objects.filter(user=self.request.user)
+            return qs.order_by('-submitted_at')
+        return qs.filter(user=self.request.user)
 
     @action(detail=True, methods=['post'], url_path='approve')
     def approve(self, request, pk=None):
@@ -107,39 +154,46 @@ class MissionSubmissionViewSet(viewsets.ModelViewSet):
             return Response({'error': 'دسترسی غیرمجاز'}, status=403)
 
         submission = self.get_object()
-        if submission.status == 'APPROVED':
+        if review_submissions([submission.id], approve=True)[submission.id] == 'already_approved':
             return Response({'message': 'قبلا تایید شده'}, status=400)
 
-        with transaction.atomic():
-            submission.status = 'APPROVED'
-            submission.save()
-
-            # واریز پاداش
-            reward = submission.mission.reward_ac
-            user = submission.user
-
-            # نگاشت دسته‌بندی به نوع توکن
-            cat_map = {
-                'performance': 'PERFORMANCE', 'cultural': 'CULTURAL',
-                'discipline': 'DISCIPLINE', 'creative': 'IDEA'
-            }
-            t_type = cat_map.get(submission.mission.category, 'PERFORMANCE')
-
-            Transaction.objects.create(
-                user=user, amount=reward, token_type=t_type,
-                description=f"پاداش: {submission.mission.title}"
-            )
-
         return Response({'message': 'تایید و واریز شد'})
 
     @action(detail=True, methods=['post'], url_path='reject')
     def reject(self, request, pk=None):
         if request.user.role != 'ADMIN': return Response({'error': 'دسترسی غیرمجاز'}, status=403)
         submission = self.get_object()
-        submission.status = 'REJECTED'
-        submission.save()
+        if review_submissions([submission.id], approve=False)[submission.id] == 'already_approved':
+            return Response({'message': 'گزارش تایید‌شده قابل رد نیست'}, status=400)
         return Response({'message': 'رد شد'})
 
+    # تایید/رد گروهی گزارش‌ها در یک درخواست
+    @action(detail=False, methods=['post'], url_path='bulk-review')
+    def bulk_review(self, request):
+        if request.user.role != 'ADMIN':
+            return Response({'error': 'دسترسی غیرمجاز'}, status=403)
+
+        decision = request.data.get('action')
+        if decision not in ('approve', 'reject'):
+            return Response({'error': 'action باید approve یا reject باشد'}, status=400)
+
+        # ids باید لیست باشد؛ رشته "12" نباید به صورت کاراکتر به کاراکتر (1 و 2) خوانده شود
+        raw_ids = request.data.getlist('ids') if hasattr(request.data, 'getlist') else request.data.get('ids', [])
+        try:
+            if not isinstance(raw_ids, list) or any(isinstance(i, (bool, float)) for i in raw_ids):
+                raise TypeError
+            ids = list(dict.fromkeys(int(i) for i in raw_ids))
+        except (TypeError, ValueError):
+            return Response({'error': 'لیست شناسه‌ها نامعتبر است'}, status=400)
+        if not ids or len(ids) > self.BULK_REVIEW_LIMIT:
+            return Response({'error': f'بین ۱ تا {self.BULK_REVIEW_LIMIT} شناسه ارسال کنید'}, status=400)
+
+        results = review_submissions(ids, approve=decision == 'approve', feedback=request.data.get('feedback'))
+        return Response({
+            'results': [{'id': i, 'result': results[i]} for i in ids],
+            'processed': sum(1 for r in results.values() if r in ('approved', 'rejected'))
+        })
+
 
 # --- 3. مدیریت حضور و غیاب ---
 
@@ -154,11 +208,38 @@ class AttendanceViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'], url_path='upload-excel')
     def upload_excel(self, request):
-        return Response({'message': 'فایل پردازش شد'})
+        if request.user.role != 'ADMIN':
+            return Response({'error': 'دسترسی غیرمجاز'}, status=403)
+        if 'file' not in request.FILES:
+            return Response({'error': 'فایلی ارسال نشده است'}, status=400)
+
+        try:
+            report = AttendanceImporter().run(request.FILES['file'])
+        except ImportFormatError as e:
+            return Response({'error': str(e)}, status=400)
+        return Response({'message': 'فایل پردازش شد', **report})
 
     @action(detail=False, methods=['get'])
     def analytics(self, request):
-        return Response({'chart_data': [], 'total_fines': 0, 'avg_delay': 0})
+        params = request.query_params
+        granularity = params.get('granularity', 'day').upper()
+        if granularity not in ('DAY', 'MONTH'):
+            return Response({'error': 'granularity باید day یا month باشد'}, status=400)
+
+        try:
+            end = datetime.date.fromisoformat(params['to']) if params.get('to') else timezone.localdate()
+            default_days = 365 if granularity == 'MONTH' else 30
+            start = (datetime.date.fromisoformat(params['from']) if params.get('from')
+                     else end - datetime.timedelta(days=default_days))
+            user_id = int(params['user']) if params.get('user') else None
+        except ValueError:
+            return Response({'error': 'پارامترهای بازه یا کاربر نامعتبر است'}, status=400)
+
+        # کارمند فقط آمار خودش را می‌بیند
+        if request.user.role != 'ADMIN':
+            user_id = request.user.id
+
+        return Response(attendance_analytics(start, end, granularity, user_id))
 
     @action(detail=False, methods=['get'])
     def logs(self, request):
@@ -185,13 +266,16 @@ class TrainingSessionViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def catalog(self, request):
-        active = TrainingSession.objects.filter(user=request.user, end_time__isnull=True).first()
+        # زمان باقی‌مانده هر بار محاسبه می‌شود؛ فقط جستجوی آموزش فعال کاربر کش می‌شود
+        active = response_cache.get_or_compute(
+            'training', 'active', lambda: self._active_session(request.user), user_id=request.user.pk
+        )
         active_data = None
 
         if active:
-            course_id = next((k for k, v in self.COURSES.items() if v['title'] == active.topic), None)
+            course_id = next((k for k, v in self.COURSES.items() if v['title'] == active['topic']), None)
             if course_id:
-                elapsed = (timezone.now() - active.start_time).total_seconds()
+                elapsed = (timezone.now() - active['start_time']).total_seconds()
                 total_seconds = self.COURSES[course_id]['duration_minutes'] * 60
                 remaining = total_seconds - elapsed
 
@@ -202,6 +286,11 @@ class TrainingSessionViewSet(viewsets.ModelViewSet):
 
         return Response({'all_trainings': list(self.COURSES.values()), 'active_session': active_data})
 
+    def _active_session(self, user):
+        # دیکشنری خالی یعنی آموزش فعالی ندارد (None در کش ذخیره نمی‌شود)
+        active = TrainingSession.objects.filter(user=user, end_time__isnull=True).first()
+        return {'topic': active.topic, 'start_time': active.start_time} if active else {}
+
     @action(detail=True, methods=['post'])
     def start(self, request, pk=None):
         try:
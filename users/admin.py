@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Message
+from .models import User, Message, Broadcast, Notification, LevelThreshold
 
 
 # تنظیمات نمایش کاربر سفارشی در پنل ادمین
@@ -36,6 +36,28 @@ class MessageAdmin(admin.ModelAdmin):
     search_fields = ['subject', 'body', 'sender__username', 'recipient__username']
 
 
+# تنظیمات نمایش پیام‌های همگانی
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ['sender', 'audience', 'subject', 'created_at']
+    list_filter = ['audience', 'created_at']
+    search_fields = ['subject', 'body']
+
+
+# تنظیمات نمایش صف اعلان‌های تلگرام
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['chat_id', 'user', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['chat_id', 'user__username', 'text']
+
+
+# منحنی لول؛ بعد از تغییر، دستور relevel_users را اجرا کنید
+class LevelThresholdAdmin(admin.ModelAdmin):
+    list_display = ['level', 'min_points']
+
+
 # ثبت مدل‌ها
 admin.site.register(User, CustomUserAdmin)
-admin.site.register(Message, MessageAdmin)
\ No newline at end of file
+admin.site.register(Message, MessageAdmin)
+admin.site.register(Broadcast, BroadcastAdmin)
+admin.site.register(Notification, NotificationAdmin)
+admin.site.register(LevelThreshold, LevelThresholdAdmin)
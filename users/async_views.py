@@ -0,0 +1,67 @@
+"""
+نسخه async اندپوینت‌های پرتکرار کاربران (me، داشبورد، لیدربرد) برای اجرا زیر ASGI
+خروجی‌ها با اکشن‌های هم‌نام UserViewSet یکسان هستند.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotModified
+
+from ansup_gamification.async_api import async_api_view, json_response
+from ansup_gamification.conditional import etag_matches, make_etag
+from gamification.models import UserTokenTotal
+from . import levels
+from .ranking import rank_index, decode_cursor, aleaderboard_page
+from .serializers import UserProfileSerializer
+from .views import dashboard_payload, leaderboard_row, leaderboard_queryset, limit_param
+
+
+@sync_to_async
+def _rank_total_and_progress(points):
+    # منحنی لول‌ها در کش سرد از دیتابیس خوانده می‌شود، پس اینجا و نه در خود ویوی async
+    return rank_index.rank_of(points), rank_index.total(), levels.progress(points)
+
+
+@sync_to_async
+def _ranks(users):
+    return [rank_index.rank_of(u.total_points) for u in users]
+
+
+@async_api_view
+async def me(request):
+    etag = make_etag('me', request.user.pk, request.user.updated_at)
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = json_response(UserProfileSerializer(request.user, context={'request': request}).data)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@async_api_view
+async def dashboard_stats(request):
+    user = request.user
+    (rank, total, progress), stats = await asyncio.gather(
+        _rank_total_and_progress(user.total_points),
+        UserTokenTotal.objects.asummary_for(user),
+    )
+    return json_response(dashboard_payload(user, rank, total, stats, progress))
+
+
+@async_api_view
+async def leaderboard(request):
+    cursor = None
+    if request.GET.get('cursor'):
+        cursor = decode_cursor(request.GET['cursor'])
+        if cursor is None:
+            return json_response({'error': 'کرسر نامعتبر است'}, status=400)
+    page_size = limit_param(request.GET, 'page_size', default=20, maximum=100)
+
+    users, next_cursor = await aleaderboard_page(leaderboard_queryset(), cursor, page_size)
+    ranks = await _ranks(users)
+    return json_response({
+        'current_user_id': request.user.id,
+        'rankings': [leaderboard_row(u, rank) for u, rank in zip(users, ranks)],
+        'next_cursor': next_cursor
+    })
@@ -0,0 +1,129 @@
+"""
+پردازش عکس پروفایل
+
+فایل اصلی بر اساس هش محتوا ذخیره می‌شود و نسخه‌های کوچک (WebP و JPEG در اندازه‌های ثابت)
+بعد از پایان درخواست در یک pool از نخ‌ها ساخته می‌شوند. تا آماده شدن نسخه‌های کوچک، آدرس
+فایل اصلی برگردانده می‌شود. کاربرانی که عکس یکسان آپلود کنند فایل‌ها را به اشتراک می‌گذارند.
+"""
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models.functions import Now
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from ansup_gamification.hashed_files import hash_file, hashed_name, store_hashed
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+# اندازه ضلع تصویر مربعی برای هر نسخه
+SIZES = {'sm': 96, 'md': 256}
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+QUALITY = 82
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024
+MAX_PIXELS = 40_000_000
+ALLOWED_FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+
+_executor = None
+
+
+class AvatarError(Exception):
+    pass
+
+
+def variant_name(digest, size, fmt):
+    return hashed_name('avatars/thumbs', digest, f"_{SIZES[size]}.{fmt}")
+
+
+def all_variant_names(digest):
+    return [variant_name(digest, size, fmt) for size in SIZES for fmt in FORMATS]
+
+
+def avatar_url(user, size='sm', fmt='jpeg'):
+    if user.avatar_thumbs_ready and user.avatar_hash:
+        return default_storage.url(variant_name(user.avatar_hash, size, fmt))
+    return user.avatar.url if user.avatar else None
+
+
+def avatar_variants(user):
+    """
+    {اندازه: {فرمت: آدرس}}؛ تا زمان آماده نشدن نسخه‌ها None
+    """
+    if not (user.avatar_thumbs_ready and user.avatar_hash):
+        return None
+    return {size: {fmt: default_storage.url(variant_name(user.avatar_hash, size, fmt)) for fmt in FORMATS}
+            for size in SIZES}
+
+
+def set_avatar(user, uploaded):
+    """
+    بررسی و ذخیره عکس جدید؛ ساخت نسخه‌های کوچک بعد از commit تراکنش زمان‌بندی می‌شود
+    """
+    if uploaded.size > MAX_UPLOAD_BYTES:
+        raise AvatarError('حجم عکس بیشتر از حد مجاز است.')
+    try:
+        with Image.open(uploaded) as image:
+            image_format = image.format
+            if image.width * image.height > MAX_PIXELS:
+                raise AvatarError('ابعاد عکس بیش از حد بزرگ است.')
+            image.verify()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise AvatarError('فایل ارسال‌شده تصویر معتبر نیست.')
+    if image_format not in ALLOWED_FORMATS:
+        raise AvatarError('فرمت تصویر پشتیبانی نمی‌شود.')
+
+    digest = hash_file(uploaded)
+    name, digest = store_hashed(uploaded, 'avatars', digest=digest, ext=ALLOWED_FORMATS[image_format])
+
+    user.avatar.name = name
+    user.avatar_hash = digest
+    # اگر همین تصویر قبلا پردازش شده، نسخه‌های کوچک از همان ابتدا آماده‌اند
+    user.avatar_thumbs_ready = all(default_storage.exists(n) for n in all_variant_names(digest))
+    user.save()
+    if not user.avatar_thumbs_ready:
+        transaction.on_commit(lambda: schedule_variants(digest, name))
+    return user
+
+
+def schedule_variants(digest, source_name):
+    if not getattr(settings, 'AVATAR_THUMBNAILS_ASYNC', True):
+        build_variants(digest, source_name)
+        return
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'AVATAR_THUMBNAIL_WORKERS', 2),
+                                       thread_name_prefix='avatar-thumbs')
+    _executor.submit(_build_in_worker, digest, source_name)
+
+
+def _build_in_worker(digest, source_name):
+    try:
+        build_variants(digest, source_name)
+    except Exception:
+        logger.exception('avatar thumbnail generation failed for %s', digest)
+    finally:
+        # اتصال دیتابیس این نخ خارج از چرخه درخواست‌های جنگو است
+        connection.close()
+
+
+def build_variants(digest, source_name):
+    with default_storage.open(source_name, 'rb') as f, Image.open(f) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size, edge in SIZES.items():
+            thumb = ImageOps.fit(image, (edge, edge), Image.Resampling.LANCZOS)
+            for fmt, pil_format in FORMATS.items():
+                name = variant_name(digest, size, fmt)
+                if default_storage.exists(name):
+                    continue
+                buffer = io.BytesIO()
+                thumb.save(buffer, pil_format, quality=QUALITY, optimize=True)
+                default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    return User.objects.filter(avatar_hash=digest, avatar_thumbs_ready=False).update(
+        avatar_thumbs_ready=True, updated_at=Now()
+    )
@@ -0,0 +1,136 @@
+"""
+صندوق پیام ترکیبی: پیام‌های مستقیم + پیام‌های همگانی
+
+پیام‌های دریافتی، پیام‌های ارسالی و پیام‌های همگانی سه جریان جدا هستند که هر کدام با کرسر روی
+(created_at, نوع, id) و به ترتیب نزولی از ایندکس خودشان خوانده می‌شوند (شرط OR روی فرستنده/گیرنده
+با یک پیمایش ایندکس قابل پاسخ نیست)؛ از هر کدام حداکثر یک صفحه برداشته و در پایتون ادغام می‌شود،
+پس هزینه هر صفحه به عمق تاریخچه بستگی ندارد.
+"""
+import base64
+import datetime
+import heapq
+import json
+
+from django.db import transaction
+from django.db.models import Q, Exists, OuterRef
+
+from .models import Message, Broadcast, BroadcastReceipt, MessageCounter
+
+# رتبه نوع پیام در ترتیب (برای پیام‌های هم‌زمان)
+KIND_RANK = {'broadcast': 0, 'direct': 1}
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(created_at, kind, pk):
+    return base64.urlsafe_b64encode(json.dumps([created_at.isoformat(), kind, pk]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, kind, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if kind not in KIND_RANK:
+            raise ValueError(kind)
+        return datetime.datetime.fromisoformat(created_at), kind, int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor()
+
+
+def after_cursor(kind, cursor):
+    """
+    شرط «بعد از کرسر» برای یک جریان با کلید (created_at, رتبه نوع, id)
+    """
+    created_at, cursor_kind, pk = cursor
+    condition = Q(created_at__lt=created_at)
+    if KIND_RANK[kind] < KIND_RANK[cursor_kind]:
+        condition |= Q(created_at=created_at)
+    elif kind == cursor_kind:
+        condition |= Q(created_at=created_at, id__lt=pk)
+    return condition
+
+
+def visible_broadcasts(user):
+    # پیام‌های همگانی بعد از عضویت کاربر + پیام‌هایی که خودش فرستاده
+    return Broadcast.objects.filter(
+        Q(audience=user.role, created_at__gte=user.date_joined) | Q(sender=user)
+    )
+
+
+def receivable_broadcasts(user):
+    # همگانی‌هایی که برای کاربر «خوانده‌نشده» حساب می‌شوند (به جز ارسالی‌های خودش)
+    return Broadcast.objects.filter(audience=user.role, created_at__gte=user.date_joined).exclude(sender=user)
+
+
+def direct_messages(user):
+    return Message.objects.filter(Q(recipient=user) | Q(sender=user))
+
+
+def direct_streams(user):
+    """
+    پیام‌های مستقیم کاربر به صورت دو کوئری که هر کدام روی ایندکس (گیرنده/فرستنده، زمان، id) مرتب‌اند
+    (پیام به خود فقط در جریان دریافتی می‌آید)
+    """
+    return [Message.objects.filter(recipient=user), Message.objects.filter(sender=user).exclude(recipient=user)]
+
+
+def inbox_page(user, cursor=None, page_size=20):
+    """
+    خروجی: (لیست (نوع، شیء)، کرسر صفحه بعد)
+    """
+    queries = [('direct', qs.select_related('sender')) for qs in direct_streams(user)]
+    queries.append(('broadcast', visible_broadcasts(user).select_related('sender').annotate(
+        is_read=Exists(BroadcastReceipt.objects.filter(broadcast=OuterRef('pk'), user=user))
+    )))
+    if cursor:
+        queries = [(kind, qs.filter(after_cursor(kind, cursor))) for kind, qs in queries]
+
+    streams = [[(kind, obj) for obj in qs.order_by('-created_at', '-id')[:page_size + 1]] for kind, qs in queries]
+    merged = list(heapq.merge(
+        *streams, key=lambda item: (item[1].created_at, KIND_RANK[item[0]], item[1].id), reverse=True
+    ))
+
+    next_cursor = None
+    if len(merged) > page_size:
+        merged = merged[:page_size]
+        kind, last = merged[-1]
+        next_cursor = encode_cursor(last.created_at, kind, last.id)
+    return merged, next_cursor
+
+
+def unread_counts(user):
+    """
+    تعداد پیام‌های خوانده‌نشده از روی شمارنده و یک شمارش روی ایندکس همگانی‌ها
+    """
+    counter = MessageCounter.objects.filter(user=user).first()
+    direct = counter.direct_unread if counter else 0
+    read = counter.broadcasts_read if counter else 0
+    broadcasts = max(receivable_broadcasts(user).count() - read, 0)
+    return {'unread': direct + broadcasts, 'direct': direct, 'broadcasts': broadcasts}
+
+
+def mark_broadcast_read(user, broadcast):
+    with transaction.atomic():
+        MessageCounter.objects.lock(user.id)
+        _, created = BroadcastReceipt.objects.get_or_create(broadcast=broadcast, user=user)
+        if created and broadcast.sender_id != user.id:
+            MessageCounter.objects.adjust(user.id, broadcasts_read=1)
+
+
+def mark_all_read(user):
+    """
+    خوانده‌شدن همه پیام‌های مستقیم و همگانی کاربر
+    """
+    with transaction.atomic():
+        direct = Message.objects.mark_read(user)
+        MessageCounter.objects.lock(user.id)
+        unread_ids = list(
+            receivable_broadcasts(user).exclude(receipts__user=user).values_list('id', flat=True)
+        )
+        BroadcastReceipt.objects.bulk_create(
+            [BroadcastReceipt(broadcast_id=pk, user=user) for pk in unread_ids], ignore_conflicts=True
+        )
+        if unread_ids:
+            MessageCounter.objects.adjust(user.id, broadcasts_read=len(unread_ids))
+    return direct + len(unread_ids)
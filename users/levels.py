@@ -0,0 +1,62 @@
+"""
+منحنی سطح (لول) کاربران
+
+حداقل امتیاز هر لول در جدول LevelThreshold تعریف می‌شود و می‌تواند هر منحنی دلخواهی باشد.
+در پایتون لول با جستجوی دودویی (bisect) روی آستانه‌ها پیدا می‌شود و در دیتابیس با یک
+زیرکوئری که داخل همان UPDATE افزایش total_points قرار می‌گیرد؛ پس لول هیچ‌وقت با یک
+نوشتن جداگانه به‌روز نمی‌شود.
+"""
+import bisect
+
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Now
+
+from ansup_gamification import response_cache
+from .models import LevelThreshold, User
+
+
+def curve():
+    """
+    (لیست حداقل امتیازها، لیست لول‌ها) به ترتیب صعودی
+    """
+    def compute():
+        rows = list(LevelThreshold.objects.order_by('min_points').values_list('min_points', 'level'))
+        return [points for points, _ in rows], [level for _, level in rows]
+    return response_cache.get_or_compute('levels', 'curve', compute)
+
+
+def level_for(points):
+    thresholds, levels = curve()
+    index = bisect.bisect_right(thresholds, points) - 1
+    return levels[index] if index >= 0 else 1
+
+
+def progress(points):
+    """
+    (امتیاز کسب‌شده در لول فعلی، امتیاز لازم برای لول بعد)؛ در آخرین لول امتیاز لازم None است
+    """
+    thresholds, _ = curve()
+    index = bisect.bisect_right(thresholds, points) - 1
+    floor = thresholds[index] if index >= 0 else 0
+    if index + 1 >= len(thresholds):
+        return points - floor, None
+    return points - floor, thresholds[index + 1] - floor
+
+
+def level_expression(points):
+    """
+    عبارت SQL لول متناظر با points (مثلا OuterRef('total_points') + 10) برای استفاده در UPDATE
+    """
+    return Coalesce(
+        Subquery(LevelThreshold.objects.filter(min_points__lte=points).order_by('-min_points').values('level')[:1]),
+        Value(1)
+    )
+
+
+def relevel_all(queryset=None):
+    """
+    بازمحاسبه لول همه کاربران (یا کاربران queryset) با یک دستور UPDATE (بعد از تغییر منحنی)
+    """
+    level = level_expression(OuterRef('total_points'))
+    queryset = User.objects.all() if queryset is None else queryset
+    return queryset.exclude(level=level).update(level=level, updated_at=Now())
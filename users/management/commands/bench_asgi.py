@@ -0,0 +1,116 @@
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.models import User
+
+PREFIX = 'bench_asgi_'
+
+# (مسیر DRF همزمان، مسیر async معادل)
+ENDPOINTS = {
+    'me': ('/api/users/me/', '/api/async/users/me/'),
+    'dashboard_stats': ('/api/users/dashboard_stats/', '/api/async/users/dashboard_stats/'),
+    'leaderboard': ('/api/users/leaderboard/', '/api/async/users/leaderboard/'),
+    'wallet_summary': ('/api/wallet/summary/', '/api/async/wallet/summary/'),
+    'missions': ('/api/missions/', '/api/async/missions/'),
+}
+
+
+class Command(BaseCommand):
+    help = ('مقایسه توان عملیاتی اندپوینت‌های پرتکرار در سه حالت: WSGI (ویوهای DRF با نخ)، '
+            'ASGI با همان ویوهای DRF و ASGI با ویوهای async، در چند سطح همزمانی. '
+            'درخواست‌ها درون همین پروسه و از طریق handlerهای WSGI/ASGI جنگو ارسال می‌شوند '
+            '(بدون سرور و شبکه)؛ برای عدد نهایی باید gunicorn و uvicorn را جداگانه اندازه گرفت.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,8,32', help='سطوح همزمانی، جدا شده با ویرگول')
+        parser.add_argument('--requests', type=int, default=300, help='تعداد درخواست در هر سطح')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f"از بین: {', '.join(ENDPOINTS)}")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='کاربران آزمایشی حذف نشوند')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(c) for c in options['concurrency'].split(',')]
+            endpoints = [ENDPOINTS[name] for name in options['endpoints'].split(',')]
+        except (ValueError, KeyError) as e:
+            raise CommandError(f"پارامتر نامعتبر: {e}")
+        if User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError(f"کاربران {PREFIX}* از اجرای قبلی باقی مانده‌اند.")
+
+        rng = random.Random(options['seed'])
+        User.objects.bulk_create([
+            User(username=f"{PREFIX}{i}", total_points=rng.randint(0, 5000), current_balance=rng.randint(0, 1000))
+            for i in range(options['users'])
+        ])
+        try:
+            # کلاینت‌های تست جنگو با میزبان testserver درخواست می‌فرستند
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                self.run_levels(levels, endpoints, rng, options)
+        finally:
+            if not options['keep']:
+                User.objects.filter(username__startswith=PREFIX).delete()
+
+    def run_levels(self, levels, endpoints, rng, options):
+        tokens = [str(AccessToken.for_user(u)) for u in User.objects.filter(username__startswith=PREFIX)]
+        # برنامه درخواست‌ها برای هر سه حالت یکسان است
+        plan = [(rng.randrange(len(endpoints)), rng.choice(tokens)) for _ in range(options['requests'])]
+
+        self.stdout.write(f"{'mode':<12}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+        for level in levels:
+            for mode in ('wsgi', 'asgi-sync', 'asgi-async'):
+                if mode == 'wsgi':
+                    elapsed, latencies, errors = self.run_wsgi(endpoints, plan, level)
+                else:
+                    elapsed, latencies, errors = asyncio.run(
+                        self.run_asgi(endpoints, plan, level, use_async=(mode == 'asgi-async'))
+                    )
+                latencies.sort()
+                self.stdout.write(
+                    f"{mode:<12}{level:>6}{len(plan) / elapsed:>10.1f}"
+                    f"{statistics.median(latencies) * 1000:>10.1f}"
+                    f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:>10.1f}{errors:>8}"
+                )
+
+    def run_wsgi(self, endpoints, plan, concurrency):
+        def request(item):
+            endpoint, token = item
+            started = time.perf_counter()
+            response = Client().get(endpoints[endpoint][0], headers=self.headers(token))
+            return time.perf_counter() - started, response.status_code != 200
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(request, plan))
+        elapsed = time.perf_counter() - started
+        return elapsed, [r[0] for r in results], sum(r[1] for r in results)
+
+    async def run_asgi(self, endpoints, plan, concurrency, use_async):
+        queue = list(reversed(plan))
+        latencies, errors = [], 0
+        client = AsyncClient()
+
+        async def worker():
+            nonlocal errors
+            while queue:
+                endpoint, token = queue.pop()
+                started = time.perf_counter()
+                response = await client.get(endpoints[endpoint][1 if use_async else 0], headers=self.headers(token))
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code != 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started, latencies, errors
+
+    def headers(self, token):
+        return {'Authorization': f"Bearer {token}"}
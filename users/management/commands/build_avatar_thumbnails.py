@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ansup_gamification.hashed_files import hash_file, store_hashed, extension_of
+from users.avatars import build_variants
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('انتقال عکس‌های پروفایل قدیمی به مسیر مبتنی بر هش محتوا و ساخت نسخه‌های کوچک '
+            'برای همه عکس‌هایی که هنوز آماده نیستند')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='تعداد نخ‌های ساخت تصویر')
+
+    def handle(self, *args, **options):
+        sources = {}  # هش -> نام فایل اصلی
+        missing = 0
+        users = User.objects.exclude(avatar='').exclude(avatar__isnull=True).filter(avatar_thumbs_ready=False)
+        for user in users.only('id', 'avatar', 'avatar_hash').iterator():
+            if not default_storage.exists(user.avatar.name):
+                missing += 1
+                continue
+            if not user.avatar_hash:
+                with default_storage.open(user.avatar.name, 'rb') as f:
+                    name, digest = store_hashed(f, 'avatars', digest=hash_file(f),
+                                                ext=extension_of(user.avatar.name, '.jpg'))
+                User.objects.filter(pk=user.pk).update(avatar=name, avatar_hash=digest)
+                user.avatar.name, user.avatar_hash = name, digest
+            sources.setdefault(user.avatar_hash, user.avatar.name)
+
+        def build(item):
+            try:
+                return build_variants(*item)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            updated = sum(pool.map(build, sources.items()))
+
+        self.stdout.write(f"{len(sources)} تصویر یکتا پردازش شد، {updated} کاربر به‌روز شد.")
+        if missing:
+            self.stdout.write(self.style.WARNING(f"فایل عکس {missing} کاربر روی دیسک پیدا نشد."))
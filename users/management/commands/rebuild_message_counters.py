@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F
+
+from users.models import Message, BroadcastReceipt, MessageCounter
+
+
+class Command(BaseCommand):
+    help = 'بازسازی شمارنده پیام‌های خوانده‌نشده کاربران از روی جدول پیام‌ها و رسیدهای همگانی'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='فقط مقایسه شمارنده‌ها با جدول‌ها، بدون بازنویسی')
+
+    def expected_counters(self):
+        counters = {}
+        unread = (Message.objects.filter(is_read=False).values_list('recipient_id')
+                  .annotate(n=Count('id')).order_by())
+        for user_id, count in unread:
+            counters[user_id] = (count, 0)
+        # رسید همگانی‌هایی که خود کاربر فرستاده شمرده نمی‌شود
+        receipts = (BroadcastReceipt.objects.exclude(broadcast__sender_id=F('user_id')).values_list('user_id')
+                    .annotate(n=Count('id')).order_by())
+        for user_id, count in receipts:
+            counters[user_id] = (counters.get(user_id, (0, 0))[0], count)
+        return counters
+
+    def stored_counters(self):
+        rows = MessageCounter.objects.values_list('user_id', 'direct_unread', 'broadcasts_read')
+        return {user_id: (direct, read) for user_id, direct, read in rows}
+
+    def diff(self, expected, stored):
+        return sorted((user_id, expected.get(user_id, (0, 0)), stored.get(user_id, (0, 0)))
+                      for user_id in expected.keys() | stored.keys()
+                      if expected.get(user_id, (0, 0)) != stored.get(user_id, (0, 0)))
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                mismatches = self.diff(self.expected_counters(), self.stored_counters())
+                MessageCounter.objects.bulk_create(
+                    [MessageCounter(user_id=user_id, direct_unread=direct, broadcasts_read=read)
+                     for user_id, (direct, read), _ in mismatches],
+                    update_conflicts=True, unique_fields=['user'], update_fields=['direct_unread', 'broadcasts_read'],
+                    batch_size=500
+                )
+            self.stdout.write(f"شمارنده {len(mismatches)} کاربر اصلاح شد.")
+
+        mismatches = self.diff(self.expected_counters(), self.stored_counters())
+        for user_id, expected, stored in mismatches:
+            self.stdout.write(f"کاربر {user_id}: مورد انتظار={expected} ذخیره‌شده={stored}")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} مغایرت پیدا شد.")
+        self.stdout.write(self.style.SUCCESS('شمارنده‌های پیام با جدول‌ها مطابقت دارند.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from ansup_gamification import response_cache
+from users.levels import relevel_all
+
+
+class Command(BaseCommand):
+    help = 'بازمحاسبه لول همه کاربران از روی جدول آستانه‌های لول (با یک دستور UPDATE)'
+
+    def handle(self, *args, **options):
+        response_cache.invalidate('levels')
+        updated = relevel_all()
+        self.stdout.write(f"لول {updated} کاربر تغییر کرد.")
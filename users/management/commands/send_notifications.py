@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.notifications import OutboxWorker
+
+
+class Command(BaseCommand):
+    help = 'ارسال اعلان‌های صف خروجی به تلگرام (به صورت دسته‌ای و همزمان، با تلاش مجدد و محدودیت نرخ هر چت)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='فقط یک دور اجرا و خروج')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=8, help='تعداد درخواست‌های HTTP همزمان')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='فاصله بررسی صف وقتی خالی است (ثانیه)')
+        parser.add_argument('--max-attempts', type=int, default=5)
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker(batch_size=options['batch_size'], concurrency=options['concurrency'],
+                              max_attempts=options['max_attempts'])
+        while True:
+            sent, failed = worker.run_once()
+            if sent or failed:
+                self.stdout.write(f"ارسال‌شده: {sent}  ناموفق: {failed}")
+            if options['once']:
+                break
+            if not (sent or failed):
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_alter_message_subject_alter_user_telegram_chat_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'total_points', 'id'], name='user_role_points_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def backfill_counters(apps, schema_editor):
+    # شمارنده‌های اولیه از روی پیام‌ها و رسیدهای موجود
+    Message = apps.get_model('users', 'Message')
+    BroadcastReceipt = apps.get_model('users', 'BroadcastReceipt')
+    MessageCounter = apps.get_model('users', 'MessageCounter')
+
+    counters = {}
+    unread = Message.objects.filter(is_read=False).values('recipient_id').annotate(n=Count('id')).order_by()
+    for row in unread:
+        counters.setdefault(row['recipient_id'], MessageCounter(user_id=row['recipient_id'])).direct_unread = row['n']
+    receipts = BroadcastReceipt.objects.exclude(broadcast__sender_id=F('user_id')).values('user_id').annotate(
+        n=Count('id')).order_by()
+    for row in receipts:
+        counters.setdefault(row['user_id'], MessageCounter(user_id=row['user_id'])).broadcasts_read = row['n']
+    MessageCounter.objects.bulk_create(counters.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_broadcast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='message_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('direct_unread', models.IntegerField(default=0)),
+                ('broadcasts_read', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_thumbs_ready',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:19
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# منحنی قبلی: هر ۵۰۰ امتیاز یک لول (بدون سقف)
+INITIAL_LEVELS = 100
+POINTS_PER_LEVEL = 500
+
+
+def seed_levels(apps, schema_editor):
+    LevelThreshold = apps.get_model('users', 'LevelThreshold')
+    User = apps.get_model('users', 'User')
+    # حداقل ۱۰۰ لول و به اندازه‌ای که لول هیچ کاربر فعلی پایین نیاید
+    top = User.objects.aggregate(top=Max('total_points'))['top'] or 0
+    count = max(INITIAL_LEVELS, top // POINTS_PER_LEVEL + 1)
+    LevelThreshold.objects.bulk_create(
+        [LevelThreshold(level=level, min_points=(level - 1) * POINTS_PER_LEVEL) for level in range(1, count + 1)],
+        batch_size=500
+    )
+    level = Coalesce(Subquery(
+        LevelThreshold.objects.filter(min_points__lte=OuterRef('total_points')).order_by('-min_points').values('level')[:1]
+    ), Value(1))
+    User.objects.update(level=level)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_avatar_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LevelThreshold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveIntegerField(unique=True)),
+                ('min_points', models.PositiveIntegerField(unique=True)),
+            ],
+            options={
+                'ordering': ['level'],
+            },
+        ),
+        migrations.RunPython(seed_levels, migrations.RunPython.noop),
+    ]
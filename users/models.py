@@ -1,5 +1,38 @@
-from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
+from django.db import models, transaction
+from django.db.models import F, OuterRef
+from django.db.models.functions import Now
+from django.utils import timezone
+
+
+class UserManager(BaseUserManager):
+    def apply_increments(self, deltas):
+        """
+        اعمال افزایش موجودی و امتیاز کل برای چند کاربر
+        deltas: {user_id: (balance_delta, points_delta)}
+        کاربرانی که تغییر یکسان دارند با یک UPDATE به‌روز می‌شوند
+        """
+        groups = {}
+        for user_id, change in deltas.items():
+            if change != (0, 0):
+                groups.setdefault(change, []).append(user_id)
+
+        from .levels import level_expression
+        for (balance_delta, points_delta), user_ids in groups.items():
+            fields = {}
+            if points_delta:
+                # لول از روی امتیاز جدید در همین UPDATE تعیین می‌شود
+                fields['level'] = level_expression(OuterRef('total_points') + points_delta)
+            self.filter(pk__in=user_ids).update(
+                current_balance=F('current_balance') + balance_delta,
+                total_points=F('total_points') + points_delta,
+                updated_at=Now(),
+                **fields
+            )
+
+        if any(points_delta for _, points_delta in groups):
+            from .ranking import rank_index
+            rank_index.invalidate()
 
 
 class User(AbstractUser):
@@ -15,17 +48,91 @@ class User(AbstractUser):
     current_balance = models.PositiveIntegerField(default=0)  # موجودی قابل خرج (کیف پول)
 
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
+    # هش محتوای عکس (نام فایل‌های ذخیره‌شده) و آماده بودن نسخه‌های کوچک؛ users/avatars.py
+    avatar_hash = models.CharField(max_length=64, blank=True)
+    avatar_thumbs_ready = models.BooleanField(default=False)
     telegram_chat_id = models.CharField(max_length=100, blank=True, null=True)
+    # زمان آخرین تغییر (برای ETag پروفایل)؛ UPDATEهای مستقیم باید آن را هم به‌روز کنند
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserManager()
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['role', '-total_points', 'id'], name='user_role_points_idx'),
+        ]
 
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
 
-    # متدی برای محاسبه و ارتقای لول (فرض: هر 500 امتیاز = 1 لول)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_rank_fields()
+        return instance
+
+    # مقادیر مؤثر در رتبه‌بندی برای تشخیص تغییر هنگام ذخیره
+    def remember_rank_fields(self):
+        self._rank_fields = (self.__dict__.get('role'), self.__dict__.get('total_points'))
+
+    def rank_fields_changed(self):
+        return getattr(self, '_rank_fields', None) != (self.__dict__.get('role'), self.__dict__.get('total_points'))
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'total_points' in update_fields:
+            if self._state.adding or self.rank_fields_changed():
+                self.update_level()
+                if update_fields is not None:
+                    kwargs['update_fields'] = {*update_fields, 'level'}
+        super().save(*args, **kwargs)
+
+    # لول متناظر با امتیاز کل از روی منحنی سطح‌ها (users/levels.py)؛ ذخیره همراه با همان save
     def update_level(self):
-        new_level = (self.total_points // 500) + 1
-        if new_level != self.level:
-            self.level = new_level
-            self.save()
+        from .levels import level_for
+        self.level = level_for(self.total_points)
+
+
+class LevelThreshold(models.Model):
+    """
+    حداقل امتیاز کل برای رسیدن به هر لول
+    بعد از تغییر این جدول دستور relevel_users لول همه کاربران را بازمحاسبه می‌کند
+    """
+    level = models.PositiveIntegerField(unique=True)
+    min_points = models.PositiveIntegerField(unique=True)
+
+    class Meta:
+        ordering = ['level']
+
+    def __str__(self):
+        return f"Lvl {self.level}: {self.min_points}"
+
+
+class MessageQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            unread = {}
+            for message in objs:
+                if not message.is_read:
+                    unread[message.recipient_id] = unread.get(message.recipient_id, 0) + 1
+            for user_id, count in unread.items():
+                MessageCounter.objects.adjust(user_id, direct_unread=count)
+        return objs
+
+    def mark_read(self, user, ids=None):
+        """
+        خوانده‌شدن پیام‌های مستقیم کاربر (همه یا شناسه‌های داده‌شده) به همراه کم کردن شمارنده
+        """
+        with transaction.atomic(using=self.db):
+            MessageCounter.objects.lock(user.id)
+            qs = self.filter(recipient=user, is_read=False)
+            if ids is not None:
+                qs = qs.filter(id__in=ids)
+            updated = qs.update(is_read=True)
+            if updated:
+                MessageCounter.objects.adjust(user.id, direct_unread=-updated)
+        return updated
 
 
 class Message(models.Model):
@@ -36,5 +143,122 @@ class Message(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = MessageQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # صفحه‌بندی با کرسر روی (created_at, id)
+            models.Index(fields=['recipient', '-created_at', '-id'], name='message_recipient_created_idx'),
+            models.Index(fields=['sender', '-created_at', '-id'], name='message_sender_created_idx'),
+            # پیام‌های خوانده‌نشده هر گیرنده (ایندکس جزئی)
+            models.Index(fields=['recipient'], condition=models.Q(is_read=False), name='message_unread_idx'),
+        ]
+
+    def __str__(self):
+        return f"از {self.sender} به {self.recipient}"
+
+    def save(self, *args, **kwargs):
+        # ثبت یا تغییر پیام و به‌روزرسانی شمارنده خوانده‌نشده‌های گیرنده در یک تراکنش
+        with transaction.atomic(using=kwargs.get('using')):
+            if self._state.adding:
+                super().save(*args, **kwargs)
+                if not self.is_read:
+                    MessageCounter.objects.adjust(self.recipient_id, direct_unread=1)
+                return
+
+            # تغییر is_read یا گیرنده با save (مثلا از پنل ادمین): وضعیت قبل و بعد از دیتابیس خوانده می‌شود
+            state = Message.objects.select_for_update().filter(pk=self.pk).values_list('recipient_id', 'is_read')
+            before = state.first()
+            super().save(*args, **kwargs)
+            after = state.first()
+            if before != after:
+                if before and not before[1]:
+                    MessageCounter.objects.adjust(before[0], direct_unread=-1)
+                if after and not after[1]:
+                    MessageCounter.objects.adjust(after[0], direct_unread=1)
+
+
+class Broadcast(models.Model):
+    """
+    پیام همگانی: فقط یک بار ذخیره می‌شود و برای هر گیرنده فقط هنگام خواندن رسید ساخته می‌شود
+    """
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_broadcasts')
+    audience = models.CharField(max_length=10, choices=User.ROLE_CHOICES, default='EMPLOYEE')
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['audience', '-created_at', '-id'], name='broadcast_audience_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"همگانی از {self.sender}: {self.subject}"
+
+
+class BroadcastReceipt(models.Model):
+    broadcast = models.ForeignKey(Broadcast, on_delete=models.CASCADE, related_name='receipts')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='broadcast_receipts')
+    read_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'broadcast')
+
+
+class MessageCounterManager(models.Manager):
+    def adjust(self, user_id, direct_unread=0, broadcasts_read=0):
+        self.bulk_create([self.model(user_id=user_id)], ignore_conflicts=True)
+        self.filter(user_id=user_id).update(
+            direct_unread=F('direct_unread') + direct_unread,
+            broadcasts_read=F('broadcasts_read') + broadcasts_read
+        )
+
+    def lock(self, user_id):
+        # قفل ردیف شمارنده تا عملیات خواندن همزمان یک کاربر پشت سر هم انجام شوند
+        self.bulk_create([self.model(user_id=user_id)], ignore_conflicts=True)
+        return self.select_for_update().get(user_id=user_id)
+
+
+class MessageCounter(models.Model):
+    """
+    شمارنده پیام‌های خوانده‌نشده هر کاربر (بدون شمارش جدول پیام‌ها)
+    تعداد همگانی‌های خوانده‌نشده = همگانی‌های قابل دریافت - broadcasts_read
+    تغییرهایی که از مسیر save/bulk_create/mark_read نگذرند (مثل queryset.update) با دستور
+    rebuild_message_counters اصلاح می‌شوند
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='message_counter')
+    direct_unread = models.IntegerField(default=0)
+    broadcasts_read = models.IntegerField(default=0)
+
+    objects = MessageCounterManager()
+
+
+class Notification(models.Model):
+    """
+    صف خروجی پیام‌های تلگرام (outbox): همراه با رویداد در همان تراکنش ثبت می‌شود
+    و یک پردازشگر پس‌زمینه (send_notifications) آن را دسته‌ای ارسال می‌کند.
+    ردیف‌های همگانی (broadcast) توسط پردازشگر به ازای هر چت باز می‌شوند.
+    """
+    STATUS_CHOICES = [('PENDING', 'در صف'), ('SENT', 'ارسال شده'), ('FAILED', 'ناموفق')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
+    chat_id = models.CharField(max_length=100, blank=True)
+    broadcast = models.ForeignKey(Broadcast, on_delete=models.CASCADE, null=True, blank=True,
+                                  related_name='notifications')
+    text = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status='PENDING'),
+                         name='notification_pending_idx'),
+        ]
+
     def __str__(self):
-        return f"از {self.sender} به {self.recipient}"
\ No newline at end of file
+        return f"{self.chat_id or 'همگانی'}: {self.status}"
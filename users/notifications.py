@@ -0,0 +1,193 @@
+"""
+اعلان‌های تلگرام از طریق صف خروجی (outbox)
+
+ویوها فقط ردیف Notification را در همان تراکنش رویداد ثبت می‌کنند و درگیر شبکه نمی‌شوند.
+OutboxWorker ردیف‌های آماده را دسته‌ای برمی‌دارد، با چند نخ همزمان به API تلگرام می‌فرستد،
+برای هر چت فاصله حداقلی بین پیام‌ها را رعایت می‌کند و خطاهای موقت را با تاخیر نمایی دوباره تلاش می‌کند.
+"""
+import datetime
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import User, Notification
+
+
+def notify_users(messages):
+    """
+    ثبت اعلان برای کاربرانی که شناسه چت تلگرام دارند
+    messages: لیستی از (user_id, text)
+    """
+    messages = list(messages)
+    chat_ids = dict(
+        User.objects.filter(pk__in={user_id for user_id, _ in messages})
+        .exclude(telegram_chat_id__isnull=True).exclude(telegram_chat_id='')
+        .values_list('id', 'telegram_chat_id')
+    )
+    Notification.objects.bulk_create([
+        Notification(user_id=user_id, chat_id=chat_ids[user_id], text=text)
+        for user_id, text in messages if user_id in chat_ids
+    ])
+
+
+def notify_broadcast(broadcast):
+    # فقط یک ردیف؛ پردازشگر آن را برای هر چت باز می‌کند
+    Notification.objects.create(broadcast=broadcast, text=f"{broadcast.subject}\n\n{broadcast.body}")
+
+
+class SendResult:
+    __slots__ = ('notification_id', 'chat_id', 'ok', 'retry', 'retry_after', 'error')
+
+    def __init__(self, notification_id, chat_id, ok, retry=False, retry_after=None, error=''):
+        self.notification_id = notification_id
+        self.chat_id = chat_id
+        self.ok = ok
+        self.retry = retry
+        self.retry_after = retry_after
+        self.error = error
+
+
+class OutboxWorker:
+    def __init__(self, batch_size=50, concurrency=8, per_chat_interval=1.0, max_attempts=5,
+                 backoff_base=2.0, max_backoff=3600, lease_seconds=60, timeout=10,
+                 api_base=None, token=None):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.per_chat_interval = per_chat_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.lease_seconds = lease_seconds
+        self.timeout = timeout
+        self.api_base = (api_base or settings.TELEGRAM_API_BASE).rstrip('/')
+        self.token = token if token is not None else settings.TELEGRAM_BOT_TOKEN
+        # زمان مجاز بعدی برای ارسال به هر چت
+        self.chat_available_at = {}
+
+    # --- مرحله ۱: باز کردن اعلان‌های همگانی ---
+    def expand_broadcasts(self):
+        with transaction.atomic():
+            pending = list(Notification.objects.select_for_update().select_related('broadcast').filter(
+                status='PENDING', broadcast__isnull=False, chat_id=''
+            )[:self.batch_size])
+            for notification in pending:
+                recipients = User.objects.filter(
+                    role=notification.broadcast.audience
+                ).exclude(telegram_chat_id__isnull=True).exclude(telegram_chat_id='')
+                Notification.objects.bulk_create([
+                    Notification(user_id=user_id, chat_id=chat_id, broadcast=notification.broadcast,
+                                 text=notification.text)
+                    for user_id, chat_id in recipients.values_list('id', 'telegram_chat_id')
+                ], batch_size=500)
+            if pending:
+                Notification.objects.filter(pk__in=[n.pk for n in pending]).update(
+                    status='SENT', sent_at=timezone.now()
+                )
+        return len(pending)
+
+    # --- مرحله ۲: برداشتن یک دسته با اجاره موقت ---
+    def claim_batch(self):
+        now = timezone.now()
+        monotonic_now = time.monotonic()
+        with transaction.atomic():
+            qs = Notification.objects.filter(status='PENDING', next_attempt_at__lte=now).exclude(chat_id='')
+            qs = qs.order_by('next_attempt_at', 'id').select_for_update(skip_locked=True)
+            candidates = list(qs[:self.batch_size * 4])
+
+            batch, seen_chats = [], set()
+            for notification in candidates:
+                # در هر دسته حداکثر یک پیام برای هر چت و فقط اگر محدودیت نرخ اجازه دهد
+                if notification.chat_id in seen_chats:
+                    continue
+                if self.chat_available_at.get(notification.chat_id, 0) > monotonic_now:
+                    continue
+                seen_chats.add(notification.chat_id)
+                batch.append(notification)
+                if len(batch) >= self.batch_size:
+                    break
+
+            if batch:
+                # اجاره: تا پایان ارسال، پردازشگرهای دیگر این ردیف‌ها را برندارند
+                Notification.objects.filter(pk__in=[n.pk for n in batch]).update(
+                    next_attempt_at=now + datetime.timedelta(seconds=self.lease_seconds)
+                )
+        return batch
+
+    # --- مرحله ۳: ارسال همزمان ---
+    def send(self, notification):
+        url = f"{self.api_base}/bot{self.token}/sendMessage"
+        payload = json.dumps({'chat_id': notification.chat_id, 'text': notification.text}).encode()
+        request = urllib.request.Request(url, data=payload, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = json.loads(response.read() or b'{}')
+            if body.get('ok', True):
+                return SendResult(notification.id, notification.chat_id, ok=True)
+            return SendResult(notification.id, notification.chat_id, ok=False, error=str(body))
+        except urllib.error.HTTPError as e:
+            try:
+                body = json.loads(e.read() or b'{}')
+            except ValueError:
+                body = {}
+            error = f"HTTP {e.code}: {body.get('description', '')}"
+            if e.code == 429:
+                retry_after = body.get('parameters', {}).get('retry_after', 1)
+                return SendResult(notification.id, notification.chat_id, ok=False, retry=True,
+                                  retry_after=retry_after, error=error)
+            # خطاهای 4xx (مثلا چت نامعتبر) دائمی هستند
+            return SendResult(notification.id, notification.chat_id, ok=False, retry=e.code >= 500, error=error)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            return SendResult(notification.id, notification.chat_id, ok=False, retry=True, error=str(e))
+
+    def backoff(self, attempts):
+        delay = min(self.backoff_base ** attempts, self.max_backoff)
+        return delay * random.uniform(0.8, 1.2)
+
+    # --- مرحله ۴: ثبت نتیجه‌ها ---
+    def apply_results(self, batch, results):
+        now = timezone.now()
+        monotonic_now = time.monotonic()
+        by_id = {n.id: n for n in batch}
+        sent_ids = []
+        for result in results:
+            wait = result.retry_after if result.retry_after else self.per_chat_interval
+            self.chat_available_at[result.chat_id] = monotonic_now + wait
+            if result.ok:
+                sent_ids.append(result.notification_id)
+                continue
+
+            notification = by_id[result.notification_id]
+            notification.attempts += 1
+            notification.last_error = result.error[:1000]
+            if result.retry and notification.attempts < self.max_attempts:
+                delay = result.retry_after or self.backoff(notification.attempts)
+                notification.next_attempt_at = now + datetime.timedelta(seconds=delay)
+            else:
+                notification.status = 'FAILED'
+                notification.next_attempt_at = now
+
+        with transaction.atomic():
+            if sent_ids:
+                Notification.objects.filter(pk__in=sent_ids).update(status='SENT', sent_at=now)
+            failed = [by_id[r.notification_id] for r in results if not r.ok]
+            Notification.objects.bulk_update(failed, ['attempts', 'last_error', 'next_attempt_at', 'status'])
+        return len(sent_ids), len(results) - len(sent_ids)
+
+    def run_once(self):
+        """
+        یک دور کامل؛ خروجی: (تعداد ارسال‌شده، تعداد ناموفق)
+        """
+        self.expand_broadcasts()
+        batch = self.claim_batch()
+        if not batch:
+            return 0, 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            results = list(pool.map(self.send, batch))
+        return self.apply_results(batch, results)
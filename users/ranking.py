@@ -0,0 +1,129 @@
+"""
+ایندکس رتبه‌بندی کارمندان برای لیدربرد و داشبورد
+
+لیست مرتب امتیازها در حافظه نگه داشته می‌شود و با bisect رتبه هر امتیاز
+در O(log n) پیدا می‌شود. هر بار که total_points یا نقش کاربری تغییر کند
+نسخه ایندکس در کش افزایش پیدا می‌کند و ایندکس در اولین خواندن بعدی دوباره ساخته می‌شود.
+
+این رفتار عمدی است: invalidate فقط یک شمارنده را زیاد می‌کند (O(1)) و ساخت دوباره (یک کوئری
+O(n) روی امتیاز کارمندان) فقط هنگام خواندن و حداکثر یک بار برای هر نسخه در هر پروسه انجام می‌شود؛
+پس چند تغییر امتیاز پشت سر هم بین دو خواندن فقط یک بار ساخت دوباره هزینه دارند.
+"""
+import base64
+import bisect
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models import Q
+
+VERSION_KEY = 'ranking:version'
+# حداکثر عمر ایندکس محلی (برای زمانی که کش بین پروسه‌ها مشترک نیست)
+MAX_AGE_SECONDS = 30
+
+
+def fresh_version():
+    # اگر کلید نسخه از کش پاک شود، شروع دوباره از 0 ممکن است با نسخه ایندکس محلی یکی شود
+    return time.time_ns()
+
+
+class RankIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._points = []  # امتیاز کارمندان به ترتیب صعودی
+        self._version = None
+        self._built_at = 0.0
+
+    def invalidate(self):
+        # ساخت دوباره به اولین خواندن بعدی موکول می‌شود
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, fresh_version(), None)
+
+    def _snapshot(self):
+        from .models import User
+
+        version = cache.get_or_set(VERSION_KEY, fresh_version, None)
+        if version == self._version and time.monotonic() - self._built_at < MAX_AGE_SECONDS:
+            return self._points
+
+        with self._lock:
+            if version != self._version or time.monotonic() - self._built_at >= MAX_AGE_SECONDS:
+                self._points = list(
+                    User.objects.filter(role='EMPLOYEE').order_by('total_points')
+                    .values_list('total_points', flat=True)
+                )
+                self._version = version
+                self._built_at = time.monotonic()
+            return self._points
+
+    def rank_of(self, points):
+        # رتبه = تعداد کارمندانی که امتیاز بیشتری دارند + ۱
+        snapshot = self._snapshot()
+        return len(snapshot) - bisect.bisect_right(snapshot, points) + 1
+
+    def total(self):
+        return len(self._snapshot())
+
+
+rank_index = RankIndex()
+
+
+def encode_cursor(points, user_id):
+    return base64.urlsafe_b64encode(f"{points}:{user_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        points, user_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return int(points), int(user_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def leaderboard_page(queryset, cursor=None, page_size=20):
+    """
+    یک صفحه از لیدربرد به ترتیب امتیاز نزولی (کلید: امتیاز، شناسه)
+    خروجی: (لیست کاربران، کرسر صفحه بعد)
+    """
+    users = list(_page_queryset(queryset, cursor, page_size))
+    return _finish_page(users, page_size)
+
+
+async def aleaderboard_page(queryset, cursor=None, page_size=20):
+    users = [u async for u in _page_queryset(queryset, cursor, page_size)]
+    return _finish_page(users, page_size)
+
+
+def _page_queryset(queryset, cursor, page_size):
+    qs = queryset.order_by('-total_points', 'id')
+    if cursor:
+        points, user_id = cursor
+        qs = qs.filter(Q(total_points__lt=points) | Q(total_points=points, id__gt=user_id))
+    return qs[:page_size + 1]
+
+
+def _finish_page(users, page_size):
+    next_cursor = None
+    if len(users) > page_size:
+        users = users[:page_size]
+        next_cursor = encode_cursor(users[-1].total_points, users[-1].id)
+    return users, next_cursor
+
+
+def leaderboard_window(queryset, user, size=5):
+    """
+    size کاربر بالاتر و size کاربر پایین‌تر از کاربر جاری (به همراه خودش)
+    کاربری که خودش در رتبه‌بندی نیست (مثلا مدیر) پنجره خالی می‌گیرد
+    """
+    if not queryset.filter(pk=user.pk).exists():
+        return []
+    points = user.total_points
+    above = queryset.filter(
+        Q(total_points__gt=points) | Q(total_points=points, id__lt=user.id)
+    ).order_by('total_points', '-id')[:size]
+    below = queryset.filter(
+        Q(total_points__lt=points) | Q(total_points=points, id__gt=user.id)
+    ).order_by('-total_points', 'id')[:size]
+    return list(reversed(list(above))) + [user] + list(below)
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from .models import User, Message
+from .models import User, Message, Broadcast
+from .avatars import avatar_url, avatar_variants
 
 
 # ۱. سریالایزر لاگین (اصلاح شده برای هماهنگی با توکن فرانت)
@@ -20,10 +21,16 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
 # ۲. سریالایزر نمایش پروفایل (بدون تغییر)
 class UserProfileSerializer(serializers.ModelSerializer):
+    # آدرس نسخه‌های کوچک عکس ({'sm': {'webp': ..., 'jpeg': ...}, 'md': ...})
+    avatar_thumbs = serializers.SerializerMethodField()
+
     class Meta:
         model = User
         fields = ['id', 'username', 'first_name', 'last_name', 'email', 'role',
-                  'current_balance', 'total_points', 'level', 'avatar', 'date_joined']
+                  'current_balance', 'total_points', 'level', 'avatar', 'avatar_thumbs', 'date_joined']
+
+    def get_avatar_thumbs(self, obj):
+        return avatar_variants(obj)
 
 
 # ۳. سریالایزر ساخت و ویرایش کاربر (حل مشکل رمز عبور)
@@ -67,4 +74,23 @@ class MessageSerializer(serializers.ModelSerializer):
         read_only_fields = ['sender', 'created_at', 'is_read']
 
     def get_sender_avatar(self, obj):
-        return obj.sender.avatar.url if obj.sender.avatar else None
\ No newline at end of file
+        return avatar_url(obj.sender)
+
+
+# ۵. سریالایزر پیام همگانی (هم‌شکل با پیام مستقیم برای صندوق پیام)
+class BroadcastSerializer(serializers.ModelSerializer):
+    sender_name = serializers.ReadOnlyField(source='sender.username')
+    sender_avatar = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Broadcast
+        fields = ['id', 'sender', 'sender_name', 'sender_avatar', 'audience', 'subject', 'body', 'is_read',
+                  'created_at']
+
+    def get_sender_avatar(self, obj):
+        return avatar_url(obj.sender)
+
+    def get_is_read(self, obj):
+        # مقدار is_read در صندوق پیام از قبل annotate شده است
+        return getattr(obj, 'is_read', False)
@@ -0,0 +1,39 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ansup_gamification import response_cache
+from .models import User, Message, BroadcastReceipt, MessageCounter, LevelThreshold
+from .ranking import rank_index
+
+
+@receiver(post_save, sender=User)
+def refresh_rank_index(sender, instance, created, **kwargs):
+    # فقط تغییر امتیاز یا نقش روی رتبه‌بندی اثر دارد
+    if created or instance.rank_fields_changed():
+        rank_index.invalidate()
+    instance.remember_rank_fields()
+
+
+@receiver(post_delete, sender=User)
+def drop_from_rank_index(sender, instance, **kwargs):
+    rank_index.invalidate()
+
+
+@receiver(post_delete, sender=Message)
+def drop_unread_message(sender, instance, **kwargs):
+    if not instance.is_read:
+        MessageCounter.objects.filter(user_id=instance.recipient_id).update(direct_unread=F('direct_unread') - 1)
+
+
+@receiver(post_delete, sender=BroadcastReceipt)
+def drop_broadcast_receipt(sender, instance, **kwargs):
+    MessageCounter.objects.filter(user_id=instance.user_id).exclude(
+        user_id=instance.broadcast.sender_id
+    ).update(broadcasts_read=F('broadcasts_read') - 1)
+
+
+@receiver([post_save, post_delete], sender=LevelThreshold)
+def invalidate_level_curve(sender, **kwargs):
+    # لول کاربران فعلی با دستور relevel_users بازمحاسبه می‌شود
+    response_cache.invalidate('levels')
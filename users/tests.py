@@ -1,3 +1,504 @@
-from django.test import TestCase
+import io
+import json
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from PIL import Image
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ansup_gamification.explain import QueryPlanAssertionsMixin
+from ansup_gamification.metrics import registry
+from .inbox import direct_streams, unread_counts, mark_broadcast_read, mark_all_read
+from .models import User, Message, Broadcast, BroadcastReceipt, MessageCounter, Notification, LevelThreshold
+from .notifications import OutboxWorker, notify_users, notify_broadcast
+from .ranking import rank_index, encode_cursor, decode_cursor
+
+
+class HotQueryPlanTests(QueryPlanAssertionsMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('employee', password='x', total_points=100)
+
+    def test_leaderboard_page(self):
+        qs = User.objects.filter(role='EMPLOYEE').order_by('-total_points', 'id')[:20]
+        plan = self.assertUsesIndex(qs, 'user_role_points_idx')
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_rank_count(self):
+        qs = User.objects.filter(role='EMPLOYEE', total_points__gt=self.user.total_points)
+        self.assertUsesIndex(qs, 'user_role_points_idx')
+
+    def test_unread_messages(self):
+        qs = Message.objects.filter(recipient=self.user, is_read=False)
+        self.assertUsesIndex(qs, 'message_unread_idx')
+
+    def test_inbox_page(self):
+        received, sent = [qs.order_by('-created_at', '-id')[:21] for qs in direct_streams(self.user)]
+        self.assertNotIn('TEMP B-TREE', self.assertUsesIndex(received, 'message_recipient_created_idx'))
+        self.assertNotIn('TEMP B-TREE', self.assertUsesIndex(sent, 'message_sender_created_idx'))
+
+
+class StubTelegramHandler(BaseHTTPRequestHandler):
+    # پاسخ بر اساس chat_id: 429 = محدودیت نرخ، 500 = خطای موقت، 400 = چت نامعتبر
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.received.append(payload)
+        code = {'429': 429, '500': 500, '400': 400}.get(payload['chat_id'], 200)
+        body = {'ok': code == 200, 'description': 'stub'}
+        if code == 429:
+            body['parameters'] = {'retry_after': 7}
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class NotificationOutboxTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubTelegramHandler)
+        cls.server.received = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.received.clear()
+        self.worker = OutboxWorker(api_base=f"http://127.0.0.1:{self.server.server_port}", token='test',
+                                   max_attempts=2)
+
+    def make_user(self, chat_id):
+        return User.objects.create_user(f"user_{chat_id}", password='x', telegram_chat_id=chat_id)
+
+    def test_results_and_retries(self):
+        users = [self.make_user(chat_id) for chat_id in ('100', '429', '500', '400')]
+        notify_users([(u.id, 'hello') for u in users] + [(users[0].id, 'second')])
+        self.assertEqual(Notification.objects.count(), 5)
+
+        # هر چت در یک دسته حداکثر یک پیام
+        sent, failed = self.worker.run_once()
+        self.assertEqual((sent, failed), (1, 3))
+        self.assertEqual(len(self.server.received), 4)
+
+        by_chat = {n.chat_id: n for n in Notification.objects.filter(attempts__gt=0)}
+        self.assertEqual(by_chat['400'].status, 'FAILED')
+        self.assertEqual(by_chat['500'].status, 'PENDING')
+        self.assertEqual(by_chat['429'].status, 'PENDING')
+        self.assertGreater(by_chat['429'].next_attempt_at, by_chat['429'].created_at)
+
+        # پیام دوم چت 100 به دلیل محدودیت نرخ هنوز ارسال نشده
+        self.assertEqual(self.worker.run_once(), (0, 0))
+        self.worker.chat_available_at.clear()
+        Notification.objects.filter(status='PENDING').update(next_attempt_at=by_chat['400'].created_at)
+        sent, failed = self.worker.run_once()
+        self.assertEqual((sent, failed), (1, 2))
+        self.assertEqual(Notification.objects.get(chat_id='500').status, 'FAILED')
+        self.assertEqual(Notification.objects.filter(status='SENT').count(), 2)
+
+    def test_broadcast_fan_out(self):
+        for chat_id in ('101', '102'):
+            self.make_user(chat_id)
+        User.objects.create_user('no_chat', password='x')
+        admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        notify_broadcast(Broadcast.objects.create(sender=admin, subject='s', body='b'))
+
+        self.assertEqual(self.worker.run_once(), (2, 0))
+        self.assertEqual(sorted(p['chat_id'] for p in self.server.received), ['101', '102'])
+
+
+class AsyncViewParityTests(TestCase):
+    def setUp(self):
+        from gamification.models import Transaction
+        from operations.models import Mission
+
+        self.user = User.objects.create_user('employee', password='x', first_name='Ali', current_balance=40)
+        for i in range(3):
+            User.objects.create_user(f"peer{i}", password='x', total_points=100 * i)
+        Transaction.objects.create(user=self.user, amount=70, token_type='PERFORMANCE')
+        Mission.objects.create(title='m', reward_ac=10)
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def test_same_payload_as_sync_views(self):
+        pairs = [
+            ('/api/users/me/', '/api/async/users/me/'),
+            ('/api/users/dashboard_stats/', '/api/async/users/dashboard_stats/'),
+            ('/api/users/leaderboard/?page_size=2', '/api/async/users/leaderboard/?page_size=2'),
+            ('/api/wallet/summary/', '/api/async/wallet/summary/'),
+            ('/api/missions/', '/api/async/missions/'),
+        ]
+        for sync_path, async_path in pairs:
+            with self.subTest(path=async_path):
+                # مسیر async اول و با کش سرد اجرا می‌شود تا کوئری‌های ORM کش‌نشده را هم ببیند
+                cache.clear()
+                response = async_to_sync(self.async_client.get)(async_path, headers=self.headers)
+                expected = self.client.get(sync_path, headers=self.headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), expected.json())
+
+    def test_dashboard_with_cold_level_cache(self):
+        # کش سرد منحنی لول‌ها یعنی کوئری ORM که نباید مستقیم از کد async اجرا شود
+        cache.clear()
+        response = async_to_sync(self.async_client.get)('/api/async/users/dashboard_stats/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['xp_to_next_level'], 500)
+
+    def test_requires_token(self):
+        response = async_to_sync(self.async_client.get)('/api/async/users/me/')
+        self.assertEqual(response.status_code, 401)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_user('employee', password='x')
+        self.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        self.admin_headers = {'Authorization': f"Bearer {AccessToken.for_user(self.admin)}"}
+
+    def scrape(self):
+        response = self.client.get('/api/metrics?format=prometheus', headers=self.admin_headers)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode().splitlines()
+
+    def test_prometheus_output_after_requests(self):
+        self.client.get('/api/users/me/', headers=self.headers)
+        self.client.get('/api/users/me/')
+        async_to_sync(self.async_client.get)('/api/async/users/me/', headers=self.headers)
+        lines = self.scrape()
+
+        self.assertIn('http_requests_total{method="GET",route="users-me",status="2xx"} 1', lines)
+        self.assertIn('http_requests_total{method="GET",route="users-me",status="4xx"} 1', lines)
+        self.assertIn('http_requests_total{method="GET",route="async-me",status="2xx"} 1', lines)
+        # هیستوگرام‌ها تجمعی هستند و سطر +Inf برابر تعداد درخواست‌هاست
+        labels = 'method="GET",route="users-me"'
+        self.assertIn(f'http_request_duration_ms_bucket{{{labels},le="+Inf"}} 2', lines)
+        self.assertIn(f'http_request_sql_queries_count{{{labels}}} 2', lines)
+        # درخواست بدون توکن کوئری ندارد و درخواست معتبر فقط کاربر توکن را می‌خواند
+        self.assertIn(f'http_request_sql_queries_sum{{{labels}}} 1', lines)
+        self.assertIn(f'http_request_sql_queries_bucket{{{labels},le="0"}} 1', lines)
+        buckets = [int(line.rsplit(' ', 1)[1]) for line in lines
+                   if line.startswith(f'http_response_size_bytes_bucket{{{labels},')]
+        self.assertEqual(buckets, sorted(buckets))
+        # مسیر async هم کوئری‌های نخ sync همان درخواست را می‌شمارد
+        self.assertIn('http_request_sql_queries_sum{method="GET",route="async-me"} 1', lines)
+
+    def test_label_values_are_escaped(self):
+        registry.record('GET', 'a\\b"c\nd', 200, 1.0, 0, 0.0, 10)
+        lines = self.scrape()
+        self.assertIn('http_requests_total{method="GET",route="a\\\\b\\"c\\nd",status="2xx"} 1', lines)
+        self.assertIn('http_request_sql_queries_count{method="GET",route="a\\\\b\\"c\\nd"} 1', lines)
+
+    def test_json_and_admin_only(self):
+        self.client.get('/api/users/me/', headers=self.headers)
+        self.assertEqual(self.client.get('/api/metrics', headers=self.headers).status_code, 403)
+        data = self.client.get('/api/metrics', headers=self.admin_headers).json()
+        route = next(r for r in data['routes'] if r['route'] == 'users-me')
+        self.assertEqual((route['statuses'], route['duration_ms']['count']), ({'2xx': 1}, 1))
+        self.assertIn('response_cache', data)
+
+
+class AvatarPipelineTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media, AVATAR_THUMBNAILS_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def png(self, color='red'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), color).save(buffer, 'PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+    def upload(self, user, upload):
+        headers = {'Authorization': f"Bearer {AccessToken.for_user(user)}"}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch('/api/users/update_avatar/', encode_multipart(BOUNDARY, {'avatar': upload}),
+                                         content_type=MULTIPART_CONTENT, headers=headers)
+        user.refresh_from_db()
+        return response
+
+    def test_variants_and_dedupe(self):
+        first = User.objects.create_user('first', password='x')
+        second = User.objects.create_user('second', password='x')
+
+        self.assertEqual(self.upload(first, self.png()).status_code, 200)
+        self.assertTrue(first.avatar_thumbs_ready)
+        sm_jpeg = default_storage.path(first.avatar.name.replace('avatars/', 'avatars/thumbs/').replace(
+            '.png', '_96.jpeg'))
+        with Image.open(sm_jpeg) as thumb:
+            self.assertEqual(thumb.size, (96, 96))
+
+        # همان محتوا برای کاربر دیگر: فایل مشترک و نسخه‌های کوچک از قبل آماده
+        response = self.upload(second, self.png())
+        self.assertEqual(second.avatar.name, first.avatar.name)
+        self.assertTrue(response.json()['avatar_thumbs']['sm']['webp'].endswith('_96.webp'))
+
+        payload = self.client.get('/api/users/leaderboard/',
+                                  headers={'Authorization': f"Bearer {AccessToken.for_user(first)}"}).json()
+        self.assertTrue(all(row['avatar_url'].endswith('_96.jpeg') for row in payload['rankings']))
+
+    def test_rejects_non_images(self):
+        user = User.objects.create_user('user', password='x')
+        response = self.upload(user, SimpleUploadedFile('x.png', b'not an image'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(user.avatar)
+
+
+class LevelCurveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('employee', password='x', total_points=400)
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def test_level_follows_points_in_the_same_update(self):
+        self.assertEqual(self.user.level, 1)
+        with self.assertNumQueries(1):
+            User.objects.apply_increments({self.user.id: (0, 650)})
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.total_points, self.user.level), (1050, 3))
+
+        stats = self.client.get('/api/users/dashboard_stats/', headers=self.headers).json()
+        self.assertEqual((stats['level'], stats['level_progress'], stats['xp_to_next_level']), (3, 10.0, 450))
+
+    def test_relevel_after_curve_change(self):
+        LevelThreshold.objects.all().delete()
+        LevelThreshold.objects.bulk_create([LevelThreshold(level=1, min_points=0),
+                                            LevelThreshold(level=2, min_points=100),
+                                            LevelThreshold(level=3, min_points=300)])
+        call_command('relevel_users', stdout=io.StringIO())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.level, 3)
+        # آخرین لول: پیشرفت کامل
+        stats = self.client.get('/api/users/dashboard_stats/', headers=self.headers).json()
+        self.assertEqual((stats['level_progress'], stats['xp_to_next_level']), (100, 0))
+
+
+class RankIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='x', role='ADMIN', total_points=1000)
+        self.users = [User.objects.create_user(name, password='x', total_points=points)
+                      for name, points in [('a', 50), ('b', 80), ('c', 50), ('d', 10), ('e', 50)]]
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.users[0])}"}
+
+    def get(self, path, user=None):
+        headers = {'Authorization': f"Bearer {AccessToken.for_user(user)}"} if user else self.headers
+        return self.client.get(path, headers=headers).json()
+
+    def test_ties_share_a_rank(self):
+        self.assertEqual([rank_index.rank_of(p) for p in (80, 50, 10, 0)], [1, 2, 5, 6])
+        # مدیر در رتبه‌بندی نیست
+        self.assertEqual(rank_index.total(), 5)
+        data = self.get('/api/users/leaderboard/')
+        self.assertEqual([(r['id'], r['rank']) for r in data['rankings']],
+                         [(u.id, rank) for u, rank in zip([self.users[i] for i in (1, 0, 2, 4, 3)], [1, 2, 2, 2, 5])])
+
+    def test_cursor_pages_cover_everyone_once(self):
+        self.assertEqual(decode_cursor(encode_cursor(50, 7)), (50, 7))
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        self.assertEqual(self.client.get('/api/users/leaderboard/?cursor=@@', headers=self.headers).status_code, 400)
+
+        seen, cursor = [], ''
+        while cursor is not None:
+            data = self.get(f"/api/users/leaderboard/?page_size=2&cursor={cursor}")
+            seen += [r['id'] for r in data['rankings']]
+            cursor = data['next_cursor']
+        # ترتیب داخل امتیازهای برابر با شناسه تعیین می‌شود
+        self.assertEqual(seen, [self.users[i].id for i in (1, 0, 2, 4, 3)])
+
+    def test_invalidated_by_point_changes_and_built_lazily(self):
+        self.assertEqual(rank_index.rank_of(10), 5)
+        # تا نسخه عوض نشده از حافظه خوانده می‌شود
+        with self.assertNumQueries(0):
+            rank_index.rank_of(10)
+        User.objects.apply_increments({self.users[3].id: (0, 100)})
+        with self.assertNumQueries(1):
+            self.assertEqual(rank_index.rank_of(110), 1)
+            self.assertEqual(rank_index.rank_of(80), 2)
+
+        # پاک شدن کش نسخه ایندکس قدیمی را معتبر نمی‌کند
+        User.objects.filter(pk=self.users[1].pk).update(total_points=500)
+        cache.clear()
+        self.assertEqual(rank_index.rank_of(110), 2)
+
+    def test_around_me(self):
+        me = self.users[0]
+        data = self.get('/api/users/leaderboard/around-me/?n=1', me)
+        self.assertEqual([r['id'] for r in data['rankings']], [self.users[1].id, me.id, self.users[2].id])
+        # کاربری که در رتبه‌بندی نیست بین کارمندان قرار داده نمی‌شود
+        self.assertEqual(self.get('/api/users/leaderboard/around-me/', self.admin)['rankings'], [])
+
+
+class InboxPageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('employee', password='x')
+        self.other = User.objects.create_user('other', password='x')
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        # همگانی‌ها فقط از زمان عضویت کاربر دیده می‌شوند
+        User.objects.filter(pk=self.user.pk).update(date_joined=self.user.date_joined - timedelta(days=1))
+        self.user.refresh_from_db()
+
+    def pages(self, page_size=2):
+        items, cursor = [], ''
+        while cursor is not None:
+            data = self.client.get(f'/api/messages/?page_size={page_size}&cursor={cursor}', headers=self.headers).json()
+            items += [(row['kind'], row['id']) for row in data['results']]
+            cursor = data['next_cursor']
+        return items
+
+    def test_received_and_sent_streams_merge(self):
+        received = Message.objects.create(sender=self.other, recipient=self.user, subject='s', body='b')
+        sent = Message.objects.create(sender=self.user, recipient=self.other, subject='s', body='b')
+        to_self = Message.objects.create(sender=self.user, recipient=self.user, subject='s', body='b')
+        Message.objects.create(sender=self.other, recipient=self.other, subject='s', body='b')
+        # پیام‌های هم‌زمان از دو جریان با id از هم جدا می‌شوند
+        Message.objects.filter(pk__in=[received.pk, sent.pk]).update(created_at=to_self.created_at)
+
+        expected = [('direct', pk) for pk in (to_self.pk, sent.pk, received.pk)]
+        self.assertEqual(self.pages(), expected)
+        self.assertEqual(self.pages(page_size=1), expected)
+        self.assertEqual(self.client.get('/api/messages/?cursor=@@', headers=self.headers).status_code, 400)
+
+    def test_broadcasts_merge_with_read_state(self):
+        direct = Message.objects.create(sender=self.other, recipient=self.user, subject='s', body='b')
+        before = Broadcast.objects.create(sender=self.other, subject='s', body='b')
+        tied = Broadcast.objects.create(sender=self.other, subject='s', body='b')
+        hidden = Broadcast.objects.create(sender=self.other, audience='ADMIN', subject='s', body='b')
+        Broadcast.objects.filter(pk=before.pk).update(created_at=direct.created_at - timedelta(seconds=1))
+        # در زمان یکسان همگانی قبل از پیام مستقیم می‌آید (رتبه نوع در کلید کرسر)
+        Broadcast.objects.filter(pk__in=[tied.pk, hidden.pk]).update(created_at=direct.created_at)
+        mark_broadcast_read(self.user, tied)
+
+        expected = [('direct', direct.pk), ('broadcast', tied.pk), ('broadcast', before.pk)]
+        self.assertEqual(self.pages(), expected)
+        self.assertEqual(self.pages(page_size=1), expected)
+        rows = self.client.get('/api/messages/', headers=self.headers).json()['results']
+        self.assertEqual([row['is_read'] for row in rows], [False, True, False])
+
+        self.assertEqual(self.client.post(f'/api/messages/broadcasts/{hidden.pk}/read/',
+                                          headers=self.headers).status_code, 404)
+        self.assertEqual(self.client.post(f'/api/messages/broadcasts/{before.pk}/read/',
+                                          headers=self.headers).status_code, 200)
+        self.assertEqual(unread_counts(self.user), {'unread': 1, 'direct': 1, 'broadcasts': 0})
+        self.assertEqual(mark_all_read(self.user), 1)
+        self.assertEqual(mark_all_read(self.user), 0)
+        self.assertEqual(unread_counts(self.user)['unread'], 0)
+
+    def test_broadcast_requires_subject_and_text(self):
+        admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        headers = {'Authorization': f"Bearer {AccessToken.for_user(admin)}"}
+        for data in ({'subject': 's'}, {'text': 't'}, {'subject': ' ', 'text': 't'}, {'subject': 's' * 256, 'text': 't'}):
+            self.assertEqual(self.client.post('/api/messages/broadcast/', data, headers=headers).status_code, 400)
+        self.assertEqual(self.client.post('/api/messages/broadcast/', {'subject': 's', 'text': 't'},
+                                          headers=self.headers).status_code, 403)
+        self.assertEqual(self.client.post('/api/messages/broadcast/', {'subject': 's', 'text': 't'},
+                                          headers=headers).status_code, 200)
+        self.assertEqual(Broadcast.objects.count(), 1)
+
+
+class MessageCounterTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        self.user = User.objects.create_user('employee', password='x')
+        self.other = User.objects.create_user('other', password='x')
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def send(self, recipient, **kwargs):
+        return Message.objects.create(sender=self.admin, recipient=recipient, subject='s', body='b', **kwargs)
+
+    def counts(self, user=None):
+        return unread_counts(user or self.user)
+
+    def test_create_read_and_delete(self):
+        first, second = self.send(self.user), self.send(self.user)
+        self.send(self.user, is_read=True)
+        Message.objects.bulk_create([Message(sender=self.admin, recipient=r, subject='s', body='b')
+                                     for r in (self.user, self.other)])
+        self.assertEqual(self.counts()['direct'], 3)
+        self.assertEqual(self.counts(self.other)['direct'], 1)
+
+        self.assertEqual(Message.objects.mark_read(self.user, ids=[first.id, first.id]), 1)
+        self.assertEqual(Message.objects.mark_read(self.user, ids=[first.id]), 0)
+        self.assertEqual(self.counts()['direct'], 2)
+
+        # حذف پیام خوانده‌شده شمارنده را تغییر نمی‌دهد
+        Message.objects.get(pk=first.pk).delete()
+        second.delete()
+        self.assertEqual(self.counts()['direct'], 1)
+
+    def test_save_transitions(self):
+        message = self.send(self.user)
+        message.is_read = True
+        message.save()
+        self.assertEqual(self.counts()['direct'], 0)
+        # ذخیره دوباره بدون تغییر وضعیت
+        message.save()
+        self.assertEqual(self.counts()['direct'], 0)
+
+        message = Message.objects.get(pk=message.pk)
+        message.is_read = False
+        message.recipient = self.other
+        message.save()
+        self.assertEqual((self.counts()['direct'], self.counts(self.other)['direct']), (0, 1))
+        # فقط فیلدهای update_fields در دیتابیس تغییر می‌کنند
+        message.is_read = True
+        message.save(update_fields=['subject'])
+        self.assertEqual(self.counts(self.other)['direct'], 1)
+
+    def test_broadcast_receipts(self):
+        client_headers = {'Authorization': f"Bearer {AccessToken.for_user(self.admin)}"}
+        self.client.post('/api/messages/broadcast/', {'subject': 's', 'text': 't'}, headers=client_headers)
+        self.client.post('/api/messages/broadcast/', {'subject': 's2', 'text': 't'}, headers=client_headers)
+        first, second = Broadcast.objects.order_by('id')
+        self.assertEqual(self.counts()['broadcasts'], 2)
+
+        mark_broadcast_read(self.user, first)
+        mark_broadcast_read(self.user, first)
+        self.assertEqual(self.counts(), {'unread': 1, 'direct': 0, 'broadcasts': 1})
+        self.send(self.user)
+        data = self.client.post('/api/messages/mark-all-read/', headers=self.headers).json()
+        self.assertEqual((data['marked'], data['unread']), (2, 0))
+        self.assertEqual(BroadcastReceipt.objects.filter(user=self.user).count(), 2)
+
+        # رسید همگانی ارسالی خود فرستنده شمرده نمی‌شود
+        mark_broadcast_read(self.admin, first)
+        self.assertEqual(MessageCounter.objects.filter(user=self.admin).values_list('broadcasts_read', flat=True)
+                         .first() or 0, 0)
+        BroadcastReceipt.objects.get(user=self.user, broadcast=second).delete()
+        self.assertEqual(self.counts()['broadcasts'], 1)
+        self.assertEqual(self.counts(self.other)['broadcasts'], 2)
+
+    def test_rebuild_after_bypassing_updates(self):
+        self.send(self.user)
+        self.send(self.other)
+        mark_broadcast_read(self.user, Broadcast.objects.create(sender=self.admin, subject='s', body='b'))
+        call_command('rebuild_message_counters', check=True, stdout=io.StringIO())
+
+        Message.objects.filter(recipient=self.user).update(is_read=True)
+        MessageCounter.objects.filter(user=self.other).update(broadcasts_read=5)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_message_counters', check=True, stdout=io.StringIO())
+        call_command('rebuild_message_counters', stdout=io.StringIO())
+        self.assertEqual((self.counts()['direct'], self.counts()['broadcasts']), (0, 0))
+        self.assertEqual(self.counts(self.other), {'unread': 2, 'direct': 1, 'broadcasts': 1})
@@ -1,18 +1,69 @@
+from django.db import transaction
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework_simplejwt.views import TokenObtainPairView
-from django.db.models import Sum, Q
 
-from .models import User, Message
+from .models import User, Message, Broadcast
+from ansup_gamification.pagination import KeysetPagination
+from ansup_gamification.conditional import conditional, make_etag
+from .ranking import rank_index, decode_cursor, leaderboard_page, leaderboard_window
+from . import inbox, avatars, levels
+from .notifications import notify_broadcast
 from .serializers import (
     CustomTokenObtainPairSerializer,
     UserProfileSerializer,
     MessageSerializer,
+    BroadcastSerializer,
     UserCreateUpdateSerializer  # <--- حتما این را اضافه کن
 )
 
 
+# --- توابع مشترک بین ویوهای DRF و ویوهای async (users/async_views.py) ---
+
+def dashboard_payload(user, rank, total_employees, stats, progress):
+    # progress خروجی levels.progress است و بیرون محاسبه می‌شود (در مسیر async داخل sync_to_async)
+    current_xp, xp_needed = progress
+    return {
+        'full_name': f"{user.first_name} {user.last_name}" if user.first_name else user.username,
+        'level': user.level,
+        # در آخرین لول پیشرفت کامل است
+        'level_progress': (current_xp / xp_needed) * 100 if xp_needed else 100,
+        'xp_to_next_level': xp_needed - current_xp if xp_needed else 0,
+        'rank': rank,
+        'total_employees': total_employees,
+        'tokens': stats,
+        'avatar_url': avatars.avatar_url(user, 'md')
+    }
+
+
+def leaderboard_row(u, rank):
+    return {
+        'id': u.id,
+        'rank': rank,
+        'full_name': f"{u.first_name} {u.last_name}" if u.first_name else u.username,
+        'avatar_url': avatars.avatar_url(u),
+        'total_tokens': u.total_points,
+        'trend': 'up' if rank <= 3 else 'steady'
+    }
+
+
+def leaderboard_queryset():
+    return User.objects.filter(role='EMPLOYEE').only(
+        'id', 'first_name', 'last_name', 'username', 'avatar', 'avatar_hash', 'avatar_thumbs_ready',
+        'total_points', 'role'
+    )
+
+
+def limit_param(params, name, default, maximum):
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        value = default
+    return max(1, min(value, maximum))
+
+
 # --- ۱. ویوی لاگین سفارشی ---
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
@@ -33,6 +84,7 @@ class UserViewSet(viewsets.ModelViewSet):
 
     # دریافت اطلاعات کاربر جاری (Profile.jsx)
     @action(detail=False, methods=['get'])
+    @conditional(lambda view, request: make_etag('me', request.user.pk, request.user.updated_at))
     def me(self, request):
         return Response(self.get_serializer(request.user).data)
 
@@ -40,45 +92,48 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def dashboard_stats(self, request):
         user = request.user
-        from gamification.models import Transaction
+        from gamification.models import UserTokenTotal
 
-        rank = User.objects.filter(total_points__gt=user.total_points, role='EMPLOYEE').count() + 1
-        total_emp = User.objects.filter(role='EMPLOYEE').count()
+        rank = rank_index.rank_of(user.total_points)
+        total_emp = rank_index.total()
+        stats = UserTokenTotal.objects.summary_for(user)
+        return Response(dashboard_payload(user, rank, total_emp, stats, levels.progress(user.total_points)))
 
-        stats = {}
-        for t_type, key in [('PERFORMANCE', 'performance'), ('DISCIPLINE', 'discipline'),
-                            ('CULTURAL', 'cultural'), ('IDEA', 'trend')]:
-            val = Transaction.objects.filter(user=user, token_type=t_type).aggregate(Sum('amount'))['amount__sum'] or 0
-            stats[key] = val
+    # لیدربرد (Leaderboard.jsx) - صفحه‌بندی با کرسر
+    @action(detail=False, methods=['get'])
+    def leaderboard(self, request):
+        cursor = None
+        if request.query_params.get('cursor'):
+            cursor = decode_cursor(request.query_params['cursor'])
+            if cursor is None:
+                return Response({'error': 'کرسر نامعتبر است'}, status=400)
+        page_size = self._limit_param(request, 'page_size', default=20, maximum=100)
 
-        xp_needed = 500
-        current_xp = user.total_points % xp_needed
+        users, next_cursor = leaderboard_page(self._leaderboard_queryset(), cursor, page_size)
+        return Response({
+            'current_user_id': request.user.id,
+            'rankings': [self._leaderboard_row(u) for u in users],
+            'next_cursor': next_cursor
+        })
 
+    # پنجره‌ای از لیدربرد اطراف کاربر جاری
+    @action(detail=False, methods=['get'], url_path='leaderboard/around-me')
+    def leaderboard_around_me(self, request):
+        size = self._limit_param(request, 'n', default=5, maximum=50)
+        users = leaderboard_window(self._leaderboard_queryset(), request.user, size)
         return Response({
-            'full_name': f"{user.first_name} {user.last_name}" if user.first_name else user.username,
-            'level': user.level,
-            'level_progress': (current_xp / xp_needed) * 100 if xp_needed > 0 else 0,
-            'xp_to_next_level': xp_needed - current_xp,
-            'rank': rank,
-            'total_employees': total_emp,
-            'tokens': stats,
-            'avatar_url': user.avatar.url if user.avatar else None
+            'current_user_id': request.user.id,
+            'rankings': [self._leaderboard_row(u) for u in users]
         })
 
-    # لیدربرد (Leaderboard.jsx)
-    @action(detail=False, methods=['get'])
-    def leaderboard(self, request):
-        users = User.objects.filter(role='EMPLOYEE').order_by('-total_points')
-        rankings = []
-        for idx, u in enumerate(users):
-            rankings.append({
-                'id': u.id,
-                'full_name': f"{u.first_name} {u.last_name}" if u.first_name else u.username,
-                'avatar_url': u.avatar.url if u.avatar else None,
-                'total_tokens': u.total_points,
-                'trend': 'up' if idx < 3 else 'steady'
-            })
-        return Response({'current_user_id': request.user.id, 'rankings': rankings})
+    def _leaderboard_queryset(self):
+        return leaderboard_queryset()
+
+    def _leaderboard_row(self, u):
+        return leaderboard_row(u, rank_index.rank_of(u.total_points))
+
+    def _limit_param(self, request, name, default, maximum):
+        return limit_param(request.query_params, name, default, maximum)
 
     # لیست ساده برای دراپ‌داون‌های ادمین (Messages.jsx)
     @action(detail=False, methods=['get'], url_path='simple-list')
@@ -93,16 +148,20 @@ class UserViewSet(viewsets.ModelViewSet):
     def top_performers(self, request):
         users = User.objects.filter(role='EMPLOYEE').order_by('-total_points')[:5]
         data = [{'name': u.username, 'role': 'پرسنل', 'tokens': u.total_points, 'level': f"Lvl {u.level}",
-                 'avatar': u.avatar.url if u.avatar else None} for u in users]
+                 'avatar': avatars.avatar_url(u)} for u in users]
         return Response(data)
 
     # آپدیت عکس پروفایل
     @action(detail=False, methods=['patch'], url_path='update_avatar')
     def update_avatar(self, request):
         if 'avatar' in request.FILES:
-            request.user.avatar = request.FILES['avatar']
-            request.user.save()
-            return Response({'avatar_url': request.user.avatar.url})
+            try:
+                with transaction.atomic():
+                    avatars.set_avatar(request.user, request.FILES['avatar'])
+            except avatars.AvatarError as e:
+                return Response({'error': str(e)}, status=400)
+            return Response({'avatar_url': request.user.avatar.url,
+                             'avatar_thumbs': avatars.avatar_variants(request.user)})
         return Response({'error': 'No file'}, status=400)
 
     # آپدیت اطلاعات متنی پروفایل
@@ -139,22 +198,79 @@ class UserViewSet(viewsets.ModelViewSet):
 class MessageViewSet(viewsets.ModelViewSet):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return Message.objects.filter(Q(recipient=self.request.user) | Q(sender=self.request.user)).order_by('-created_at')
+        return inbox.direct_messages(self.request.user).select_related('sender').order_by('-created_at')
+
+    # صندوق پیام: ادغام پیام‌های مستقیم و همگانی با صفحه‌بندی کرسر
+    def list(self, request, *args, **kwargs):
+        cursor = None
+        if request.query_params.get('cursor'):
+            try:
+                cursor = inbox.decode_cursor(request.query_params['cursor'])
+            except inbox.InvalidCursor:
+                return Response({'error': 'کرسر نامعتبر است'}, status=400)
+        page_size = self.paginator.get_page_size(request)
+
+        items, next_cursor = inbox.inbox_page(request.user, cursor, page_size)
+        context = self.get_serializer_context()
+        results = []
+        for kind, obj in items:
+            if kind == 'direct':
+                data = MessageSerializer(obj, context=context).data
+            else:
+                data = BroadcastSerializer(obj, context=context).data
+                data['recipient'] = None
+            results.append({'kind': kind, **data})
+
+        next_link = None
+        if next_cursor:
+            next_link = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+        return Response({'next': next_link, 'next_cursor': next_cursor, 'results': results})
 
     def perform_create(self, serializer):
         serializer.save(sender=self.request.user)
 
+    # پیام همگانی: یک ردیف برای همه کارمندان (بدون کپی برای هر گیرنده)
     @action(detail=False, methods=['post'])
     def broadcast(self, request):
         if request.user.role != 'ADMIN':
             return Response({'error': 'Admin only'}, status=403)
 
-        subject = request.data.get('subject')
-        body = request.data.get('text')
-        recipients = User.objects.filter(role='EMPLOYEE')
+        subject, text = request.data.get('subject'), request.data.get('text')
+        if not isinstance(subject, str) or not isinstance(text, str) or not subject.strip() or not text.strip():
+            return Response({'error': 'موضوع و متن پیام الزامی است'}, status=400)
+        if len(subject) > Broadcast._meta.get_field('subject').max_length:
+            return Response({'error': 'موضوع پیام بیش از حد طولانی است'}, status=400)
+
+        with transaction.atomic():
+            broadcast = Broadcast.objects.create(sender=request.user, audience='EMPLOYEE', subject=subject, body=text)
+            notify_broadcast(broadcast)
+        return Response({'message': 'Sent'})
+
+    # ثبت رسید خواندن پیام همگانی (در اولین خواندن ساخته می‌شود)
+    @action(detail=False, methods=['post'], url_path=r'broadcasts/(?P<broadcast_id>\d+)/read')
+    def read_broadcast(self, request, broadcast_id=None):
+        broadcast = inbox.visible_broadcasts(request.user).filter(pk=broadcast_id).first()
+        if broadcast is None:
+            return Response({'error': 'پیام یافت نشد'}, status=404)
+        inbox.mark_broadcast_read(request.user, broadcast)
+        return Response({'message': 'خوانده شد'})
+
+    # خوانده‌شدن یک پیام مستقیم
+    @action(detail=True, methods=['post'])
+    def read(self, request, pk=None):
+        message = self.get_object()
+        Message.objects.mark_read(request.user, ids=[message.id])
+        return Response({'message': 'خوانده شد'})
+
+    # تعداد پیام‌های خوانده‌نشده (برای پولینگ فرانت)
+    @action(detail=False, methods=['get'], url_path='unread-count')
+    def unread_count(self, request):
+        return Response(inbox.unread_counts(request.user))
 
-        msgs = [Message(sender=request.user, recipient=u, subject=subject, body=body) for u in recipients]
-        Message.objects.bulk_create(msgs)
-        return Response({'message': 'Sent'})
\ No newline at end of file
+    # خوانده‌شدن همه پیام‌ها
+    @action(detail=False, methods=['post'], url_path='mark-all-read')
+    def mark_all_read(self, request):
+        return Response({'marked': inbox.mark_all_read(request.user), **inbox.unread_counts(request.user)})